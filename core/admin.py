@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from . import thumbnails
 from .models import (
     UserProfile, Event, EventVote, EventChecklistItem, EventItinerary,
     Photo, PhotoLike, Album, SubAlbum, MapLocation, WeatherAlert, CalendarEntry, RecurringEvent,
-    ChatMessage, Tip, Debt, UndercoverWordPair, UndercoverGame, Notification
+    ChatMessage, Tip, Debt, UndercoverWordPair, UndercoverGame, Notification,
+    NotificationMessage, NotificationDelivery
 )
 
 
@@ -56,6 +58,13 @@ class AlbumAdmin(admin.ModelAdmin):
     list_display = ['name', 'owner', 'event', 'visibility', 'date', 'created_at']
     list_filter = ['visibility', 'event', 'created_at']
     search_fields = ['name', 'description']
+    
+    def save_model(self, request, obj, form, change):
+        if 'intro_photo' in form.changed_data:
+            obj.intro_derivatives = {}
+        super().save_model(request, obj, form, change)
+        if 'intro_photo' in form.changed_data:
+            thumbnails.schedule(obj, 'intro_photo')
 
 
 @admin.register(SubAlbum)
@@ -67,8 +76,17 @@ class SubAlbumAdmin(admin.ModelAdmin):
 
 @admin.register(Photo)
 class PhotoAdmin(admin.ModelAdmin):
-    list_display = ['user', 'album', 'sub_album', 'event', 'uploaded_at']
-    list_filter = ['album', 'event', 'uploaded_at']
+    list_display = ['user', 'album', 'sub_album', 'event', 'like_count', 'taken_at', 'uploaded_at']
+    list_filter = ['album', 'event', 'camera_model', 'uploaded_at']
+    readonly_fields = ['width', 'height', 'orientation', 'camera_make', 'camera_model']
+    
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.derivatives = {}
+            obj.exif_extracted = False
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            thumbnails.schedule(obj)
 
 
 @admin.register(PhotoLike)
@@ -134,6 +152,19 @@ class UndercoverGameAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ['user', 'notification_type', 'title', 'read', 'created_at']
-    list_filter = ['notification_type', 'read', 'created_at']
+    list_display = ['user', 'notification_type', 'title', 'read', 'email_status', 'sms_status', 'whatsapp_status', 'created_at']
+    list_filter = ['notification_type', 'read', 'email_status', 'sms_status', 'whatsapp_status', 'created_at']
 
+
+
+@admin.register(NotificationMessage)
+class NotificationMessageAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'notification_type', 'event', 'reason', 'created_at']
+    list_filter = ['notification_type', 'reason', 'created_at']
+
+
+@admin.register(NotificationDelivery)
+class NotificationDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'channel', 'address', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['channel', 'status']
+    search_fields = ['address', 'last_error']
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
-
+    
+    def ready(self):
+        # Signal receivers keeping album summaries up to date
+        from . import summaries  # noqa: F401
@@ -0,0 +1,118 @@
+"""
+ZIP downloads of albums, streamed
+
+The archive is written by zipfile into a small buffer that is emptied
+after every chunk, and the chunks are handed to StreamingHttpResponse as
+they are produced. Memory use stays at about one chunk no matter how large
+the album is, and nothing is written to disk. Photos are STORED, JPEGs
+would not get any smaller by deflating them.
+"""
+from datetime import datetime
+import os
+import zipfile
+
+from django.utils import timezone
+import logging
+
+from .models import Photo
+from .storage import is_content_addressed
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+# ZIP timestamps can't be earlier than this
+ZIP_EPOCH = datetime(1980, 1, 1)
+
+
+class _StreamBuffer:
+    """Write-only file for zipfile; not seekable, so zipfile writes data descriptors after each file"""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        """Yields what was written since the last call, if anything"""
+        if self.chunks:
+            data = b''.join(self.chunks)
+            self.chunks = []
+            yield data
+
+
+def safe_name(name, fallback='album'):
+    """Album or file name usable as one path component inside the archive"""
+    name = name.replace('/', '-').replace('\\', '-').strip().strip('.')
+    return name or fallback
+
+
+def album_entries(album, sub_album=None):
+    """
+    (name in archive, file path, timestamp) of every photo file of the album
+    and its sub-albums, or of one sub-album, read from the database in chunks.
+    """
+    root = safe_name(album.name)
+    sub_album_names = {}
+    used = set()
+    photos = Photo.objects.filter(sub_album=sub_album) if sub_album else Photo.objects.filter(album=album)
+    photos = (
+        photos.exclude(image__isnull=True).exclude(image='')
+        .order_by('sub_album_id', 'taken_at', 'id')
+        .values_list('image', 'sub_album_id', 'sub_album__name', 'taken_at')
+    )
+    storage = Photo._meta.get_field('image').storage
+    for image, sub_album_id, sub_album_name, taken_at in photos.iterator(chunk_size=500):
+        directory = root
+        if sub_album_id:
+            if sub_album_id not in sub_album_names:
+                candidate = f'{root}/{safe_name(sub_album_name, "sub-album")}'
+                # Two sub-albums may have the same name
+                if candidate in sub_album_names.values():
+                    candidate = f'{candidate} ({sub_album_id})'
+                sub_album_names[sub_album_id] = candidate
+            directory = sub_album_names[sub_album_id]
+        base, ext = os.path.splitext(safe_name(os.path.basename(image), 'photo'))
+        if is_content_addressed(image):
+            # A content hash means nothing to people, name the photo by when it was taken
+            base = timezone.localtime(taken_at).strftime('%Y-%m-%d %H-%M-%S')
+        name = f'{directory}/{base}{ext}'
+        counter = 1
+        while name in used:
+            counter += 1
+            name = f'{directory}/{base} ({counter}){ext}'
+        used.add(name)
+        yield name, storage.path(image), taken_at
+
+
+def stream_zip(entries):
+    """
+    Generate a ZIP archive of (name, path, timestamp) entries chunk by chunk.
+    Missing files are skipped.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, path, timestamp in entries:
+            try:
+                source = open(path, 'rb')
+            except OSError as e:
+                logger.warning(f'Skipping {path} in ZIP download: {e}')
+                continue
+            with source:
+                size = os.fstat(source.fileno()).st_size
+                local_time = timezone.localtime(timestamp).replace(tzinfo=None) if timestamp else ZIP_EPOCH
+                info = zipfile.ZipInfo(name, date_time=max(local_time, ZIP_EPOCH).timetuple()[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                info.file_size = size
+                with archive.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as target:
+                    while chunk := source.read(CHUNK_SIZE):
+                        target.write(chunk)
+                        yield from buffer.drain()
+            yield from buffer.drain()
+    # Central directory
+    yield from buffer.drain()
@@ -0,0 +1,9 @@
+from .unread import unread_count
+
+
+def unread_notifications(request):
+    """Unread notification count for the badge in base.html"""
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated:
+        return {}
+    return {'unread_notifications_count': unread_count(user.id)}
@@ -0,0 +1,209 @@
+"""
+Near-duplicate photos by perceptual hash
+
+Every photo gets a 64-bit dHash (imaging.perceptual_hash) after upload. Two
+photos whose hashes differ in at most PHOTO_DUPLICATE_DISTANCE bits look
+the same, even if resized or recompressed.
+
+Lookup uses multi-index hashing: the hash is split into four 16-bit bands
+stored in indexed columns. If two hashes differ in at most d bits, at least
+one band differs in at most d // 4 bits (pigeonhole), so searching every
+band for values within that radius finds all candidates through the
+indexes; the exact distance is then checked in Python.
+
+A photo uploaded into an album that duplicates an earlier one there is
+flagged (duplicate_of). With PHOTO_DUPLICATE_ACTION = 'skip', uploads hash
+files before creating their photos and reject duplicates (check_file), and
+a duplicate that got in anyway, from a concurrent upload, is deleted before
+its thumbnails are rendered. The photo_duplicates command reports clusters
+across the whole archive.
+"""
+from itertools import combinations
+
+from django.conf import settings
+from django.db.models import Q
+import logging
+
+from . import summaries
+from .imaging import perceptual_hash
+from .models import Photo
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+HASH_MASK = (1 << HASH_BITS) - 1
+BAND_FIELDS = [f'dhash_band{band}' for band in range(BANDS)]
+
+
+def max_distance():
+    return getattr(settings, 'PHOTO_DUPLICATE_DISTANCE', 6)
+
+
+def duplicate_action():
+    """'flag' or 'skip'"""
+    return getattr(settings, 'PHOTO_DUPLICATE_ACTION', 'flag')
+
+
+def to_signed(value):
+    """Unsigned 64-bit hash -> value that fits a signed BIGINT column"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def bands(value):
+    value &= HASH_MASK
+    return [(value >> (BAND_BITS * band)) & BAND_MASK for band in range(BANDS)]
+
+
+def distance(a, b):
+    """Hamming distance of two hashes, signed or not"""
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+def hash_fields(value):
+    """imaging.perceptual_hash() result -> Photo field values"""
+    fields = {'dhash': to_signed(value)}
+    fields.update(zip(BAND_FIELDS, bands(value)))
+    return fields
+
+
+def band_neighbours(band, radius):
+    """All band values within Hamming distance radius of band"""
+    values = [band]
+    for flips in range(1, radius + 1):
+        for positions in combinations(range(BAND_BITS), flips):
+            flipped = band
+            for position in positions:
+                flipped ^= 1 << position
+            values.append(flipped)
+    return values
+
+
+def candidates_filter(value, threshold=None):
+    """Q matching at least every photo within threshold bits of value, usually a few more"""
+    radius = (max_distance() if threshold is None else threshold) // BANDS
+    condition = Q()
+    for field, band in zip(BAND_FIELDS, bands(value)):
+        condition |= Q(**{f'{field}__in': band_neighbours(band, radius)})
+    return condition
+
+
+def find_similar(value, album_id, threshold=None, **filters):
+    """
+    The earliest photo of the album within threshold bits of value.
+    
+    Returns:
+        Photo: Or None
+    """
+    threshold = max_distance() if threshold is None else threshold
+    candidates = (
+        Photo.objects.filter(candidates_filter(value, threshold), album_id=album_id, dhash__isnull=False, **filters)
+        .order_by('pk').only('pk', 'dhash', 'duplicate_of')
+    )
+    for candidate in candidates:
+        if distance(candidate.dhash, value) <= threshold:
+            return candidate
+    return None
+
+
+def find_original(photo, threshold=None):
+    """
+    The earliest photo of the same album uploaded before photo that it
+    duplicates. Only earlier ones, so of two concurrent uploads of the same
+    picture the later one is the duplicate, never both.
+    
+    Returns:
+        Photo: Or None
+    """
+    if photo.dhash is None or photo.album_id is None:
+        return None
+    return find_similar(photo.dhash, photo.album_id, threshold, pk__lt=photo.pk)
+
+
+def check_file(path, album_id, accepted):
+    """
+    With PHOTO_DUPLICATE_ACTION = 'skip', whether a staged upload duplicates
+    a photo of the album or a file accepted earlier in the same upload, so it
+    is rejected before its photo is created, instead of being reported as
+    created.
+    
+    Args:
+        accepted: Hashes of the files accepted so far, the file's is added
+            if it is not a duplicate
+    
+    Returns:
+        bool: True if the file is a duplicate
+    """
+    if duplicate_action() != 'skip' or album_id is None:
+        return False
+    value = perceptual_hash(path)
+    threshold = max_distance()
+    if any(distance(value, other) <= threshold for other in accepted) or find_similar(value, album_id):
+        return True
+    accepted.append(value)
+    return False
+
+
+def check_upload(pk):
+    """
+    Flag or delete a freshly hashed photo that duplicates an earlier one.
+    
+    Returns:
+        bool: False if the photo was deleted
+    """
+    photo = Photo.objects.filter(pk=pk).only('pk', 'album', 'image', 'dhash').first()
+    if photo is None:
+        return False
+    original = find_original(photo)
+    if original is None:
+        return True
+    if duplicate_action() == 'skip':
+        logger.info(f'Photo {pk} ({photo.image.name}) duplicates photo {original.pk}, deleted')
+        photo.image.delete(save=False)
+        photo.delete()
+        return False
+    # Point at the first of the cluster, not at another duplicate
+    Photo.objects.filter(pk=pk).update(duplicate_of_id=original.duplicate_of_id or original.pk)
+    # The album's mosaic may show it already
+    summaries.schedule_cover(photo.album_id)
+    return True
+
+
+def clusters(hashes, threshold=None):
+    """
+    Group near-identical photos, in memory with the same band lookup.
+    
+    Args:
+        hashes: (photo id, dhash) pairs
+    
+    Returns:
+        list: Lists of photo ids with 2 or more members, ids and clusters sorted
+    """
+    threshold = max_distance() if threshold is None else threshold
+    radius = threshold // BANDS
+    index = [{} for _ in range(BANDS)]
+    for pk, value in hashes:
+        for band, table in zip(bands(value), index):
+            table.setdefault(band, []).append((pk, value))
+    
+    parent = {pk: pk for pk, _ in hashes}
+    
+    def root(pk):
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+    
+    for pk, value in hashes:
+        for band, table in zip(bands(value), index):
+            for neighbour in band_neighbours(band, radius):
+                for other, other_value in table.get(neighbour, ()):
+                    if other != pk and distance(value, other_value) <= threshold:
+                        parent[root(other)] = root(pk)
+    
+    groups = {}
+    for pk in parent:
+        groups.setdefault(root(pk), []).append(pk)
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
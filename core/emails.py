@@ -1,10 +1,12 @@
-from django.core.mail import send_mail
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.core.mail import get_connection
 from django.urls import reverse
-from django.db import models
-from .models import Event, UserProfile, Notification
-from .sms import send_sms, send_whatsapp, format_phone_number
+from django.db import transaction
+from django.utils import timezone
+from .models import Notification, NotificationMessage, NotificationDelivery
+from .recipients import resolve_recipients
+from . import unread
+from datetime import timedelta
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,9 +14,11 @@ logger = logging.getLogger(__name__)
 VALID_SCOPES = {'notify_all', 'notify_invited', 'notify_none'}
 
 
-def send_event_notification(event, scope='notify_all', notification_reason='created'):
+def queue_event_notification(event, scope='notify_all', notification_reason='created'):
     """
-    Send notifications (email, SMS, WhatsApp) when an event is created or updated.
+    Queue notifications (email, SMS, WhatsApp) when an event is created or updated.
+    The message, in-app notifications and outbox deliveries are written in one
+    transaction; the send_notifications worker delivers them afterwards.
     scope:
         - notify_all: everyone with contact info
         - notify_invited: exclude users listed in excluded_users
@@ -43,33 +47,13 @@ def send_event_notification(event, scope='notify_all', notification_reason='crea
         intro_line = 'Byla vytvořena nová událost, která by vás mohla zajímat.'
         notification_text = f'Byla vytvořena událost {event.title}.'
     
-    # Base queryset
-    if scope == 'notify_invited':
-        excluded_user_ids = list(event.excluded_users.values_list('id', flat=True))
-        users_to_notify = User.objects.exclude(id__in=excluded_user_ids)
-    else:
-        users_to_notify = User.objects.all()
-    
-    # Everyone must have at least email or phone
-    users_to_notify = users_to_notify.filter(
-        models.Q(email__isnull=False) | models.Q(profile__phone_number__isnull=False)
-    ).distinct()
+    recipients = resolve_recipients(
+        'notify_events',
+        exclude_user_ids=[event.organizer_id],
+        excluded_from_event=event if scope == 'notify_invited' else None,
+    )
     
-    # Exclude organizer if exists
-    if event.organizer:
-        users_to_notify = users_to_notify.exclude(id=event.organizer.id)
-    
-    # Filter by notify_events preference
-    eligible_users = []
-    for user in users_to_notify:
-        try:
-            profile = user.profile
-            if profile.notify_events:
-                eligible_users.append(user)
-        except (UserProfile.DoesNotExist, AttributeError):
-            eligible_users.append(user)
-    
-    if not eligible_users:
+    if not recipients:
         logger.info('No eligible users for notifications.')
         return
     
@@ -95,55 +79,194 @@ Detail události: {event_url}
 
 S pozdravem,
 Tým OnlyFriends"""
-    
+
     short_message = f"Událost: {event.title}\n{event_date}\n{event_location}\n{event_url}"
     if len(short_message) > 300:
         short_message = f"Událost: {event.title}\n{event_date}\n{event_url}"
     
-    for user in eligible_users:
+    return _queue_notification(
+        recipients,
+        notification_type='event',
+        subject=subject,
+        body=full_message,
+        short_body=short_message,
+        notification_text=notification_text,
+        event=event,
+        reason=notification_reason,
+        coalesce=notification_reason == 'updated',
+    )
+
+
+def send_pooled_emails(email_messages, max_per_connection=None):
+    """
+    Send emails reusing one SMTP connection for up to max_per_connection messages,
+    instead of connecting and logging in again for every recipient.
+    
+    Args:
+        email_messages: EmailMessage objects (their connection is replaced)
+        max_per_connection: Reconnect after this many messages
+            (default NOTIFICATION_EMAIL_MAX_PER_CONNECTION)
+    
+    Returns:
+        list: None for every sent message, or the exception it failed with
+    """
+    max_per_connection = max_per_connection or getattr(settings, 'NOTIFICATION_EMAIL_MAX_PER_CONNECTION', 100)
+    results = []
+    for start in range(0, len(email_messages), max_per_connection):
+        chunk = email_messages[start:start + max_per_connection]
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f'Failed to open email connection: {e}')
+            results.extend(e for _ in chunk)
+            continue
         try:
-            try:
-                profile = user.profile
-            except (UserProfile.DoesNotExist, AttributeError):
-                profile = None
-            
-            # Email
-            if user.email:
+            for email in chunk:
+                email.connection = connection
                 try:
-                    send_mail(
-                        subject=subject,
-                        message=full_message,
-                        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@onlyfriends.com'),
-                        recipient_list=[user.email],
-                        fail_silently=True,
-                    )
-                except Exception as email_error:
-                    logger.error(f'Failed to send email to {user.email}: {email_error}')
-            
-            # SMS / WhatsApp
-            whatsapp_sent = False
-            if profile and profile.phone_number:
-                phone_number = format_phone_number(profile.phone_number)
-                if phone_number:
-                    send_sms(phone_number, short_message)
-                    if profile.notify_whatsapp:
-                        whatsapp_sent = send_whatsapp(phone_number, short_message)
+                    connection.send_messages([email])
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+                    # The server may have dropped us, start a fresh session for the rest
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception as open_error:
+                        logger.error(f'Failed to reopen email connection: {open_error}')
+        finally:
+            connection.close()
+    return results
+
+
+def _queue_notification(recipients, notification_type, subject, body, short_body, notification_text,
+                        event=None, reason='', coalesce=False):
+    """
+    Write the shared message, in-app notifications and outbox deliveries in one transaction.
+    
+    Args:
+        recipients: Recipient tuples from resolve_recipients
+        coalesce: Hold deliveries for NOTIFICATION_COALESCE_MINUTES and merge them with
+            deliveries of the same event and reason that are still waiting, so several
+            quick edits end up as one email/SMS per user
+    
+    Returns:
+        NotificationMessage: The queued message
+    """
+    now = timezone.now()
+    window = timedelta(minutes=getattr(settings, 'NOTIFICATION_COALESCE_MINUTES', 10))
+    send_at = now + window if coalesce else now
+    
+    with transaction.atomic():
+        notification_message = NotificationMessage.objects.create(
+            event=event,
+            notification_type=notification_type,
+            reason=reason,
+            subject=subject,
+            body=body,
+            short_body=short_body,
+        )
+        
+        recipient_ids = {recipient.user_id for recipient in recipients}
+        # Deliveries of an earlier fan-out that have not gone out yet, keyed by (user, channel)
+        waiting = {}
+        # Unread notifications of an earlier fan-out that is still being held, by user; also
+        # for users who only get the in-app notification and so have no deliveries
+        waiting_notifications = {}
+        if coalesce and event is not None:
+            waiting = {
+                (delivery.user_id, delivery.channel): delivery
+                for delivery in NotificationDelivery.objects.filter(
+                    status__in=['pending', 'digest'],
+                    attempts=0,
+                    message__event=event,
+                    message__reason=reason,
+                    user_id__in=recipient_ids,
+                ).only('id', 'user_id', 'channel', 'notification_id')
+            }
+            waiting_notifications = dict(Notification.objects.filter(
+                user_id__in=recipient_ids,
+                read=False,
+                notification_message__event=event,
+                notification_message__reason=reason,
+                notification_message__created_at__gte=now - window,
+            ).order_by('id').values_list('user_id', 'id'))
+            # Digest deliveries wait longer than the coalescing window
+            waiting_notifications.update(
+                (delivery.user_id, delivery.notification_id) for delivery in waiting.values() if delivery.notification_id
+            )
+        
+        # Users still waiting for an earlier fan-out get that notification updated,
+        # everyone else gets a new one. One INSERT for the whole fan-out.
+        # Per-channel states are updated by the outbox worker.
+        Notification.objects.filter(id__in=waiting_notifications.values()).update(
+            title=subject,
+            message=notification_text,
+            notification_message=notification_message,
+        )
+        new_notifications = Notification.objects.bulk_create([
+            Notification(
+                user_id=recipient.user_id,
+                notification_type=notification_type,
+                title=subject,
+                message=notification_text,
+                sent_whatsapp=False,
+                sent_app=False,
+                email_status='pending' if recipient.send_email else '',
+                sms_status='pending' if recipient.send_sms else '',
+                whatsapp_status='pending' if recipient.send_whatsapp else '',
+                notification_message=notification_message,
+            )
+            for recipient in recipients
+            if recipient.user_id not in waiting_notifications
+        ])
+        notification_ids = dict(waiting_notifications)
+        notification_ids.update((notification.user_id, notification.id) for notification in new_notifications)
+        
+        # (recipient, channel, address) of every delivery of this fan-out
+        targets = []
+        for recipient in recipients:
+            if recipient.send_email:
+                targets.append((recipient, 'email', recipient.email))
+            if recipient.send_sms:
+                targets.append((recipient, 'sms', recipient.phone_number))
+            if recipient.send_whatsapp:
+                targets.append((recipient, 'whatsapp', recipient.phone_number))
+        
+        # Waiting deliveries keep their place in the queue but now carry the latest text. A worker
+        # may have claimed one since it was read, so the UPDATE checks again and misses get a new one.
+        merged_ids = [waiting[(recipient.user_id, channel)].id for recipient, channel, _ in targets
+                      if (recipient.user_id, channel) in waiting]
+        merged = set()
+        if merged_ids:
+            candidates = NotificationDelivery.objects.filter(id__in=merged_ids, status__in=['pending', 'digest'], attempts=0)
+            if candidates.update(message=notification_message) == len(merged_ids):
+                merged = set(merged_ids)
             else:
-                whatsapp_sent = False
-            
-            # Save notification record
-            try:
-                Notification.objects.create(
-                    user=user,
-                    notification_type='event',
-                    title=subject,
-                    message=notification_text,
-                    sent_whatsapp=whatsapp_sent,
-                    sent_app=False,
-                )
-            except Exception as notification_error:
-                logger.error(f'Failed to store notification for {user.username}: {notification_error}')
+                merged = set(NotificationDelivery.objects.filter(
+                    id__in=merged_ids, message=notification_message,
+                ).values_list('id', flat=True))
         
-        except Exception as user_error:
-            logger.error(f'Failed to process notifications for {user.username}: {user_error}')
-
+        deliveries = [
+            NotificationDelivery(
+                message=notification_message,
+                notification_id=notification_ids.get(recipient.user_id),
+                user_id=recipient.user_id,
+                channel=channel,
+                address=address,
+                # Digest emails wait for send_notification_digests
+                status='digest' if channel == 'email' and recipient.email_digest else 'pending',
+                next_attempt_at=send_at,
+            )
+            for recipient, channel, address in targets
+            if getattr(waiting.get((recipient.user_id, channel)), 'id', None) not in merged
+        ]
+        NotificationDelivery.objects.bulk_create(deliveries)
+        
+        # Cached unread counts are stale once the new rows are visible
+        new_user_ids = [notification.user_id for notification in new_notifications]
+        transaction.on_commit(lambda: unread.invalidate(new_user_ids))
+    
+    logger.info(f'Queued {len(deliveries)} deliveries for "{subject}", merged {len(merged)} into waiting ones.')
+    return notification_message
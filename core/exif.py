@@ -0,0 +1,90 @@
+"""
+Photo metadata from EXIF
+
+imaging.read_metadata() reads capture time, orientation, dimensions, GPS
+position and camera in a worker process after upload (see
+thumbnails.schedule), and photo_fields() turns the result into Photo column
+values. With PHOTO_NORMALIZE_ORIENTATION, originals that rely on their EXIF
+orientation are rotated upright once at the same time, so browsers showing
+the original don't have to. Photos uploaded before this are covered by the
+extract_photo_metadata command.
+
+A content-addressed original (core.storage) is never rewritten: its name
+must keep matching its bytes and other photos may share it. The upright
+copy is stored as a new file instead and the photo switched to it.
+"""
+import os
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import thumbnails, uploads
+from .models import Photo
+from .storage import ContentAddressedStorage, is_content_addressed
+
+# Keys of imaging.read_metadata() stored as they are
+COLUMNS = ['orientation', 'width', 'height', 'latitude', 'longitude', 'camera_make', 'camera_model']
+
+
+def normalize_orientation_enabled():
+    return getattr(settings, 'PHOTO_NORMALIZE_ORIENTATION', True)
+
+
+def photo_fields(metadata):
+    """imaging.read_metadata() result -> Photo field values"""
+    fields = {name: metadata[name] for name in COLUMNS}
+    fields['exif_extracted'] = True
+    taken_at = metadata['taken_at']
+    if taken_at is not None:
+        # Without an offset in the EXIF, the camera clock is assumed to run in local time
+        fields['taken_at'] = taken_at if timezone.is_aware(taken_at) else timezone.make_aware(taken_at)
+    return fields
+
+
+def save_metadata(pk, name, metadata):
+    """
+    Store extracted metadata, unless the image was replaced in the meantime.
+    
+    Returns:
+        bool: True if the row was updated
+    """
+    return bool(Photo.objects.filter(pk=pk, image=name).update(**photo_fields(metadata)))
+
+
+def upright_target(name):
+    """
+    Where imaging.normalize_orientation() writes the upright copy of a photo.
+    
+    Returns:
+        str: A staging path for content-addressed originals, None to rotate in place
+    """
+    storage = Photo._meta.get_field('image').storage
+    if isinstance(storage, ContentAddressedStorage) and is_content_addressed(name):
+        return os.path.join(uploads.staging_dir('upright'), f'{uuid.uuid4().hex}{os.path.splitext(name)[1]}')
+    return None
+
+
+def store_upright(pk, name, path, derivatives=None):
+    """
+    Switch a photo from name to the upright copy at path, stored as its own
+    content-addressed file, and release its reference to the original.
+    Thumbnails are rendered upright from either, existing ones are linked
+    to the new name. The caller removes path afterwards.
+    
+    Returns:
+        str: The new name, or None if the image was replaced in the meantime
+    """
+    storage = Photo._meta.get_field('image').storage
+    new_name = storage.adopt(path, name)
+    for old, new in zip(thumbnails.derivative_names(name, derivatives),
+                        thumbnails.derivative_names(new_name, derivatives)):
+        try:
+            os.link(storage.path(old), storage.path(new))
+        except (FileNotFoundError, FileExistsError):
+            pass
+    if not Photo.objects.filter(pk=pk, image=name).update(image=new_name):
+        storage.delete(new_name)
+        return None
+    storage.delete(name)
+    return new_name
@@ -0,0 +1,99 @@
+"""
+Photo feeds for the gallery pages and their JSON endpoint
+
+Every section (standalone photos, trending, liked by me, album and
+sub-album photos) is read one page at a time with keyset pagination, so a
+page costs the same no matter how large the archive grows. The first page
+is rendered with the template, further pages are loaded by
+static/js/gallery.js from core:photo_feed as the user scrolls.
+"""
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q
+from django.urls import reverse
+
+from . import thumbnails
+from .models import Album, Photo, PhotoLike
+from .pagination import keyset_page
+
+ORDERINGS = {
+    'recent': ['-uploaded_at', '-id'],
+    # Precomputed time-decayed like scores, see core.trending; photos nobody
+    # liked have no score and follow the liked ones, newest first
+    'trending': [F('trending__score').desc(nulls_last=True), '-id'],
+    # Album pages tell the story in the order photos were taken
+    'taken': ['taken_at', 'id'],
+}
+
+# Section -> ordering
+SECTIONS = {
+    'standalone': 'recent',
+    'popular': 'trending',
+    'liked': 'recent',
+    'album': 'taken',
+    'sub_album': 'taken',
+}
+
+
+def page_size():
+    return getattr(settings, 'PHOTO_PAGE_SIZE', 24)
+
+
+def section_queryset(user, section, album=None, sub_album=None):
+    """
+    Photos of one gallery section with is_liked for the user, unordered.
+    The album sections expect the caller to have checked Album.can_view,
+    the others only include album photos from albums the user can view.
+    """
+    photos = Photo.objects.select_related('user', 'event').annotate(
+        is_liked=Exists(PhotoLike.objects.filter(photo=OuterRef('pk'), user=user))
+    )
+    if section == 'standalone':
+        return photos.filter(album=None)
+    visible = Q(album=None) | Q(album__in=Album.objects.visible_to(user).values('pk'))
+    if section == 'liked':
+        return photos.filter(visible, is_liked=True)
+    if section == 'album':
+        return photos.filter(album=album, sub_album=None)
+    if section == 'sub_album':
+        return photos.filter(sub_album=sub_album)
+    return photos.select_related('trending').filter(visible)
+
+
+def photo_page(user, section, cursor=None, album=None, sub_album=None):
+    """
+    One page of a gallery section.
+    
+    Returns:
+        KeysetPage: items, next_cursor, has_next
+    """
+    ordering = ORDERINGS[SECTIONS[section]]
+    return keyset_page(section_queryset(user, section, album, sub_album), ordering, cursor, page_size())
+
+
+def feed_url(section, album=None, sub_album=None):
+    """JSON endpoint URL of a section, without the cursor"""
+    url = f'{reverse("core:photo_feed")}?section={section}'
+    if album is not None:
+        url += f'&album={album.id}'
+    if sub_album is not None:
+        url += f'&sub_album={sub_album.id}'
+    return url
+
+
+def photo_record(photo):
+    """Compact JSON-serializable photo for the feed endpoint"""
+    return {
+        'id': photo.id,
+        'caption': photo.caption,
+        'user': photo.user.username,
+        'uploaded_at': photo.uploaded_at.isoformat(),
+        'taken_at': photo.taken_at.isoformat(),
+        'like_count': photo.like_count,
+        'duplicate_of': photo.duplicate_of_id,
+        'is_liked': photo.is_liked,
+        'event': photo.event.title if photo.event else None,
+        'album_link': photo.album_link or None,
+        'image': thumbnails.picture_data(photo.image, photo.derivatives) if photo.image else None,
+        'like_url': reverse('core:photo_like', args=[photo.id]),
+        'edit_url': reverse('core:photo_edit', args=[photo.id]),
+    }
@@ -0,0 +1,280 @@
+"""
+Image processing that runs in worker processes
+
+Everything here works on plain file paths and returns plain data, and does
+not import Django, so it can run in a spawned process pool. The results
+are written to the database by the caller.
+"""
+from datetime import datetime
+import os
+import time
+
+from PIL import ExifTags, Image, ImageOps, JpegImagePlugin, features
+
+# Format -> (file extension, Pillow format name)
+FORMATS = {
+    'jpeg': ('.jpg', 'JPEG'),
+    'webp': ('.webp', 'WEBP'),
+    'avif': ('.avif', 'AVIF'),
+}
+
+# Formats whose originals are rewritten upright, others keep their EXIF orientation
+NORMALIZE_FORMATS = {'JPEG': 'JPEG', 'MPO': 'JPEG', 'PNG': 'PNG', 'WEBP': 'WEBP', 'TIFF': 'TIFF'}
+
+# EXIF orientations that swap width and height
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+# Encoder quality per format, the numbers give similar visual quality
+QUALITY_PRESETS = {
+    'high': {'jpeg': 90, 'webp': 85, 'avif': 70},
+    'balanced': {'jpeg': 85, 'webp': 78, 'avif': 58},
+    'small': {'jpeg': 75, 'webp': 65, 'avif': 45},
+}
+
+
+def derivative_path(path, size, format='jpeg'):
+    """photos/abc.png -> photos/abc.grid.jpg, works for storage names and file paths"""
+    root, _ = os.path.splitext(path)
+    return f'{root}.{size}{FORMATS[format][0]}'
+
+
+def supported_formats(formats):
+    """The subset of formats this Pillow build can encode, JPEG is always included"""
+    return ['jpeg'] + [format for format in formats if format != 'jpeg' and features.check(format)]
+
+
+def _save_atomic(image, path, format, **params):
+    """Write to a temporary file first, so a half-written derivative is never served"""
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    try:
+        image.save(tmp_path, format, **params)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _encoder_params(format, quality):
+    if format == 'jpeg':
+        return {'quality': quality, 'optimize': True, 'progressive': True}
+    if format == 'webp':
+        return {'quality': quality, 'method': 5}
+    return {'quality': quality, 'speed': 6}
+
+
+def render_derivatives(path, sizes, formats=('jpeg',), preset='balanced'):
+    """
+    Write downscaled copies of an image next to it, in JPEG and any other
+    requested format (webp, avif) this Pillow build supports.
+    
+    Args:
+        path: Original image file
+        sizes: {name: longest edge in pixels}, e.g. {'grid': 480, 'full': 2560}
+        formats: Formats to write besides JPEG
+        preset: Key of QUALITY_PRESETS
+    
+    Returns:
+        dict: {'sizes': {name: width}, 'formats': [written formats],
+            'version': changes with every rendering, for cache busting URLs}
+    """
+    formats = supported_formats(formats)
+    quality = QUALITY_PRESETS[preset]
+    largest = max(sizes.values())
+    with Image.open(path) as original:
+        # Let the JPEG decoder skip detail we would throw away anyway, much faster for phone photos
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        
+        widths = {}
+        # Largest first, each size is scaled down from the previous one
+        for name, edge in sorted(sizes.items(), key=lambda item: -item[1]):
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            for format in formats:
+                _save_atomic(image, derivative_path(path, name, format), FORMATS[format][1],
+                             **_encoder_params(format, quality[format]))
+            widths[name] = image.width
+    return {'sizes': widths, 'formats': formats, 'version': f'{time.time_ns() // 1000000:x}'}
+
+
+def render_mosaic(paths, target, size, preset='balanced'):
+    """
+    Write a JPEG cover made of up to four images: one fills it, two side by
+    side, three as one large and two small, four as a 2x2 grid.
+    
+    Args:
+        paths: Image files, the first four are used
+        target: JPEG file to write
+        size: (width, height) of the cover
+        preset: Key of QUALITY_PRESETS
+    """
+    paths = paths[:4]
+    width, height = size
+    left, top = width // 2, height // 2
+    # (x, y, width, height) of each tile
+    layouts = {
+        1: [(0, 0, width, height)],
+        2: [(0, 0, left, height), (left, 0, width - left, height)],
+        3: [(0, 0, left, height), (left, 0, width - left, top), (left, top, width - left, height - top)],
+        4: [(0, 0, left, top), (left, 0, width - left, top),
+            (0, top, left, height - top), (left, top, width - left, height - top)],
+    }
+    cover = Image.new('RGB', size, 'white')
+    for path, (x, y, tile_width, tile_height) in zip(paths, layouts[len(paths)]):
+        with Image.open(path) as original:
+            original.draft('RGB', (tile_width, tile_height))
+            image = ImageOps.exif_transpose(original).convert('RGB')
+            cover.paste(ImageOps.fit(image, (tile_width, tile_height), Image.LANCZOS), (x, y))
+    _save_atomic(cover, target, 'JPEG', **_encoder_params('jpeg', QUALITY_PRESETS[preset]['jpeg']))
+
+
+def _exif_text(value, max_length=100):
+    if not isinstance(value, str):
+        return ''
+    return value.replace('\x00', '').strip()[:max_length]
+
+
+def _exif_datetime(value, offset=None):
+    """'2024:07:14 18:03:22' (+ '+02:00') -> datetime, aware only with an offset"""
+    value = _exif_text(value)
+    offset = _exif_text(offset)
+    try:
+        if offset:
+            return datetime.strptime(f'{value}{offset}', '%Y:%m:%d %H:%M:%S%z')
+        return datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def _gps_coordinate(value, ref):
+    """((degrees, minutes, seconds), 'N'/'S'/'E'/'W') -> signed decimal degrees"""
+    try:
+        degrees, minutes, seconds = (float(part) for part in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    coordinate = degrees + minutes / 60 + seconds / 3600
+    return -coordinate if ref in ('S', 'W') else coordinate
+
+
+def read_metadata(image):
+    """
+    Capture time, orientation, upright dimensions, GPS position and camera of
+    an opened image.
+    
+    Returns:
+        dict: taken_at (datetime or None), orientation, width, height,
+            latitude, longitude, camera_make, camera_model
+    """
+    exif = image.getexif()
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    orientation = exif.get(ExifTags.Base.Orientation) or 1
+    width, height = image.size
+    if orientation in ROTATED_ORIENTATIONS:
+        width, height = height, width
+    
+    taken_at = (
+        _exif_datetime(details.get(ExifTags.Base.DateTimeOriginal), details.get(ExifTags.Base.OffsetTimeOriginal))
+        or _exif_datetime(details.get(ExifTags.Base.DateTimeDigitized), details.get(ExifTags.Base.OffsetTimeDigitized))
+        or _exif_datetime(exif.get(ExifTags.Base.DateTime), details.get(ExifTags.Base.OffsetTime))
+    )
+    
+    gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    latitude = _gps_coordinate(gps.get(ExifTags.GPS.GPSLatitude), gps.get(ExifTags.GPS.GPSLatitudeRef))
+    longitude = _gps_coordinate(gps.get(ExifTags.GPS.GPSLongitude), gps.get(ExifTags.GPS.GPSLongitudeRef))
+    valid = (
+        latitude is not None and longitude is not None
+        and -90 <= latitude <= 90 and -180 <= longitude <= 180
+        # Cameras without a fix write zeros
+        and (latitude, longitude) != (0, 0)
+    )
+    if not valid:
+        latitude = longitude = None
+    
+    return {
+        'taken_at': taken_at,
+        'orientation': orientation,
+        'width': width,
+        'height': height,
+        'latitude': latitude,
+        'longitude': longitude,
+        'camera_make': _exif_text(exif.get(ExifTags.Base.Make)),
+        'camera_model': _exif_text(exif.get(ExifTags.Base.Model)),
+    }
+
+
+def normalize_orientation(path, target=None):
+    """
+    Rotate an original that relies on its EXIF orientation upright and reset
+    the orientation to 1, in place or into target. JPEGs are encoded again
+    at quality 95 with the original chroma subsampling, EXIF and ICC profile.
+    
+    Returns:
+        bool: True if the upright image was written
+    """
+    with Image.open(path) as original:
+        orientation = original.getexif().get(ExifTags.Base.Orientation) or 1
+        format = NORMALIZE_FORMATS.get(original.format)
+        if orientation == 1 or format is None:
+            return False
+        params = {'exif': None, 'icc_profile': original.info.get('icc_profile')}
+        if format == 'JPEG':
+            params.update(quality=95, subsampling=JpegImagePlugin.get_sampling(original))
+        elif format == 'WEBP':
+            params.update(quality=95)
+        upright = ImageOps.exif_transpose(original)
+        # exif_transpose drops the orientation tag, everything else is kept
+        params['exif'] = upright.getexif().tobytes()
+        _save_atomic(upright, target or path, format,
+                     **{name: value for name, value in params.items() if value is not None})
+    return True
+
+
+def extract_metadata(path, normalize=True, target=None):
+    """
+    read_metadata() of a file, which is then rotated upright (into target
+    if given) if normalize is set. metadata['normalized'] tells whether it was.
+    """
+    with Image.open(path) as image:
+        metadata = read_metadata(image)
+    metadata['normalized'] = normalize and normalize_orientation(path, target)
+    return metadata
+
+
+def dhash(image, size=8):
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of a
+    (size + 1) x size grayscale thumbnail, set if the left one is brighter.
+    Resizing, recompression and small edits change only a few bits.
+    
+    Returns:
+        int: size * size bits, 64 by default
+    """
+    small = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            offset = row * (size + 1) + col
+            bits = (bits << 1) | (pixels[offset] > pixels[offset + 1])
+    return bits
+
+
+def perceptual_hash(path):
+    """dhash() of the upright image, decoded at a fraction of its size where the format allows"""
+    with Image.open(path) as image:
+        image.draft('L', (64, 64))
+        return dhash(ImageOps.exif_transpose(image))
+
+
+def analyze_photo(path, normalize=True, target=None):
+    """
+    Cheap work done first after a photo is uploaded, before thumbnails are
+    rendered: metadata, upright original (see extract_metadata) and
+    perceptual hash.
+    
+    Returns:
+        dict: {'metadata': read_metadata() result, 'dhash': perceptual_hash() result}
+    """
+    metadata = extract_metadata(path, normalize, target)
+    return {'metadata': metadata, 'dhash': perceptual_hash(path)}
@@ -0,0 +1,73 @@
+"""
+Photo likes with a denormalized Photo.like_count
+
+The counter is changed with F() in the same transaction as the PhotoLike
+row, so it never needs a COUNT. The unique (photo, user) constraint makes
+the toggle safe under concurrent clicks: only one request can insert or
+delete the row, and only that one moves the counter. The photo's trending
+score (core.trending) is updated in the same transaction.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import trending
+from .models import Photo, PhotoLike
+
+
+def toggle_like(photo_id, user):
+    """
+    Like the photo, or remove the like if the user already liked it.
+    
+    Returns:
+        tuple: (liked, like_count) after the toggle
+    """
+    with transaction.atomic():
+        deleted, _ = PhotoLike.objects.filter(photo_id=photo_id, user=user).delete()
+        if deleted:
+            Photo.objects.filter(id=photo_id).update(like_count=F('like_count') - 1)
+            trending.refresh_photo(photo_id)
+            liked = False
+        else:
+            try:
+                # Savepoint, a concurrent click may have inserted the same like
+                with transaction.atomic():
+                    like = PhotoLike.objects.create(photo_id=photo_id, user=user)
+            except IntegrityError:
+                pass
+            else:
+                Photo.objects.filter(id=photo_id).update(like_count=F('like_count') + 1)
+                trending.add_like(photo_id, like.created_at)
+            liked = True
+        like_count = Photo.objects.filter(id=photo_id).values_list('like_count', flat=True).get()
+    return liked, like_count
+
+
+def actual_like_count():
+    """Subquery expression counting a photo's PhotoLike rows"""
+    return Coalesce(
+        Subquery(
+            PhotoLike.objects.filter(photo=OuterRef('pk')).order_by()
+            .values('photo').annotate(count=Count('id')).values('count'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def reconcile_like_counts(dry_run=False):
+    """
+    Fix like_count of photos where it differs from the number of likes,
+    e.g. after likes were removed together with a deleted user.
+    
+    Returns:
+        list: (photo_id, stored, actual) of every photo that drifted
+    """
+    drifted = list(
+        Photo.objects.annotate(actual=actual_like_count())
+        .exclude(like_count=F('actual'))
+        .values_list('id', 'like_count', 'actual')
+    )
+    if drifted and not dry_run:
+        Photo.objects.filter(id__in=[photo_id for photo_id, _, _ in drifted]).update(like_count=actual_like_count())
+    return drifted
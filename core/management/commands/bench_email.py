@@ -0,0 +1,103 @@
+"""
+Benchmark email delivery against a local SMTP sink.
+
+Compares one send_mail() per recipient (a new SMTP session each time) with
+send_pooled_emails(), which reuses connections. Nothing leaves the machine.
+"""
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMessage, send_mail
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core.emails import send_pooled_emails
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and discard messages"""
+    
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+        self.wfile.flush()
+    
+    def handle(self):
+        # Connection setup cost of a real server (TLS, banner, auth)
+        time.sleep(self.server.connect_latency)
+        self.reply('220 sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-sink')
+                self.reply('250 8BITMIME')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.received += 1
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, connect_latency):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.connect_latency = connect_latency
+        self.received = 0
+
+
+class Command(BaseCommand):
+    help = 'Compare per-message and pooled SMTP delivery throughput against a local sink'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200, help='Messages per run')
+        parser.add_argument('--connect-latency-ms', type=float, default=20.0, help='Simulated SMTP session setup time')
+        parser.add_argument('--max-per-connection', type=int, default=100, help='Pooled messages per connection')
+    
+    def handle(self, *args, **options):
+        sink = SMTPSink(options['connect_latency_ms'] / 1000)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        host, port = sink.server_address
+        count = options['messages']
+        
+        subject = 'Nová událost: Benchmark'
+        body = 'Dobrý den,\n\n' + 'Benchmark zprávy. ' * 40
+        recipients = [f'user{n}@example.com' for n in range(count)]
+        
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST=host,
+            EMAIL_PORT=port,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        ):
+            start = time.perf_counter()
+            for recipient in recipients:
+                send_mail(subject, body, 'noreply@onlyfriends.com', [recipient])
+            before = time.perf_counter() - start
+            
+            email_messages = [EmailMessage(subject, body, 'noreply@onlyfriends.com', [recipient]) for recipient in recipients]
+            start = time.perf_counter()
+            errors = [error for error in send_pooled_emails(email_messages, options['max_per_connection']) if error]
+            after = time.perf_counter() - start
+        
+        sink.shutdown()
+        sink.server_close()
+        
+        self.stdout.write(f'Sink received {sink.received} of {count * 2} messages, {len(errors)} pooled errors')
+        self.stdout.write(f'send_mail per message: {count / before:8.1f} msg/s ({before:.2f}s)')
+        self.stdout.write(f'pooled connection:     {count / after:8.1f} msg/s ({after:.2f}s)')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {before / after:.1f}x'))
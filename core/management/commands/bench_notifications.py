@@ -0,0 +1,208 @@
+"""
+Benchmark event notification fan-out end to end, fully offline.
+
+For every user count and scope, synthetic users are seeded, an event is
+created and queue_event_notification() fans it out. The outbox is then
+drained with process_deliveries(), against fake email and SMS/WhatsApp
+backends with configurable latency and error rates. Everything runs in a
+transaction that is rolled back, so the database is left untouched.
+
+    python manage.py bench_notifications --users 50 500 5000 --output bench.json
+"""
+import json
+import logging
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from core import sms
+from core.emails import queue_event_notification
+from core.models import Event, NotificationDelivery, UserProfile
+from core.outbox import process_deliveries
+
+SCOPES = ['notify_all', 'notify_invited']
+
+
+class FakeEmailBackend(BaseEmailBackend):
+    """Accepts and discards emails, with simulated connection setup, per-message latency and failures"""
+    connect_latency = 0
+    latency = 0
+    error_rate = 0
+    
+    def open(self):
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        return True
+    
+    def close(self):
+        pass
+    
+    def send_messages(self, email_messages):
+        for _ in email_messages:
+            if self.latency:
+                time.sleep(self.latency)
+            if self.error_rate and random.random() < self.error_rate:
+                raise OSError('Simulated SMTP error')
+        return len(email_messages)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure notification fan-out and delivery with synthetic users and fake backends'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, nargs='+', default=[50, 500, 5000], help='User counts to run')
+        parser.add_argument('--scopes', nargs='+', choices=SCOPES, default=SCOPES)
+        parser.add_argument('--phone-ratio', type=float, default=0.5, help='Share of users with a phone number')
+        parser.add_argument('--whatsapp-ratio', type=float, default=0.2, help='Share of users with WhatsApp enabled')
+        parser.add_argument('--excluded-ratio', type=float, default=0.2,
+                            help='Share of users excluded from the event (notify_invited)')
+        parser.add_argument('--email-latency-ms', type=float, default=2.0, help='Fake SMTP time per message')
+        parser.add_argument('--email-connect-latency-ms', type=float, default=20.0, help='Fake SMTP session setup')
+        parser.add_argument('--sms-latency-ms', type=float, default=50.0, help='Fake Twilio API round trip')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of sends failing (0-1)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Outbox batch size')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the synthetic data')
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    
+    def handle(self, *args, **options):
+        FakeEmailBackend.connect_latency = options['email_connect_latency_ms'] / 1000
+        FakeEmailBackend.latency = options['email_latency_ms'] / 1000
+        FakeEmailBackend.error_rate = options['error_rate']
+        
+        fake_settings = override_settings(
+            EMAIL_BACKEND=f'{__name__}.FakeEmailBackend',
+            SMS_BACKEND='core.sms.LocMemBackend',
+            SMS_FAKE_LATENCY=options['sms_latency_ms'] / 1000,
+            SMS_FAKE_ERROR_RATE=options['error_rate'],
+            SMS_RATE_LIMITS={},
+            ENABLE_SMS_NOTIFICATIONS=True,
+            ENABLE_WHATSAPP_NOTIFICATIONS=True,
+            TWILIO_PHONE_NUMBER='+420000000000',
+            # Keep rate limiter and delivery metrics of the real cache untouched
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}},
+        )
+        
+        results = []
+        if options['verbosity'] < 2:
+            # Simulated failures would flood the output
+            logging.disable(logging.ERROR)
+        with fake_settings:
+            sms.reset_backend()
+            try:
+                for user_count in options['users']:
+                    for scope in options['scopes']:
+                        results.append(self.run(user_count, scope, options))
+                        self.stderr.write(
+                            f'{scope:15} {user_count:6} users: '
+                            f'queue {results[-1]["queue"]["seconds"]:.2f}s, '
+                            f'deliver {results[-1]["deliver"]["seconds"]:.2f}s'
+                        )
+            finally:
+                sms.reset_backend()
+                sms.outbox.clear()
+                logging.disable(logging.NOTSET)
+        
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'options': {
+                name: options[name] for name in (
+                    'phone_ratio', 'whatsapp_ratio', 'excluded_ratio', 'email_latency_ms',
+                    'email_connect_latency_ms', 'sms_latency_ms', 'error_rate', 'batch_size', 'seed',
+                )
+            },
+            'runs': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+    
+    def run(self, user_count, scope, options):
+        """One fan-out and delivery, rolled back afterwards"""
+        # Existing users are notified too, small next to the synthetic ones
+        result = {'users': user_count, 'existing_users': User.objects.count(), 'scope': scope}
+        try:
+            with transaction.atomic():
+                event = self.seed(user_count, options)
+                
+                tracemalloc.start()
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    queue_event_notification(event, scope=scope)
+                    elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                result['queue'] = {
+                    'seconds': round(elapsed, 4),
+                    'queries': len(queries),
+                    'peak_memory_kb': peak // 1024,
+                    'deliveries': NotificationDelivery.objects.count(),
+                }
+                
+                tracemalloc.reset_peak()
+                batches = 0
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    while process_deliveries('bench', limit=options['batch_size']):
+                        batches += 1
+                    elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                
+                channels = {}
+                for row in NotificationDelivery.objects.values('channel', 'status').annotate(count=Count('id')):
+                    channels.setdefault(row['channel'], {})[row['status']] = row['count']
+                for counts in channels.values():
+                    counts['sent_per_second'] = round(counts.get('sent', 0) / elapsed, 1) if elapsed else None
+                result['deliver'] = {
+                    'seconds': round(elapsed, 4),
+                    'queries': len(queries),
+                    'peak_memory_kb': peak // 1024,
+                    'batches': batches,
+                    'channels': channels,
+                }
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+        return result
+    
+    def seed(self, user_count, options):
+        """Synthetic users with profiles, and an event excluding some of them"""
+        rng = random.Random(options['seed'])
+        users = User.objects.bulk_create([
+            User(username=f'bench{n}', email=f'bench{n}@example.com')
+            for n in range(user_count + 1)
+        ])
+        organizer, users = users[0], users[1:]
+        
+        profiles = []
+        for n, user in enumerate(users):
+            has_phone = rng.random() < options['phone_ratio']
+            profiles.append(UserProfile(
+                user=user,
+                phone_number=f'+420{700000000 + n}' if has_phone else '',
+                notify_whatsapp=has_phone and rng.random() < options['whatsapp_ratio'],
+            ))
+        UserProfile.objects.bulk_create(profiles)
+        
+        event = Event.objects.create(title='Benchmark', organizer=organizer, start_date=timezone.now())
+        excluded = [user for user in users if rng.random() < options['excluded_ratio']]
+        event.excluded_users.set(excluded)
+        return event
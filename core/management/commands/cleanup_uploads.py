@@ -0,0 +1,19 @@
+"""
+Delete abandoned resumable uploads and leftover staged upload files.
+
+Runs by itself at most hourly when uploads are started (see
+core.resumable.maybe_collect_expired); schedule it with cron as well if
+uploads are rare:
+    0 * * * * python manage.py cleanup_uploads
+"""
+from django.core.management.base import BaseCommand
+
+from core.resumable import collect_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable uploads untouched for RESUMABLE_UPLOAD_EXPIRY_HOURS and orphaned upload files'
+    
+    def handle(self, *args, **options):
+        expired, orphaned = collect_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {expired} expired uploads and {orphaned} orphaned files'))
@@ -0,0 +1,51 @@
+"""
+Move media files no row refers to any more (deleted photos, replaced album
+intro photos, their thumbnails) to MEDIA_ROOT/quarantine/, and delete
+quarantined files after MEDIA_GC_GRACE_DAYS. Memory use does not grow with
+the number of files, see core.orphans. Schedule it daily with cron:
+    30 3 * * * python manage.py collect_orphaned_media
+"""
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from core.orphans import collect, restore
+
+LOCK_KEY = 'orphaned_media:lock'
+
+
+def _human(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
+
+
+class Command(BaseCommand):
+    help = 'Quarantine unreferenced media files and delete them after a grace period'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved and deleted')
+        parser.add_argument('--error-rate', type=float, default=0.001,
+                            help='False positive rate of the Bloom filter, orphans it keeps by mistake')
+        parser.add_argument('--restore', metavar='PREFIX', nargs='?', const='',
+                            help='Move quarantined files (starting with PREFIX) back instead')
+    
+    def handle(self, *args, **options):
+        if not cache.add(LOCK_KEY, True, 60 * 60 * 6):
+            raise CommandError('Another collect_orphaned_media run is in progress')
+        try:
+            if options['restore'] is not None:
+                restored = restore(options['restore'])
+                self.stdout.write(self.style.SUCCESS(f'Restored {restored} files'))
+                return
+            stats = collect(dry_run=options['dry_run'], error_rate=options['error_rate'])
+        finally:
+            cache.delete(LOCK_KEY)
+        
+        action = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {stats["scanned"]} files. {action} {stats["quarantined"]} '
+            f'({_human(stats["quarantined_bytes"])}) to the quarantine, '
+            f'{"would delete" if options["dry_run"] else "deleted"} {stats["purged"]} '
+            f'({_human(stats["purged_bytes"])}) past the grace period'
+        ))
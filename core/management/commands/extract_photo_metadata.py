@@ -0,0 +1,78 @@
+"""
+Read EXIF metadata (capture time, orientation, dimensions, GPS, camera) of
+existing photos into their columns, and rotate originals upright
+(content-addressed ones into a new file, see core.exif).
+
+Work is spread over a process pool. Only photos not extracted yet are
+read, so an interrupted run continues where it stopped when started
+again; --force reads everything again.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.exif import normalize_orientation_enabled, save_metadata, store_upright, upright_target
+from core.imaging import extract_metadata
+from core.models import Photo
+from core.uploads import remove_file
+
+
+class Command(BaseCommand):
+    help = 'Extract EXIF metadata of existing photos in parallel'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Processes (default THUMBNAIL_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Photos per batch')
+        parser.add_argument('--force', action='store_true', help='Read again even if already extracted')
+        parser.add_argument('--after-id', type=int, default=0, help='Skip rows up to this id')
+        parser.add_argument('--no-normalize', action='store_true',
+                            help='Leave originals as they are (default PHOTO_NORMALIZE_ORIENTATION)')
+    
+    def handle(self, *args, **options):
+        workers = options['workers'] or getattr(settings, 'THUMBNAIL_WORKERS', 2)
+        normalize = normalize_orientation_enabled() and not options['no_normalize']
+        storage = Photo._meta.get_field('image').storage
+        rows = Photo.objects.exclude(image__isnull=True).exclude(image='')
+        if not options['force']:
+            rows = rows.filter(exif_extracted=False)
+        rows = rows.order_by('pk').values_list('pk', 'image', 'orientation', 'derivatives')
+        
+        start = time.perf_counter()
+        done = failed = 0
+        last_pk = options['after_id']
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                batch = list(rows.filter(pk__gt=last_pk)[:options['batch_size']])
+                if not batch:
+                    break
+                futures = {}
+                for pk, name, orientation, derivatives in batch:
+                    target = upright_target(name) if normalize else None
+                    future = pool.submit(extract_metadata, storage.path(name), normalize, target)
+                    futures[future] = (pk, name, orientation, derivatives, target)
+                for future in as_completed(futures):
+                    pk, name, orientation, derivatives, target = futures[future]
+                    try:
+                        metadata = future.result()
+                        if orientation and metadata['orientation'] == 1:
+                            # Rotated upright before, keep the orientation it was uploaded with
+                            metadata['orientation'] = orientation
+                        if save_metadata(pk, name, metadata) and target and metadata['normalized']:
+                            store_upright(pk, name, target, derivatives)
+                        done += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'Photo {pk} ({name}): {e}')
+                    finally:
+                        if target:
+                            remove_file(target)
+                last_pk = batch[-1][0]
+                self.stdout.write(f'Done up to id {last_pk} ({done} extracted, {failed} failed)')
+        
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Extracted metadata of {done} photos in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f}/s), {failed} failed'
+        ))
@@ -0,0 +1,78 @@
+"""
+Render missing thumbnails for existing photos and album intro photos.
+
+Work is spread over a process pool. Results are saved after every batch,
+so an interrupted run continues where it stopped when started again.
+With --force everything is rendered again, e.g. after changing sizes,
+formats or quality; the printed last finished id resumes such a run with
+--after-id (and --model album if it stopped at album intro photos).
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.imaging import render_derivatives
+from core.models import Album, Photo
+from core.thumbnails import DERIVATIVE_FIELDS, render_options, save_result
+
+TARGETS = [(Photo, 'image'), (Album, 'intro_photo')]
+
+
+class Command(BaseCommand):
+    help = 'Render missing thumbnails of photos and album intro photos in parallel'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Processes (default THUMBNAIL_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Images per batch')
+        parser.add_argument('--force', action='store_true', help='Render again even if thumbnails exist')
+        parser.add_argument('--model', choices=[model.__name__.lower() for model, _ in TARGETS], default=None,
+                            help='Only render images of this model')
+        parser.add_argument('--after-id', type=int, default=0,
+                            help='Skip rows up to this id, only of the first model rendered (photo, or the one given with --model)')
+    
+    def handle(self, *args, **options):
+        workers = options['workers'] or getattr(settings, 'THUMBNAIL_WORKERS', 2)
+        render_kwargs = render_options()
+        start = time.perf_counter()
+        done = failed = 0
+        
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            targets = [
+                (model, field) for model, field in TARGETS
+                if options['model'] in (None, model.__name__.lower())
+            ]
+            for index, (model, field) in enumerate(targets):
+                storage = model._meta.get_field(field).storage
+                rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                if not options['force']:
+                    rows = rows.filter(**{DERIVATIVE_FIELDS[field]: {}})
+                rows = rows.order_by('pk').values_list('pk', field)
+                
+                # The printed ids belong to one model, they mean nothing for the next
+                last_pk = options['after_id'] if index == 0 else 0
+                while True:
+                    batch = list(rows.filter(pk__gt=last_pk)[:options['batch_size']])
+                    if not batch:
+                        break
+                    futures = {
+                        pool.submit(render_derivatives, storage.path(name), **render_kwargs): (pk, name)
+                        for pk, name in batch
+                    }
+                    for future in as_completed(futures):
+                        pk, name = futures[future]
+                        try:
+                            save_result(model, pk, field, name, future.result())
+                            done += 1
+                        except Exception as e:
+                            failed += 1
+                            self.stderr.write(f'{model.__name__} {pk} ({name}): {e}')
+                    last_pk = batch[-1][0]
+                    self.stdout.write(f'{model.__name__}: done up to id {last_pk} ({done} rendered, {failed} failed)')
+        
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered thumbnails for {done} images in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f}/s), {failed} failed'
+        ))
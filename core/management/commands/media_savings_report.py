@@ -0,0 +1,95 @@
+"""
+Report how many bytes the WebP/AVIF derivatives save across MEDIA_ROOT.
+
+For every thumbnail size the JPEG derivative is compared with the smallest
+rendered alternative, which is what a browser supporting it downloads.
+Only the file system is read, the database is not touched.
+"""
+import json
+import os
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.imaging import FORMATS
+from core.thumbnails import get_sizes
+
+EXTENSIONS = {extension: format for format, (extension, _) in FORMATS.items()}
+
+
+def _human(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
+
+
+class Command(BaseCommand):
+    help = 'Report bytes saved by WebP/AVIF derivatives compared to JPEG across MEDIA_ROOT'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    
+    def handle(self, *args, **options):
+        sizes = '|'.join(re.escape(size) for size in get_sizes())
+        extensions = '|'.join(re.escape(extension) for extension in EXTENSIONS)
+        derivative = re.compile(rf'^(?P<root>.+)\.(?P<size>{sizes})(?P<ext>{extensions})$')
+        
+        originals = {'files': 0, 'bytes': 0}
+        per_format = defaultdict(lambda: {'files': 0, 'bytes': 0})
+        # (directory, root, size) -> {format: bytes}
+        groups = defaultdict(dict)
+        
+        for directory, _, files in os.walk(settings.MEDIA_ROOT):
+            for filename in files:
+                try:
+                    file_size = os.stat(os.path.join(directory, filename)).st_size
+                except OSError:
+                    continue
+                match = derivative.match(filename)
+                if not match:
+                    originals['files'] += 1
+                    originals['bytes'] += file_size
+                    continue
+                format = EXTENSIONS[match['ext']]
+                per_format[format]['files'] += 1
+                per_format[format]['bytes'] += file_size
+                groups[(directory, match['root'], match['size'])][format] = file_size
+        
+        per_size = defaultdict(lambda: {'jpeg_bytes': 0, 'best_bytes': 0})
+        for (_, _, size), formats in groups.items():
+            if 'jpeg' not in formats:
+                continue
+            per_size[size]['jpeg_bytes'] += formats['jpeg']
+            per_size[size]['best_bytes'] += min(formats.values())
+        jpeg_bytes = sum(row['jpeg_bytes'] for row in per_size.values())
+        best_bytes = sum(row['best_bytes'] for row in per_size.values())
+        
+        report = {
+            'media_root': str(settings.MEDIA_ROOT),
+            'originals': originals,
+            'formats': dict(per_format),
+            'sizes': {
+                size: dict(row, saved_bytes=row['jpeg_bytes'] - row['best_bytes'])
+                for size, row in per_size.items()
+            },
+            'saved_bytes': jpeg_bytes - best_bytes,
+            'saved_percent': round(100 * (jpeg_bytes - best_bytes) / jpeg_bytes, 1) if jpeg_bytes else 0,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        
+        self.stdout.write(f'Originals: {originals["files"]} files, {_human(originals["bytes"])}')
+        for format, row in sorted(per_format.items()):
+            self.stdout.write(f'{format:5} derivatives: {row["files"]} files, {_human(row["bytes"])}')
+        for size, row in sorted(report['sizes'].items()):
+            self.stdout.write(
+                f'{size:10} JPEG {_human(row["jpeg_bytes"]):>10} -> best {_human(row["best_bytes"]):>10} '
+                f'(saved {_human(row["saved_bytes"])})'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {_human(report["saved_bytes"])} ({report["saved_percent"]}%) compared to JPEG derivatives'
+        ))
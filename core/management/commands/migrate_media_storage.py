@@ -0,0 +1,116 @@
+"""
+Move photos and album intro photos stored under their upload names
+(photos/Trip.jpg) to content-addressed names (photos/3f/a2/<sha256>.jpg,
+see core.storage), deduplicating identical files on the way.
+
+Files are hashed in a thread pool. Each file and its thumbnails are
+hard-linked under the new name first, then the row is switched with a
+conditional UPDATE, and only then are the old names removed, so the site
+keeps working while the command runs. Rows already moved are skipped, so
+an interrupted run continues where it stopped when started again.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import thumbnails
+from core.models import Album, Photo
+from core.storage import ContentAddressedStorage, content_name, file_digest, is_content_addressed, reconcile_refcounts
+from core.uploads import remove_file
+
+TARGETS = [(Photo, 'image'), (Album, 'intro_photo')]
+
+
+def _digest(path):
+    """file_digest(), or the error, so one missing file does not stop the batch"""
+    try:
+        return file_digest(path)
+    except OSError as e:
+        return e
+
+
+def move_file(model, pk, field, name, derivatives, digest, keep_old=False):
+    """
+    Switch one row to the content-addressed name of its file.
+    
+    Returns:
+        str: The new name, or None if the row changed in the meantime
+    """
+    storage = model._meta.get_field(field).storage
+    new_name = content_name(name, digest)
+    storage.add_reference(storage.path(name), new_name)
+    old_derivatives = thumbnails.derivative_names(name, derivatives)
+    for old, new in zip(old_derivatives, thumbnails.derivative_names(new_name, derivatives)):
+        try:
+            os.link(storage.path(old), storage.path(new))
+        except (FileNotFoundError, FileExistsError):
+            # Not rendered, or already there from an identical file
+            pass
+    
+    if not model.objects.filter(pk=pk, **{field: name}).update(**{field: new_name}):
+        storage.delete(new_name)
+        return None
+    if not keep_old and not model.objects.filter(**{field: name}).exists():
+        for old in [name, *old_derivatives]:
+            remove_file(storage.path(old))
+    return new_name
+
+
+class Command(BaseCommand):
+    help = 'Move existing media files to content-addressed, sharded names in parallel'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Hashing threads (default THUMBNAIL_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows per batch')
+        parser.add_argument('--keep-old', action='store_true',
+                            help='Leave the files under their old names, e.g. while cached pages still link them')
+        parser.add_argument('--recount', action='store_true', help='Only fix reference counts of stored files')
+    
+    def handle(self, *args, **options):
+        if options['recount']:
+            drifted = reconcile_refcounts()
+            for name, stored, actual in drifted:
+                self.stdout.write(f'{name}: stored {stored}, actual {actual}')
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(drifted)} files with a wrong reference count'))
+            return
+        
+        workers = options['workers'] or getattr(settings, 'THUMBNAIL_WORKERS', 2)
+        start = time.perf_counter()
+        moved = deduplicated = failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for model, field in TARGETS:
+                storage = model._meta.get_field(field).storage
+                if not isinstance(storage, ContentAddressedStorage):
+                    self.stderr.write(f'{model.__name__}.{field} does not use ContentAddressedStorage, skipped')
+                    continue
+                rows = (
+                    model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                    .order_by('pk').values_list('pk', field, thumbnails.DERIVATIVE_FIELDS[field])
+                )
+                last_pk = 0
+                while True:
+                    batch = list(rows.filter(pk__gt=last_pk)[:options['batch_size']])
+                    if not batch:
+                        break
+                    last_pk = batch[-1][0]
+                    batch = [row for row in batch if not is_content_addressed(row[1])]
+                    # Hashing reads whole files and releases the GIL, the moves are cheap
+                    digests = pool.map(lambda row: _digest(storage.path(row[1])), batch)
+                    for (pk, name, derivatives), digest in zip(batch, digests):
+                        if isinstance(digest, Exception):
+                            failed += 1
+                            self.stderr.write(f'{model.__name__} {pk} ({name}): {digest}')
+                            continue
+                        existed = storage.exists(content_name(name, digest))
+                        if move_file(model, pk, field, name, derivatives, digest, options['keep_old']):
+                            moved += 1
+                            deduplicated += existed
+                    self.stdout.write(f'{model.__name__}: done up to id {last_pk} ({moved} moved, {failed} failed)')
+        
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} files in {elapsed:.1f}s, {deduplicated} of them duplicates of a stored file, {failed} failed'
+        ))
@@ -0,0 +1,100 @@
+"""
+Report clusters of near-identical photos across the whole archive.
+
+Photos without a perceptual hash yet (uploaded before duplicate detection)
+are hashed first in a process pool. Clusters are then built in memory with
+the same multi-index band lookup as core.duplicates. With --mark, every
+photo of a cluster but the first uploaded is flagged as its duplicate.
+
+    python manage.py photo_duplicates --workers 4 --json duplicates.json
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import multiprocessing
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.duplicates import clusters, hash_fields, max_distance
+from core.imaging import perceptual_hash
+from core.models import Photo
+
+
+class Command(BaseCommand):
+    help = 'Hash photos that have no perceptual hash yet and report duplicate clusters'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Processes (default THUMBNAIL_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Photos hashed per batch')
+        parser.add_argument('--threshold', type=int, default=None,
+                            help='Maximum differing bits (default PHOTO_DUPLICATE_DISTANCE)')
+        parser.add_argument('--mark', action='store_true', help='Flag all but the first photo of each cluster')
+        parser.add_argument('--json', help='Write the clusters to this file')
+    
+    def handle(self, *args, **options):
+        threshold = max_distance() if options['threshold'] is None else options['threshold']
+        self.hash_missing(options['workers'] or getattr(settings, 'THUMBNAIL_WORKERS', 2), options['batch_size'])
+        
+        hashes = list(Photo.objects.filter(dhash__isnull=False).values_list('pk', 'dhash'))
+        groups = clusters(hashes, threshold)
+        photos = Photo.objects.select_related('user', 'album').in_bulk([pk for group in groups for pk in group])
+        storage = Photo._meta.get_field('image').storage
+        
+        report = []
+        wasted = 0
+        for group in groups:
+            members = []
+            for pk in group:
+                photo = photos[pk]
+                try:
+                    size = os.path.getsize(storage.path(photo.image.name))
+                except OSError:
+                    size = 0
+                members.append({
+                    'id': pk,
+                    'image': photo.image.name,
+                    'album': photo.album.name if photo.album else None,
+                    'user': photo.user.username,
+                    'bytes': size,
+                })
+            wasted += sum(member['bytes'] for member in members[1:])
+            report.append(members)
+            self.stdout.write(f'Cluster of {len(members)}:')
+            for member in members:
+                self.stdout.write(f'  #{member["id"]} {member["image"]} ({member["album"] or "no album"}, {member["user"]})')
+            if options['mark']:
+                Photo.objects.filter(pk__in=group[1:]).update(duplicate_of=group[0])
+        
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'threshold': threshold, 'clusters': report}, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(groups)} clusters, {sum(len(group) - 1 for group in groups)} duplicates '
+            f'using {wasted / 1024 / 1024:.1f} MB (threshold {threshold} bits, {len(hashes)} photos)'
+        ))
+    
+    def hash_missing(self, workers, batch_size):
+        storage = Photo._meta.get_field('image').storage
+        rows = (
+            Photo.objects.filter(dhash__isnull=True).exclude(image__isnull=True).exclude(image='')
+            .order_by('pk').values_list('pk', 'image')
+        )
+        last_pk = 0
+        hashed = 0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            while True:
+                batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                futures = {pool.submit(perceptual_hash, storage.path(name)): (pk, name) for pk, name in batch}
+                for future in as_completed(futures):
+                    pk, name = futures[future]
+                    try:
+                        Photo.objects.filter(pk=pk, image=name).update(**hash_fields(future.result()))
+                        hashed += 1
+                    except Exception as e:
+                        self.stderr.write(f'Photo {pk} ({name}): {e}')
+                last_pk = batch[-1][0]
+        if hashed:
+            self.stdout.write(f'Hashed {hashed} photos')
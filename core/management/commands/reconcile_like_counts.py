@@ -0,0 +1,21 @@
+"""
+Fix drift of Photo.like_count, e.g. after users with likes were deleted.
+Cheap enough to run daily from cron.
+"""
+from django.core.management.base import BaseCommand
+
+from core.likes import reconcile_like_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount Photo.like_count where it differs from the number of likes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted photos')
+    
+    def handle(self, *args, **options):
+        drifted = reconcile_like_counts(dry_run=options['dry_run'])
+        for photo_id, stored, actual in drifted:
+            self.stdout.write(f'Photo {photo_id}: stored {stored}, actual {actual}')
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(drifted)} photos with a wrong like count'))
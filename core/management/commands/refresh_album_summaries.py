@@ -0,0 +1,49 @@
+"""
+Recount the photo and sub-album counts and latest upload of every album and
+render the mosaic covers that are missing or out of date. Adding and
+removing photos keeps them current by themselves (core.summaries); this
+fills them in for existing albums and fixes drift, e.g. after photos were
+moved with a bulk UPDATE.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import uploads
+from core.imaging import render_mosaic
+from core.models import Album
+from core.summaries import COVER_SIZE, cover_target, pending_cover, store_cover, summary_fields
+from core.thumbnails import render_options
+
+
+class Command(BaseCommand):
+    help = 'Recount album summaries and render missing mosaic covers'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--no-covers', action='store_true', help='Only recount, render no covers')
+    
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = Album.objects.update(**summary_fields())
+        rendered = failed = 0
+        if not options['no_covers']:
+            preset = render_options()['preset']
+            for album_id in Album.objects.order_by('pk').values_list('pk', flat=True).iterator():
+                pending = pending_cover(album_id)
+                if pending is None:
+                    continue
+                photo_ids, paths = pending
+                target = cover_target()
+                try:
+                    render_mosaic(paths, target, COVER_SIZE, preset)
+                    store_cover(album_id, photo_ids, target)
+                    rendered += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Album {album_id}: {e}')
+                finally:
+                    uploads.remove_file(target)
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {count} albums, rendered {rendered} covers ({failed} failed) '
+            f'in {time.perf_counter() - start:.1f}s'
+        ))
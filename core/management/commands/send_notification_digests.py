@@ -0,0 +1,17 @@
+"""
+Daily digest - run once a day from cron.
+
+Users with UserProfile.notification_digest get all notification emails
+held since the last run merged into one email.
+"""
+from django.core.management.base import BaseCommand
+
+from core.outbox import send_digests
+
+
+class Command(BaseCommand):
+    help = 'Send daily notification digest emails'
+    
+    def handle(self, *args, **options):
+        sent = send_digests()
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} digest emails'))
@@ -0,0 +1,85 @@
+"""
+Outbox worker - delivers queued email, SMS and WhatsApp notifications.
+
+Run it from cron with --once, or as a long-running process. Several
+instances can run side by side, deliveries are leased so none is sent twice.
+"""
+import os
+import socket
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+import logging
+
+from core.outbox import process_deliveries
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued notifications from the outbox'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker threads')
+        parser.add_argument('--batch-size', type=int, default=None, help='Deliveries claimed per batch (default NOTIFICATION_BATCH_SIZE)')
+        parser.add_argument('--lease-seconds', type=int, default=None, help='How long a claimed batch stays leased')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox has no due deliveries')
+    
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        self.processed = 0
+        self.failed = False
+        self.lock = threading.Lock()
+        
+        worker_prefix = f'{socket.gethostname()}:{os.getpid()}'
+        threads = [
+            threading.Thread(target=self.run_worker, args=(f'{worker_prefix}:{n}', options), daemon=True)
+            for n in range(max(options['workers'], 1))
+        ]
+        for thread in threads:
+            thread.start()
+        
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping workers...')
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+        
+        if self.failed:
+            raise CommandError(f'Processing failed after {self.processed} deliveries, see the log')
+        self.stdout.write(self.style.SUCCESS(f'Processed {self.processed} deliveries'))
+    
+    def run_worker(self, worker_id, options):
+        try:
+            while not self.stop.is_set():
+                try:
+                    close_old_connections()
+                    count = process_deliveries(
+                        worker_id,
+                        limit=options['batch_size'],
+                        lease_seconds=options['lease_seconds'],
+                    )
+                except Exception:
+                    logger.exception(f'Worker {worker_id} failed to process deliveries')
+                    if options['once']:
+                        # A cron run must not spin on a broken outbox, the next run tries again
+                        self.failed = True
+                        break
+                    # Keep the worker alive, leased deliveries are retried once the lease expires
+                    self.stop.wait(options['poll_interval'])
+                    continue
+                with self.lock:
+                    self.processed += count
+                if count:
+                    continue
+                if options['once']:
+                    break
+                self.stop.wait(options['poll_interval'])
+        finally:
+            connection.close()
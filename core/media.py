@@ -0,0 +1,235 @@
+"""
+Serving uploaded media in production
+
+Every file under MEDIA_URL goes through a view that finds the photo or
+album the file belongs to and checks Album.can_view, so private albums stay
+private even if a URL leaks. Responses carry ETag and Last-Modified and
+answer conditional requests with 304, support single byte ranges (206) for
+resuming and seeking, and are cacheable by the browser only:
+    - versioned derivatives (?v=..., see thumbnails) for a year, immutable,
+    - everything else for MEDIA_CACHE_SECONDS, then revalidated.
+
+With MEDIA_SENDFILE = 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache,
+lighttpd), Django only checks permissions and headers and the web server
+sends the bytes from MEDIA_ACCEL_REDIRECT_PREFIX / the file path.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from . import thumbnails
+from .imaging import FORMATS
+from .models import Album, Photo
+from .uploads import IMAGE_EXTENSIONS
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+READ_CHUNK_SIZE = 256 * 1024
+
+# Media path prefix -> (model, image field), see the upload_to of the fields
+OWNERS = {
+    'photos/': (Photo, 'image'),
+    'albums/covers/': (Album, 'cover'),
+    'albums/intro/': (Album, 'intro_photo'),
+}
+
+
+def cache_seconds():
+    return getattr(settings, 'MEDIA_CACHE_SECONDS', 60 * 60)
+
+
+def sendfile_mode():
+    """None, 'x-sendfile' or 'x-accel-redirect'"""
+    return getattr(settings, 'MEDIA_SENDFILE', None)
+
+
+def derivative_root(path):
+    """'photos/trip.grid.webp' -> 'photos/trip', None if path is not named like a derivative"""
+    root, ext = os.path.splitext(path)
+    root, size = os.path.splitext(root)
+    if size[1:] in thumbnails.get_sizes() and ext in {extension for extension, _ in FORMATS.values()}:
+        return root
+    return None
+
+
+def original_names(path):
+    """
+    Storage names the file at path may belong to: itself, and for a
+    derivative (photos/trip.grid.webp) the originals it can be rendered from.
+    """
+    names = [path]
+    root = derivative_root(path)
+    if root:
+        names += [f'{root}{extension}' for extension in IMAGE_EXTENSIONS]
+        names += [f'{root}{extension.upper()}' for extension in IMAGE_EXTENSIONS]
+    return names
+
+
+def find_owners(path):
+    """
+    Photos or Albums a media file belongs to. Content-addressed files
+    (core.storage) can be shared by several.
+    
+    Returns:
+        list: Photo or Album objects, empty if the file is not an image of either
+    """
+    prefix = next((prefix for prefix in OWNERS if path.startswith(prefix)), None)
+    if prefix is None:
+        return []
+    model, field = OWNERS[prefix]
+    candidates = model.objects.filter(**{f'{field}__in': original_names(path)})
+    if model is Photo:
+        candidates = candidates.select_related('album')
+    return [
+        owner for owner in candidates
+        if getattr(owner, field).name == path or any(
+            thumbnails.thumbnail_name(getattr(owner, field).name, size, format) == path
+            for size in thumbnails.get_sizes() for format in FORMATS
+        )
+    ]
+
+
+def can_view(owners, user):
+    """The user may see at least one of the owners"""
+    for owner in owners:
+        album = owner if isinstance(owner, Album) else owner.album
+        # Photos outside albums are visible to every signed-in user, like the gallery
+        if album is None or album.can_view(user):
+            return True
+    return False
+
+
+class _RangeFile:
+    """Read at most length bytes of a file, starting at its current position"""
+    
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+    
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+    
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    A single 'bytes=' range. Multiple ranges are answered with the whole
+    file, which RFC 9110 allows.
+    
+    Returns:
+        tuple: (start, end inclusive), None to send everything, or False if unsatisfiable
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve(request, path, full_path):
+    """
+    Response for a permission-checked media file, conditional, with Range and caching.
+    """
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{size:x}')
+    
+    cache_control = f'private, max-age={cache_seconds()}'
+    if request.GET.get('v') and derivative_root(path):
+        # The URL changes whenever the derivative is rendered again
+        cache_control = f'private, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        return response
+    
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+    
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    mode = sendfile_mode()
+    if mode:
+        # The web server sends the bytes and handles Range itself
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel-redirect':
+            prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            # nginx decodes the URI, and a header can't carry non-latin-1 names
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(path)
+        else:
+            response['X-Sendfile'] = full_path
+        return finish(response)
+    
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.headers.get('Range'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+    
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        return finish(FileResponse(file, content_type=content_type))
+    start, end = byte_range
+    file.seek(start)
+    response = FileResponse(_RangeFile(file, end - start + 1), status=206, content_type=content_type)
+    response.block_size = READ_CHUNK_SIZE
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return finish(response)
+
+
+def media_path(path):
+    """
+    Absolute path of a media file, refusing paths outside MEDIA_ROOT.
+    
+    Raises:
+        Http404
+    """
+    try:
+        return safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
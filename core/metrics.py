@@ -0,0 +1,55 @@
+"""
+Lightweight delivery counters kept in the cache backend
+
+Counters are bucketed per minute, so totals over the last few minutes give
+throughput without any extra tables.
+"""
+import time
+
+from django.core.cache import cache
+
+BUCKET_SECONDS = 60
+RETENTION_SECONDS = 24 * 60 * 60
+
+COUNTERS = ['sent', 'failed', 'throttled', 'dropped']
+CHANNELS = ['email', 'sms', 'whatsapp']
+
+
+def _key(channel, name, bucket):
+    return f'metrics:{channel}:{name}:{bucket}'
+
+
+def incr(channel, name, amount=1):
+    """Add to a counter in the current minute bucket"""
+    if not amount:
+        return
+    key = _key(channel, name, int(time.time() // BUCKET_SECONDS))
+    cache.add(key, 0, RETENTION_SECONDS)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Expired between add and incr
+        cache.set(key, amount, RETENTION_SECONDS)
+
+
+def get_metrics(window_minutes=5):
+    """
+    Totals and per-minute rates for every channel over the last window_minutes.
+    
+    Returns:
+        dict: {channel: {counter: total, 'sent_per_minute': float}}
+    """
+    current = int(time.time() // BUCKET_SECONDS)
+    buckets = range(current - window_minutes + 1, current + 1)
+    keys = [_key(channel, name, bucket) for channel in CHANNELS for name in COUNTERS for bucket in buckets]
+    values = cache.get_many(keys)
+    
+    metrics = {'window_minutes': window_minutes}
+    for channel in CHANNELS:
+        channel_metrics = {
+            name: sum(values.get(_key(channel, name, bucket), 0) for bucket in buckets)
+            for name in COUNTERS
+        }
+        channel_metrics['sent_per_minute'] = round(channel_metrics['sent'] / window_minutes, 2)
+        metrics[channel] = channel_metrics
+    return metrics
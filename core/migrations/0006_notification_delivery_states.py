@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0005_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='email_status',
+            field=models.CharField(blank=True, choices=[('', 'Not used'), ('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='sms_status',
+            field=models.CharField(blank=True, choices=[('', 'Not used'), ('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='whatsapp_status',
+            field=models.CharField(blank=True, choices=[('', 'Not used'), ('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+    ]
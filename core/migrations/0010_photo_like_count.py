@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_likes(apps, schema_editor):
+    Photo = apps.get_model('core', 'Photo')
+    PhotoLike = apps.get_model('core', 'PhotoLike')
+    likes = (
+        PhotoLike.objects.filter(photo=OuterRef('pk')).order_by()
+        .values('photo').annotate(count=Count('id')).values('count')
+    )
+    Photo.objects.update(like_count=Coalesce(Subquery(likes, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0009_photo_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0010_photo_like_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='photo_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['-like_count', '-uploaded_at', '-id'], name='photo_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['album', 'sub_album', '-uploaded_at', '-id'], name='photo_album_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['sub_album', '-uploaded_at', '-id'], name='photo_sub_album_idx'),
+        ),
+    ]
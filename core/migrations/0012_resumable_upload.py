@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0011_photo_gallery_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumableUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('length', models.BigIntegerField(help_text='Total size in bytes')),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes received so far')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='resumableupload',
+            name='album',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumable_uploads', to='core.album'),
+        ),
+        migrations.AddField(
+            model_name='resumableupload',
+            name='photo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.photo'),
+        ),
+        migrations.AddField(
+            model_name='resumableupload',
+            name='sub_album',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumable_uploads', to='core.subalbum'),
+        ),
+        migrations.AddField(
+            model_name='resumableupload',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumable_uploads', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='resumableupload',
+            index=models.Index(fields=['updated_at'], name='resumable_upload_updated_idx'),
+        ),
+    ]
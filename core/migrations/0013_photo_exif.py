@@ -0,0 +1,93 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_upload_time(apps, schema_editor):
+    # Until extract_photo_metadata reads the EXIF, the upload time is the best guess
+    Photo = apps.get_model('core', 'Photo')
+    Photo.objects.update(taken_at=F('uploaded_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0012_resumable_upload'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='photo',
+            name='photo_album_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='photo',
+            name='photo_sub_album_idx',
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='camera_make',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='camera_model',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='exif_extracted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='orientation',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, help_text='EXIF orientation of the uploaded file', null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='taken_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Capture time from EXIF, upload time if unknown'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(copy_upload_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['album', 'sub_album', 'taken_at', 'id'], name='photo_album_taken_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['sub_album', 'taken_at', 'id'], name='photo_sub_album_taken_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['camera_make', 'camera_model'], name='photo_camera_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['latitude', 'longitude'], name='photo_location_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0013_photo_exif'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='dhash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='dhash_band0',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='dhash_band1',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='dhash_band2',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='dhash_band3',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Earlier photo in the album this one looks like', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='core.photo'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['dhash_band0'], name='photo_dhash_band0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['dhash_band1'], name='photo_dhash_band1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['dhash_band2'], name='photo_dhash_band2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['dhash_band3'], name='photo_dhash_band3_idx'),
+        ),
+    ]
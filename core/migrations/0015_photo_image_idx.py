@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0014_photo_dhash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['image'], name='photo_image_idx'),
+        ),
+    ]
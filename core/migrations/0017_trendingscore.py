@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def score_existing_likes(apps, schema_editor):
+    from core.trending import like_weight, logaddexp
+    
+    PhotoLike = apps.get_model('core', 'PhotoLike')
+    TrendingScore = apps.get_model('core', 'TrendingScore')
+    scores = {}
+    for photo_id, created_at in PhotoLike.objects.order_by().values_list('photo_id', 'created_at').iterator():
+        weight = like_weight(created_at)
+        scores[photo_id] = logaddexp(scores[photo_id], weight) if photo_id in scores else weight
+    TrendingScore.objects.bulk_create(
+        [TrendingScore(photo_id=photo_id, score=score) for photo_id, score in scores.items()], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0016_storedblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('photo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='core.photo')),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='photo',
+            name='photo_popular_idx',
+        ),
+        migrations.AddIndex(
+            model_name='trendingscore',
+            index=models.Index(fields=['-score', '-photo'], name='trending_score_idx'),
+        ),
+        migrations.RunPython(score_existing_likes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_existing(apps, schema_editor):
+    Album = apps.get_model('core', 'Album')
+    Photo = apps.get_model('core', 'Photo')
+    SubAlbum = apps.get_model('core', 'SubAlbum')
+    photos = Photo.objects.filter(album=models.OuterRef('pk')).order_by()
+    sub_albums = SubAlbum.objects.filter(parent_album=models.OuterRef('pk')).order_by()
+    Album.objects.update(
+        photo_count=Coalesce(models.Subquery(
+            photos.values('album').annotate(count=models.Count('pk')).values('count')
+        ), 0),
+        sub_album_count=Coalesce(models.Subquery(
+            sub_albums.values('parent_album').annotate(count=models.Count('pk')).values('count')
+        ), 0),
+        latest_upload_at=models.Subquery(photos.order_by('-uploaded_at').values('uploaded_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+    
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0017_trendingscore'),
+    ]
+    
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='albums/covers/'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='cover_photo_ids',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='latest_upload_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='photo_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='sub_album_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        # Covers are rendered by refresh_album_summaries
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
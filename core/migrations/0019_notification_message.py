@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_messages(apps, schema_editor):
+    Notification = apps.get_model('core', 'Notification')
+    NotificationDelivery = apps.get_model('core', 'NotificationDelivery')
+    Notification.objects.filter(pk__in=NotificationDelivery.objects.values('notification')).update(notification_message=models.Subquery(
+        NotificationDelivery.objects.filter(notification=models.OuterRef('pk')).order_by('-id').values('message')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0018_album_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='notification_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='core.notificationmessage'),
+        ),
+        migrations.RunPython(link_messages, migrations.RunPython.noop),
+    ]
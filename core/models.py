@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -16,6 +18,7 @@ class UserProfile(models.Model):
     notify_weather_alerts = models.BooleanField(default=True)
     notify_whatsapp = models.BooleanField(default=False)
     notify_app = models.BooleanField(default=True)
+    notification_digest = models.BooleanField(default=False, help_text="Send notification emails as one daily digest")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -96,6 +99,28 @@ class EventItinerary(models.Model):
         return f"{self.event.title} - {self.description}"
 
 
+class AlbumQuerySet(models.QuerySet):
+    """Album.can_view as SQL, so lists of albums are filtered in one query"""
+    
+    def with_attendance(self, user):
+        """Annotate user_attended: the user voted yes for the album's event. Album.can_view uses it."""
+        if not user.is_authenticated:
+            return self.annotate(user_attended=models.Value(False))
+        return self.annotate(user_attended=models.Exists(
+            EventVote.objects.filter(event=models.OuterRef('event'), user=user, vote=True)
+        ))
+    
+    def visible_to(self, user):
+        """Albums the user can view"""
+        if not user.is_authenticated:
+            return self.filter(visibility='all_users')
+        return self.with_attendance(user).filter(
+            models.Q(owner=user)
+            | models.Q(visibility='all_users')
+            | models.Q(visibility='event_attendees', user_attended=True)
+        )
+
+
 class Album(models.Model):
     """Photo album with intro photo, date, description, and visibility settings"""
     VISIBILITY_CHOICES = [
@@ -107,12 +132,23 @@ class Album(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     intro_photo = models.ImageField(upload_to='albums/intro/', blank=True, null=True, help_text="Úvodní/obálková fotka")
+    # Rendered thumbnails of intro_photo, see core.thumbnails
+    intro_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     date = models.DateField(null=True, blank=True)
     event = models.ForeignKey(Event, on_delete=models.SET_NULL, null=True, blank=True, related_name='albums')
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_albums')
     visibility = models.CharField(max_length=20, choices=VISIBILITY_CHOICES, default='event_attendees')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Summary for the album grid, kept up to date by core.summaries
+    photo_count = models.PositiveIntegerField(default=0, editable=False)
+    sub_album_count = models.PositiveIntegerField(default=0, editable=False)
+    latest_upload_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Mosaic of the first photos, shown when there is no intro_photo
+    cover = models.ImageField(upload_to='albums/covers/', blank=True, null=True, editable=False)
+    cover_photo_ids = models.JSONField(default=list, blank=True, editable=False)
+    
+    objects = AlbumQuerySet.as_manager()
     
     class Meta:
         ordering = ['-date', '-created_at']
@@ -121,16 +157,21 @@ class Album(models.Model):
         return self.name
     
     def can_view(self, user):
-        """Check if user can view this album"""
-        if self.owner == user:
+        """
+        Check if user can view this album. No query for albums loaded with
+        Album.objects.with_attendance(user) or visible_to(user), at most one otherwise.
+        """
+        if user.is_authenticated and self.owner_id == user.id:
             return True
         if self.visibility == 'all_users':
             return True
         if self.visibility == 'private':
             return False
-        if self.visibility == 'event_attendees' and self.event:
+        if self.visibility == 'event_attendees' and self.event_id and user.is_authenticated:
+            if hasattr(self, 'user_attended'):
+                return self.user_attended
             # Check if user attended the event
-            return EventVote.objects.filter(event=self.event, user=user, vote=True).exists()
+            return EventVote.objects.filter(event_id=self.event_id, user=user, vote=True).exists()
         return False
 
 
@@ -156,9 +197,49 @@ class Photo(models.Model):
     sub_album = models.ForeignKey(SubAlbum, on_delete=models.CASCADE, related_name='photos', null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_photos')
     image = models.ImageField(upload_to='photos/', blank=True, null=True)
+    # Rendered thumbnails of image, see core.thumbnails
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
     album_link = models.URLField(blank=True, help_text="Link to external photo album")
     caption = models.TextField(blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Number of PhotoLike rows, maintained by core.likes
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    # Read from the image's EXIF in the background after upload, see core.exif
+    taken_at = models.DateTimeField(default=timezone.now, help_text="Capture time from EXIF, upload time if unknown")
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    orientation = models.PositiveSmallIntegerField(null=True, blank=True, editable=False,
+                                                   help_text="EXIF orientation of the uploaded file")
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    camera_make = models.CharField(max_length=100, blank=True, editable=False)
+    camera_model = models.CharField(max_length=100, blank=True, editable=False)
+    exif_extracted = models.BooleanField(default=False, editable=False)
+    # Perceptual hash, split into 16-bit bands for multi-index Hamming search, see core.duplicates
+    dhash = models.BigIntegerField(null=True, blank=True, editable=False)
+    dhash_band0 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dhash_band1 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dhash_band2 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    dhash_band3 = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates',
+                                     help_text="Earlier photo in the album this one looks like")
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination of the gallery sections, see core.gallery
+            models.Index(fields=['-uploaded_at', '-id'], name='photo_recent_idx'),
+            models.Index(fields=['album', 'sub_album', 'taken_at', 'id'], name='photo_album_taken_idx'),
+            models.Index(fields=['sub_album', 'taken_at', 'id'], name='photo_sub_album_taken_idx'),
+            # Filtering by camera and location
+            models.Index(fields=['camera_make', 'camera_model'], name='photo_camera_idx'),
+            models.Index(fields=['latitude', 'longitude'], name='photo_location_idx'),
+            models.Index(fields=['dhash_band0'], name='photo_dhash_band0_idx'),
+            models.Index(fields=['dhash_band1'], name='photo_dhash_band1_idx'),
+            models.Index(fields=['dhash_band2'], name='photo_dhash_band2_idx'),
+            models.Index(fields=['dhash_band3'], name='photo_dhash_band3_idx'),
+            # Permission check of media requests by file name, see core.media
+            models.Index(fields=['image'], name='photo_image_idx'),
+        ]
     
     def __str__(self):
         if self.album:
@@ -167,7 +248,7 @@ class Photo(models.Model):
     
     def get_like_count(self):
         """Get the number of likes for this photo"""
-        return self.likes.count()
+        return self.like_count
     
     def is_liked_by(self, user):
         """Check if a user has liked this photo"""
@@ -190,6 +271,60 @@ class PhotoLike(models.Model):
         return f"{self.user.username} likes {self.photo.id}"
 
 
+class TrendingScore(models.Model):
+    """Time-decayed like score of a photo with at least one like, see core.trending"""
+    photo = models.OneToOneField(Photo, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    # log of the sum of the likes' weights, comparable between photos at any time
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination of the trending section, see core.gallery
+            models.Index(fields=['-score', '-photo'], name='trending_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.photo_id}: {self.score:.3f}"
+
+
+class ResumableUpload(models.Model):
+    """Photo uploaded in chunks that can be resumed after a dropped connection, see core.resumable"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='resumable_uploads')
+    album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name='resumable_uploads')
+    sub_album = models.ForeignKey(SubAlbum, on_delete=models.CASCADE, related_name='resumable_uploads', null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    length = models.BigIntegerField(help_text="Total size in bytes")
+    offset = models.BigIntegerField(default=0, help_text="Bytes received so far")
+    photo = models.ForeignKey(Photo, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='resumable_upload_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.length})"
+    
+    @property
+    def is_complete(self):
+        return self.offset == self.length
+
+
+class StoredBlob(models.Model):
+    """Content-addressed media file and how many fields refer to it, see core.storage"""
+    name = models.CharField(max_length=255, unique=True, help_text="Storage name, e.g. photos/3f/a2/<sha256>.jpg")
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.refcount}x)"
+
+
 class MapLocation(models.Model):
     """Maps for planning trips, saving to backlog (e.g., Ferraty)"""
     LOCATION_TYPES = [
@@ -355,6 +490,12 @@ class Notification(models.Model):
         ('debt', 'Debt Settlement'),
         ('other', 'Other'),
     ]
+    DELIVERY_STATES = [
+        ('', 'Not used'),
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
@@ -363,11 +504,76 @@ class Notification(models.Model):
     read = models.BooleanField(default=False)
     sent_whatsapp = models.BooleanField(default=False)
     sent_app = models.BooleanField(default=False)
+    # Outbox delivery state per channel
+    email_status = models.CharField(max_length=10, choices=DELIVERY_STATES, blank=True, default='')
+    sms_status = models.CharField(max_length=10, choices=DELIVERY_STATES, blank=True, default='')
+    whatsapp_status = models.CharField(max_length=10, choices=DELIVERY_STATES, blank=True, default='')
+    # Latest fan-out shown by this notification, see core.emails
+    notification_message = models.ForeignKey(
+        'NotificationMessage', on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications',
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Unread counter and keyset pages of the notifications view
+            models.Index(fields=['user', 'read'], name='notification_unread_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_feed_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
 
+
+
+class NotificationMessage(models.Model):
+    """Rendered notification content shared by all deliveries of one fan-out"""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='notification_messages', null=True, blank=True)
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    reason = models.CharField(max_length=20, blank=True)
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    short_body = models.TextField(blank=True, help_text="Short text for SMS/WhatsApp")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.subject
+
+
+class NotificationDelivery(models.Model):
+    """Outbox row - delivery of one message to one user over one channel"""
+    CHANNELS = [
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+        ('whatsapp', 'WhatsApp'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('digest', 'Waiting for daily digest'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    message = models.ForeignKey(NotificationMessage, on_delete=models.CASCADE, related_name='deliveries')
+    notification = models.ForeignKey(Notification, on_delete=models.SET_NULL, null=True, blank=True, related_name='deliveries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_deliveries')
+    channel = models.CharField(max_length=20, choices=CHANNELS)
+    address = models.CharField(max_length=254, help_text="Email address or E.164 phone number")
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    leased_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='delivery_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.channel} to {self.address} ({self.status})"
@@ -0,0 +1,241 @@
+"""
+Garbage collection of media files no row refers to any more
+
+Photos deleted or cascaded away with their event or album, and replaced
+album intro photos, leave their files and thumbnails behind. collect()
+finds them without holding either side in memory:
+    1. The names in every FileField are streamed from the database into a
+       Bloom filter, by file root (photos/trip for photos/trip.jpg), so
+       thumbnails (photos/trip.grid.webp) match their original.
+    2. The upload directories are walked with os.scandir; files whose root
+       is in the filter are kept. A false positive only keeps an orphan.
+    3. The few remaining candidates are checked exactly against the
+       database and moved to MEDIA_ROOT/quarantine/, keeping their path.
+    4. Quarantined files older than MEDIA_GC_GRACE_DAYS are deleted.
+Files younger than MEDIA_GC_MIN_AGE_HOURS are never touched, their row may
+not be committed yet. Moving a file back out of the quarantine restores it.
+"""
+from datetime import timedelta
+import hashlib
+import math
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import FileField, Q
+import logging
+
+from .media import derivative_root
+from .models import StoredBlob
+from .storage import is_content_addressed
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_DIR = 'quarantine'
+
+
+def grace_period():
+    return timedelta(days=getattr(settings, 'MEDIA_GC_GRACE_DAYS', 7))
+
+
+def min_age():
+    return timedelta(hours=getattr(settings, 'MEDIA_GC_MIN_AGE_HOURS', 24))
+
+
+class BloomFilter:
+    """
+    Set of strings in a fixed number of bits: no false negatives, false
+    positives at about error_rate once capacity keys were added.
+    """
+    
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, key):
+        # Two 64-bit halves of one digest give all positions (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * step) % self.size for i in range(self.hash_count))
+    
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+    
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def file_root(name):
+    """'photos/trip.jpg' and 'photos/trip.grid.webp' -> 'photos/trip'"""
+    return derivative_root(name) or os.path.splitext(name)[0]
+
+
+def file_fields():
+    """(model, field name) of every FileField"""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, FileField)
+    ]
+
+
+def upload_directories():
+    """Directories below MEDIA_ROOT the file fields upload to, the only ones collected"""
+    directories = set()
+    for model, field in file_fields():
+        upload_to = model._meta.get_field(field).upload_to
+        if isinstance(upload_to, str) and upload_to.strip('/'):
+            directories.add(upload_to.strip('/').split('%')[0].rstrip('/'))
+    return sorted(directories)
+
+
+def _names(model, field):
+    return model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).values_list(field, flat=True)
+
+
+def referenced_roots(error_rate=0.001):
+    """Bloom filter of the roots of all file names in the database, read in chunks"""
+    fields = file_fields()
+    bloom = BloomFilter(sum(_names(model, field).count() for model, field in fields), error_rate)
+    for model, field in fields:
+        for name in _names(model, field).iterator(chunk_size=2000):
+            bloom.add(file_root(name))
+    return bloom
+
+
+def _root_filter(field, root):
+    # Names starting with 'root.' sort between 'root.' and 'root/' ('/' follows '.'), an index range scan
+    return Q(**{field: root}) | Q(**{f'{field}__gte': f'{root}.', f'{field}__lt': f'{root}/'})
+
+
+def is_referenced(root):
+    """Exact check: some row refers to a file with this root"""
+    return any(model.objects.filter(_root_filter(field, root)).exists() for model, field in file_fields())
+
+
+def walk_files(directory):
+    """Yield os.DirEntry of every file below directory; only the directories still to visit are kept"""
+    pending = [directory]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def quarantine_path(name):
+    return os.path.join(settings.MEDIA_ROOT, QUARANTINE_DIR, name)
+
+
+def _quarantine(path, name):
+    target = quarantine_path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    # The grace period counts from now
+    os.utime(target)
+
+
+def collect(dry_run=False, error_rate=0.001, now=None):
+    """
+    Move unreferenced media files to the quarantine and delete quarantined
+    files past the grace period.
+    
+    Returns:
+        dict: scanned, quarantined, quarantined_bytes, purged, purged_bytes
+    """
+    now = now or time.time()
+    young = now - min_age().total_seconds()
+    stats = {'scanned': 0, 'quarantined': 0, 'quarantined_bytes': 0, 'purged': 0, 'purged_bytes': 0}
+    roots = referenced_roots(error_rate)
+    media_root = str(settings.MEDIA_ROOT)
+    
+    for directory in upload_directories():
+        for entry in walk_files(os.path.join(media_root, directory)):
+            stats['scanned'] += 1
+            name = os.path.relpath(entry.path, media_root).replace(os.sep, '/')
+            root = file_root(name)
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > young or root in roots:
+                continue
+            with transaction.atomic():
+                # Content-addressed files can gain a reference at any time (core.storage), lock them first
+                blobs = StoredBlob.objects.select_for_update().filter(_root_filter('name', root))
+                blob_ids = list(blobs.values_list('pk', flat=True))
+                try:
+                    if os.stat(entry.path).st_mtime > young or is_referenced(root):
+                        continue
+                except FileNotFoundError:
+                    continue
+                stats['quarantined'] += 1
+                stats['quarantined_bytes'] += stat.st_size
+                if dry_run:
+                    logger.info(f'Would quarantine {name}')
+                    continue
+                StoredBlob.objects.filter(pk__in=blob_ids).delete()
+                _quarantine(entry.path, name)
+                logger.info(f'Quarantined {name}')
+    
+    expired = now - grace_period().total_seconds()
+    quarantine = os.path.join(media_root, QUARANTINE_DIR)
+    for entry in walk_files(quarantine):
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime < expired:
+            stats['purged'] += 1
+            stats['purged_bytes'] += stat.st_size
+            if not dry_run:
+                os.remove(entry.path)
+    if not dry_run:
+        _remove_empty_directories(quarantine)
+    return stats
+
+
+def _remove_empty_directories(directory):
+    for path, _, _ in sorted(os.walk(directory), key=lambda item: -len(item[0])):
+        if path != directory:
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+
+
+def restore(prefix=''):
+    """
+    Move quarantined files whose name starts with prefix back, unless a file
+    of the same name exists again.
+    
+    Returns:
+        int: Files restored
+    """
+    media_root = str(settings.MEDIA_ROOT)
+    quarantine = os.path.join(media_root, QUARANTINE_DIR)
+    restored = 0
+    for entry in walk_files(quarantine):
+        name = os.path.relpath(entry.path, quarantine).replace(os.sep, '/')
+        target = os.path.join(media_root, name)
+        if not name.startswith(prefix) or os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(entry.path, target)
+        if is_content_addressed(name) and not derivative_root(name):
+            references = sum(model.objects.filter(**{field: name}).count() for model, field in file_fields())
+            StoredBlob.objects.update_or_create(
+                name=name, defaults={'size': os.path.getsize(target), 'refcount': references},
+            )
+        restored += 1
+    _remove_empty_directories(quarantine)
+    return restored
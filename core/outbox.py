@@ -0,0 +1,289 @@
+"""
+Notification outbox - claiming and delivering queued NotificationDelivery rows
+"""
+from datetime import timedelta
+import logging
+import random
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .emails import send_pooled_emails
+from .models import NotificationDelivery, NotificationMessage, Notification
+from .sms import Throttled, send_sms_many, send_whatsapp_many
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff for the given number of attempts already made.
+    Jittered, so deliveries that failed together don't all retry at the same moment.
+    """
+    base = _setting('NOTIFICATION_RETRY_BASE_SECONDS', 60)
+    cap = _setting('NOTIFICATION_RETRY_MAX_SECONDS', 3600)
+    delay = min(base * 2 ** max(attempts - 1, 0), cap)
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def claim_deliveries(worker_id, limit=None, lease_seconds=None):
+    """
+    Lease up to `limit` due deliveries for this worker.
+    
+    Pending rows, and rows whose previous lease has expired (a worker died
+    mid-send), are claimed with a single conditional UPDATE, so several
+    workers can poll the same table without sending anything twice.
+    
+    Returns:
+        list: Claimed NotificationDelivery objects
+    """
+    limit = limit or _setting('NOTIFICATION_BATCH_SIZE', 50)
+    lease_seconds = lease_seconds or _setting('NOTIFICATION_LEASE_SECONDS', 300)
+    now = timezone.now()
+    due = (
+        Q(status='pending') | Q(status='sending', leased_until__lt=now)
+    ) & Q(next_attempt_at__lte=now)
+    
+    candidate_ids = list(
+        NotificationDelivery.objects.filter(due)
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not candidate_ids:
+        return []
+    
+    # Unique per claim so a lease can never be mistaken for an older one
+    token = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    NotificationDelivery.objects.filter(due, id__in=candidate_ids).update(
+        status='sending',
+        leased_by=token,
+        leased_until=now + timedelta(seconds=lease_seconds),
+        attempts=F('attempts') + 1,
+    )
+    deliveries = list(
+        NotificationDelivery.objects.filter(leased_by=token, status='sending').order_by('id')
+    )
+    # A fan-out shares one rendered message, load each only once for the whole batch
+    messages = NotificationMessage.objects.in_bulk({delivery.message_id for delivery in deliveries})
+    for delivery in deliveries:
+        delivery.message = messages[delivery.message_id]
+    return deliveries
+
+
+def send_phone_deliveries(channel, deliveries):
+    """
+    Send SMS or WhatsApp deliveries concurrently.
+    
+    Returns:
+        list: None for every sent delivery, Throttled for rate limited ones,
+            or the error it failed with
+    """
+    send_many = send_whatsapp_many if channel == 'whatsapp' else send_sms_many
+    results = send_many(
+        (delivery.address, delivery.message.short_body or delivery.message.subject)
+        for delivery in deliveries
+    )
+    errors = []
+    for result in results:
+        if result.ok:
+            errors.append(None)
+        elif result.retry_after is not None:
+            errors.append(Throttled(result.retry_after, result.error))
+        else:
+            errors.append(result.error)
+    return errors
+
+
+def send_email_deliveries(deliveries):
+    """
+    Send email deliveries over pooled SMTP connections.
+    
+    Returns:
+        list: None for every sent delivery, or the exception it failed with
+    """
+    from_email = _setting('DEFAULT_FROM_EMAIL', 'noreply@onlyfriends.com')
+    email_messages = [
+        EmailMessage(
+            subject=delivery.message.subject,
+            body=delivery.message.body,
+            from_email=from_email,
+            to=[delivery.address],
+        )
+        for delivery in deliveries
+    ]
+    return send_pooled_emails(email_messages)
+
+
+def _owned(delivery):
+    """Queryset matching the delivery only while this worker still holds its lease"""
+    return NotificationDelivery.objects.filter(id=delivery.id, leased_by=delivery.leased_by, status='sending')
+
+
+def mark_sent(deliveries):
+    """Record successful deliveries of one batch with a single UPDATE"""
+    if not deliveries:
+        return
+    NotificationDelivery.objects.filter(
+        id__in=[delivery.id for delivery in deliveries],
+        leased_by=deliveries[0].leased_by,
+        status='sending',
+    ).update(
+        status='sent',
+        sent_at=timezone.now(),
+        leased_until=None,
+        last_error='',
+    )
+    for delivery in deliveries:
+        metrics.incr(delivery.channel, 'sent')
+
+
+def mark_failed(delivery, error):
+    """
+    Schedule a retry with backoff, or give up after NOTIFICATION_MAX_ATTEMPTS.
+    
+    Returns:
+        bool: True if the delivery was given up on
+    """
+    max_attempts = _setting('NOTIFICATION_MAX_ATTEMPTS', 5)
+    if delivery.attempts >= max_attempts:
+        logger.error(f'Giving up on delivery {delivery.id} after {delivery.attempts} attempts: {error}')
+        metrics.incr(delivery.channel, 'dropped')
+        _owned(delivery).update(status='failed', leased_until=None, last_error=str(error)[:1000])
+        return True
+    logger.warning(f'Delivery {delivery.id} failed (attempt {delivery.attempts}), retrying: {error}')
+    metrics.incr(delivery.channel, 'failed')
+    _owned(delivery).update(
+        status='pending',
+        leased_until=None,
+        last_error=str(error)[:1000],
+        next_attempt_at=timezone.now() + retry_delay(delivery.attempts),
+    )
+    return False
+
+
+def update_notification_states(channel, sent, dropped):
+    """
+    Copy final delivery outcomes to the in-app Notification rows with one
+    bulk_update per channel.
+    """
+    status_field = f'{channel}_status'
+    fields = [status_field, 'sent_whatsapp'] if channel == 'whatsapp' else [status_field]
+    notifications = []
+    for deliveries, status in ((sent, 'sent'), (dropped, 'failed')):
+        for delivery in deliveries:
+            if not delivery.notification_id:
+                continue
+            notification = Notification(id=delivery.notification_id, **{status_field: status})
+            notification.sent_whatsapp = channel == 'whatsapp' and status == 'sent'
+            notifications.append(notification)
+    if notifications:
+        Notification.objects.bulk_update(notifications, fields)
+
+
+def mark_throttled(delivery, retry_after):
+    """Put a rate limited delivery back without using up one of its attempts"""
+    metrics.incr(delivery.channel, 'throttled')
+    jitter = random.uniform(0, 1 + retry_after / 2)
+    _owned(delivery).update(
+        status='pending',
+        leased_until=None,
+        attempts=F('attempts') - 1,
+        next_attempt_at=timezone.now() + timedelta(seconds=retry_after + jitter),
+    )
+
+
+def process_deliveries(worker_id, limit=None, lease_seconds=None):
+    """
+    Claim and deliver one batch.
+    
+    Returns:
+        int: Number of deliveries processed
+    """
+    deliveries = claim_deliveries(worker_id, limit=limit, lease_seconds=lease_seconds)
+    
+    for channel in ('email', 'sms', 'whatsapp'):
+        batch = [delivery for delivery in deliveries if delivery.channel == channel]
+        if not batch:
+            continue
+        if channel == 'email':
+            errors = send_email_deliveries(batch)
+        else:
+            errors = send_phone_deliveries(channel, batch)
+        
+        sent, dropped = [], []
+        for delivery, error in zip(batch, errors):
+            if error is None:
+                sent.append(delivery)
+            elif isinstance(error, Throttled):
+                mark_throttled(delivery, error.retry_after)
+            elif mark_failed(delivery, error):
+                dropped.append(delivery)
+        mark_sent(sent)
+        update_notification_states(channel, sent, dropped)
+    return len(deliveries)
+
+
+def send_digests():
+    """
+    Send every user who chose the daily digest one email with all notification
+    emails held for them, then mark those deliveries as sent.
+    
+    Returns:
+        int: Number of digest emails sent
+    """
+    held = list(
+        NotificationDelivery.objects.filter(status='digest', channel='email')
+        .select_related('message')
+        .order_by('user_id', 'created_at')
+    )
+    by_user = {}
+    for delivery in held:
+        by_user.setdefault(delivery.user_id, []).append(delivery)
+    if not by_user:
+        return 0
+    
+    from_email = _setting('DEFAULT_FROM_EMAIL', 'noreply@onlyfriends.com')
+    email_messages = []
+    for deliveries in by_user.values():
+        items = '\n\n'.join(
+            f'- {delivery.message.subject}\n{delivery.message.short_body}'
+            for delivery in deliveries
+        )
+        email_messages.append(EmailMessage(
+            subject=f'OnlyFriends: souhrn notifikací ({len(deliveries)})',
+            body=f"""Dobrý den,
+
+souhrn notifikací za poslední den:
+
+{items}
+
+S pozdravem,
+Tým OnlyFriends""",
+            from_email=from_email,
+            # Latest address, the user may have changed it since the first notification
+            to=[deliveries[-1].address],
+        ))
+    
+    sent_count = 0
+    for deliveries, error in zip(by_user.values(), send_pooled_emails(email_messages)):
+        if error is not None:
+            # Stays held and is retried with the next digest
+            logger.error(f'Failed to send digest to user {deliveries[0].user_id}: {error}')
+            metrics.incr('email', 'failed')
+            continue
+        NotificationDelivery.objects.filter(
+            id__in=[delivery.id for delivery in deliveries],
+            status='digest',
+        ).update(status='sent', sent_at=timezone.now(), attempts=F('attempts') + 1)
+        metrics.incr('email', 'sent', len(deliveries))
+        update_notification_states('email', deliveries, [])
+        sent_count += 1
+    return sent_count
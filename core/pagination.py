@@ -0,0 +1,146 @@
+"""
+Keyset (cursor) pagination
+
+Pages are selected with a WHERE on the ordering columns instead of OFFSET,
+so every page costs the same no matter how deep the user scrolls. Ordering
+items are field names ('-created_at') or, for a column that may be NULL,
+F('...').desc(nulls_last=True) / .asc(nulls_last=True).
+"""
+from collections import namedtuple
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.db.models.expressions import OrderBy
+
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor', 'has_next'])
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps microseconds, DjangoJSONEncoder rounds datetimes to milliseconds and rows would be skipped"""
+    
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _column(item):
+    """
+    Returns:
+        tuple: (field name, descending, nulls last) of an ordering item
+    """
+    if isinstance(item, OrderBy) and isinstance(item.expression, F):
+        return item.expression.name, item.descending, bool(item.nulls_last)
+    return item.lstrip('-'), item.startswith('-'), False
+
+
+def _resolve(instance, name):
+    """Read an ordering value, following __ lookups and annotations, None for a missing related row"""
+    value = instance
+    for part in name.split('__'):
+        try:
+            value = getattr(value, part)
+        except ObjectDoesNotExist:
+            return None
+        if value is None:
+            return None
+    return value
+
+
+def encode_cursor(instance, ordering):
+    values = [_resolve(instance, _column(item)[0]) for item in ordering]
+    data = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, queryset, ordering):
+    """
+    Returns:
+        list: Cursor values converted to python, or None if the cursor is invalid
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(raw_values, list) or len(raw_values) != len(ordering):
+        return None
+    
+    values = []
+    for item, raw in zip(ordering, raw_values):
+        name = _column(item)[0]
+        if raw is None:
+            values.append(None)
+            continue
+        try:
+            field = queryset.model._meta.get_field(name)
+        except Exception:
+            # Annotation or related lookup, compared as-is
+            values.append(raw)
+            continue
+        try:
+            values.append(field.to_python(raw))
+        except Exception:
+            return None
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Q selecting rows that come after `values` in `ordering`, e.g. for
+    ['-created_at', '-id']:
+        created_at <= v0 AND (created_at < v0 OR (created_at = v0 AND id < v1))
+    
+    Rows with NULL in a nulls-last column come after every value, and only
+    the rest of the ordering decides among them.
+    """
+    columns = [_column(item) for item in ordering]
+    condition = Q(pk__in=[])
+    for position, (field, descending, nulls_last) in enumerate(columns):
+        value = values[position]
+        if value is None:
+            # Nothing comes after NULL in this column
+            continue
+        clause = Q(**{f'{field}__{"lt" if descending else "gt"}': value})
+        if nulls_last:
+            clause |= Q(**{f'{field}__isnull': True})
+        # field=None filters IS NULL
+        for (previous, _, _), previous_value in zip(columns[:position], values[:position]):
+            clause &= Q(**{previous: previous_value})
+        condition |= clause
+    # Redundant bound on the first column, so the database can range-scan the index in order
+    # instead of collecting every row after the cursor and sorting them
+    field, descending, nulls_last = columns[0]
+    if values[0] is None:
+        bound = Q(**{f'{field}__isnull': True})
+    else:
+        bound = Q(**{f'{field}__{"lte" if descending else "gte"}': values[0]})
+        if nulls_last:
+            bound |= Q(**{f'{field}__isnull': True})
+    return bound & condition
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=30):
+    """
+    One page of queryset in the given ordering. The ordering must end with a
+    unique column (usually id) so the cursor is unambiguous, and its columns
+    must not be NULL unless ordered with nulls_last.
+    
+    Returns:
+        KeysetPage: items, cursor for the next page (None on the last page), has_next
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, queryset, ordering)
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+    
+    items = list(queryset[:page_size + 1])
+    has_next = len(items) > page_size
+    items = items[:page_size]
+    next_cursor = encode_cursor(items[-1], ordering) if has_next else None
+    return KeysetPage(items, next_cursor, has_next)
@@ -0,0 +1,88 @@
+"""
+Token bucket rate limiter stored in the cache backend
+
+The bucket state lives in the Django cache, so all processes using the same
+cache (database, memcached, redis) share one limit per key.
+"""
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+class TokenBucket:
+    """
+    Allows `rate` operations per second on average, with bursts of up to `burst`.
+    
+    The bucket can also be paused, e.g. when the provider answers 429 Too Many
+    Requests, so every process backs off until the pause is over.
+    """
+    
+    def __init__(self, key, rate, burst=1, lock_timeout=2):
+        self.key = f'ratelimit:{key}'
+        self.lock_key = f'{self.key}:lock'
+        self.pause_key = f'{self.key}:paused'
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self.lock_timeout = lock_timeout
+    
+    def _locked(self, func):
+        """Run func while holding a short cache lock (cache.add is atomic)"""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        holder = cache.get(self.lock_key)
+        while not cache.add(self.lock_key, token, self.lock_timeout):
+            if time.monotonic() > deadline:
+                # A crashed holder: break its lock once, unless someone else took it over meanwhile
+                if holder is not None and cache.get(self.lock_key) == holder:
+                    cache.delete(self.lock_key)
+                holder = cache.get(self.lock_key)
+                deadline = time.monotonic() + self.lock_timeout
+            time.sleep(0.005)
+        try:
+            return func()
+        finally:
+            if cache.get(self.lock_key) == token:
+                cache.delete(self.lock_key)
+    
+    def try_acquire(self):
+        """
+        Take one token if available.
+        
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        paused_until = cache.get(self.pause_key)
+        now = time.time()
+        if paused_until and paused_until > now:
+            return paused_until - now
+        
+        def take():
+            now = time.time()
+            tokens, updated_at = cache.get(self.key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                cache.set(self.key, (tokens - 1, now), None)
+                return 0.0
+            cache.set(self.key, (tokens, now), None)
+            return (1 - tokens) / self.rate
+        
+        return self._locked(take)
+    
+    def acquire(self, max_wait):
+        """
+        Wait up to max_wait seconds for a token.
+        
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is expected
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if not wait or time.monotonic() + wait > deadline:
+                return wait
+            time.sleep(wait)
+    
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds"""
+        cache.set(self.pause_key, time.time() + seconds, int(seconds) + 1)
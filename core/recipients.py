@@ -0,0 +1,65 @@
+"""
+Recipient resolution for notification fan-outs
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Exists, F, OuterRef, Q
+
+from .models import Event
+from .sms import format_phone_number
+
+# One row per user, phone_number is already normalized to E.164
+Recipient = namedtuple('Recipient', ['user_id', 'email', 'phone_number', 'send_email', 'send_sms', 'send_whatsapp', 'email_digest'])
+
+PREFERENCES = {'notify_events', 'notify_birthdays', 'notify_weather_alerts'}
+
+
+def resolve_recipients(preference, exclude_user_ids=(), excluded_from_event=None):
+    """
+    Resolve who should be notified, with their contact details, in one query.
+    
+    Args:
+        preference: UserProfile flag the user must have enabled (e.g. 'notify_events').
+            Users without a profile keep the defaults and are included.
+        exclude_user_ids: Users to leave out (organizer, birthday person, ...)
+        excluded_from_event: Event whose excluded_users should be left out
+    
+    Returns:
+        list: Recipient tuples, one per user
+    """
+    if preference not in PREFERENCES:
+        raise ValueError(f'Unknown notification preference {preference}')
+    
+    # Users without email or phone still get the in-app notification, only their deliveries are skipped
+    users = User.objects.filter(Q(profile__isnull=True) | Q(**{f'profile__{preference}': True}))
+    exclude_user_ids = [user_id for user_id in exclude_user_ids if user_id]
+    if exclude_user_ids:
+        users = users.exclude(id__in=exclude_user_ids)
+    if excluded_from_event is not None:
+        users = users.exclude(Exists(
+            Event.excluded_users.through.objects.filter(event_id=excluded_from_event.id, user_id=OuterRef('pk'))
+        ))
+    
+    rows = users.annotate(
+        phone=F('profile__phone_number'),
+        notify_whatsapp=F('profile__notify_whatsapp'),
+        digest=F('profile__notification_digest'),
+    ).order_by('id').values('id', 'email', 'phone', 'notify_whatsapp', 'digest')
+    
+    sms_enabled = getattr(settings, 'ENABLE_SMS_NOTIFICATIONS', False)
+    whatsapp_enabled = getattr(settings, 'ENABLE_WHATSAPP_NOTIFICATIONS', False)
+    recipients = []
+    for row in rows:
+        phone_number = format_phone_number(row['phone'])
+        recipients.append(Recipient(
+            user_id=row['id'],
+            email=row['email'],
+            phone_number=phone_number,
+            send_email=bool(row['email']),
+            send_sms=bool(phone_number and sms_enabled),
+            send_whatsapp=bool(phone_number and whatsapp_enabled and row['notify_whatsapp']),
+            email_digest=bool(row['digest']),
+        ))
+    return recipients
@@ -0,0 +1,240 @@
+"""
+Resumable chunked photo uploads, a subset of the tus protocol (tus.io)
+
+    POST   creation URL   Upload-Length, Upload-Metadata (filename)  -> 201, Location
+    HEAD   upload URL                                                -> Upload-Offset, Upload-Length
+    PATCH  upload URL     Upload-Offset, Upload-Checksum, body       -> 204, Upload-Offset
+    DELETE upload URL                                                -> 204
+
+A client that lost its connection asks for the offset with HEAD and sends
+the rest from there. Chunks are appended to a partial file in
+media/uploads/resumable/ while being hashed; if Upload-Checksum does not
+match, the chunk is cut off again. The complete file is moved into photos/
+and becomes a Photo. Uploads untouched for RESUMABLE_UPLOAD_EXPIRY_HOURS
+are deleted by collect_expired(), which runs by itself now and then when
+uploads are created, and by the cleanup_uploads command.
+"""
+import base64
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+import logging
+
+from . import duplicates, thumbnails
+from .models import Photo, ResumableUpload
+from .uploads import (
+    DUPLICATE_ERROR, IMAGE_EXTENSIONS, check_image, extension, max_file_size, remove_file, staging_dir,
+    store_photo_file,
+)
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,checksum,termination,expiration'
+CHECKSUM_ALGORITHMS = {'sha1': hashlib.sha1, 'sha256': hashlib.sha256, 'md5': hashlib.md5}
+
+READ_CHUNK_SIZE = 256 * 1024
+GC_KEY = 'resumable_uploads:gc'
+GC_INTERVAL = 60 * 60
+
+
+class UploadError(Exception):
+    """Request the client has to fix, status is the HTTP status to answer with"""
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def expiry():
+    return timedelta(hours=getattr(settings, 'RESUMABLE_UPLOAD_EXPIRY_HOURS', 24))
+
+
+def expires_at(upload):
+    return upload.updated_at + expiry()
+
+
+def partial_path(upload):
+    return os.path.join(staging_dir('resumable'), f'{upload.pk}.part')
+
+
+def parse_metadata(header):
+    """Upload-Metadata: 'key base64value,key2 base64value2' -> dict of str"""
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (header or '').split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value).decode('utf-8') if value else ''
+        except (ValueError, UnicodeDecodeError):
+            raise UploadError('Invalid Upload-Metadata')
+    return metadata
+
+
+def parse_checksum(header):
+    """
+    Upload-Checksum: '<algorithm> <base64 digest>'
+    
+    Returns:
+        tuple: (hashlib object, expected digest bytes), or (None, None) without the header
+    """
+    if not header:
+        return None, None
+    algorithm, _, digest = header.partition(' ')
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise UploadError('Unsupported checksum algorithm')
+    try:
+        return CHECKSUM_ALGORITHMS[algorithm](), base64.b64decode(digest)
+    except ValueError:
+        raise UploadError('Invalid Upload-Checksum')
+
+
+def create_upload(user, album, sub_album, length, metadata):
+    """Start a new upload, the partial file is created empty"""
+    filename = os.path.basename(metadata.get('filename', ''))
+    if extension(filename) not in IMAGE_EXTENSIONS:
+        raise UploadError('Unsupported file type', status=415)
+    if length <= 0 or length > max_file_size():
+        raise UploadError('Upload-Length exceeds the maximum size', status=413)
+    upload = ResumableUpload.objects.create(
+        user=user, album=album, sub_album=sub_album, filename=filename, length=length,
+    )
+    open(partial_path(upload), 'wb').close()
+    maybe_collect_expired()
+    return upload
+
+
+def _lock_key(upload):
+    return f'resumable_uploads:{upload.pk}:lock'
+
+
+def append_chunk(upload, offset, stream, content_length, checksum_header=None):
+    """
+    Append one PATCH body to the partial file and complete the upload when
+    the last byte arrived.
+    
+    Returns:
+        ResumableUpload: With the new offset, and photo set once complete
+    """
+    if upload.is_complete:
+        raise UploadError('Upload is already complete', status=409)
+    if offset != upload.offset:
+        raise UploadError('Upload-Offset does not match', status=409)
+    if content_length is None or upload.offset + content_length > upload.length:
+        raise UploadError('Chunk exceeds Upload-Length', status=413)
+    digest, expected = parse_checksum(checksum_header)
+    
+    # A second connection resuming the same upload must not write at the same time
+    if not cache.add(_lock_key(upload), True, 60 * 10):
+        raise UploadError('Upload is in use by another request', status=423)
+    try:
+        received = 0
+        with open(partial_path(upload), 'r+b') as partial:
+            partial.truncate(upload.offset)
+            partial.seek(upload.offset)
+            try:
+                while received < content_length:
+                    data = stream.read(min(READ_CHUNK_SIZE, content_length - received))
+                    if not data:
+                        break
+                    partial.write(data)
+                    if digest:
+                        digest.update(data)
+                    received += len(data)
+            except OSError:
+                # Connection dropped, keep what arrived unless it has to be verified
+                logger.info(f'Upload {upload.pk} interrupted after {received} bytes')
+            if digest and (received < content_length or digest.digest() != expected):
+                partial.truncate(upload.offset)
+                raise UploadError('Checksum mismatch', status=460)
+        upload.offset += received
+        upload.save(update_fields=['offset', 'updated_at'])
+        if upload.is_complete:
+            complete_upload(upload)
+    finally:
+        cache.delete(_lock_key(upload))
+    return upload
+
+
+def complete_upload(upload):
+    """
+    Move the assembled file into photos/ and create the Photo. If that
+    fails, the upload is deleted: its offset already says complete, so it
+    could neither be resumed nor would it ever get a photo. The client
+    starts over with a new upload.
+    """
+    path = partial_path(upload)
+    try:
+        check_image(path)
+        if duplicates.check_file(path, upload.album_id, []):
+            raise ValueError(DUPLICATE_ERROR)
+    except ValueError as e:
+        delete_upload(upload)
+        raise UploadError(str(e), status=422)
+    name = None
+    try:
+        name = store_photo_file(path, upload.filename)
+        with transaction.atomic():
+            photo = Photo.objects.create(user=upload.user, album=upload.album, sub_album=upload.sub_album, image=name)
+            upload.photo = photo
+            upload.save(update_fields=['photo', 'updated_at'])
+            thumbnails.schedule(photo)
+    except Exception:
+        logger.exception(f'Completing upload {upload.pk} failed')
+        if name:
+            default_storage.delete(name)
+        delete_upload(upload)
+        raise UploadError('Saving the photo failed', status=500)
+    return photo
+
+
+def delete_upload(upload):
+    remove_file(partial_path(upload))
+    upload.delete()
+
+
+def collect_expired(now=None):
+    """
+    Delete uploads nobody touched for RESUMABLE_UPLOAD_EXPIRY_HOURS, with
+    their partial files, and partial or staged files without an upload.
+    
+    Returns:
+        tuple: (expired uploads, orphaned files) deleted
+    """
+    now = now or timezone.now()
+    cutoff = now - expiry()
+    expired = 0
+    for upload in ResumableUpload.objects.filter(updated_at__lt=cutoff).iterator():
+        delete_upload(upload)
+        expired += 1
+    
+    # Leftovers of crashed requests: bulk uploads stage files only for the duration of one request
+    orphaned = 0
+    known = {str(pk) for pk in ResumableUpload.objects.values_list('pk', flat=True)}
+    cutoff_timestamp = time.time() - expiry().total_seconds()
+    for kind in ('resumable', 'bulk'):
+        with os.scandir(staging_dir(kind)) as entries:
+            for entry in entries:
+                if kind == 'resumable' and entry.name.removesuffix('.part') in known:
+                    continue
+                if entry.is_file() and entry.stat().st_mtime < cutoff_timestamp:
+                    remove_file(entry.path)
+                    orphaned += 1
+    if expired or orphaned:
+        logger.info(f'Deleted {expired} expired uploads and {orphaned} orphaned upload files')
+    return expired, orphaned
+
+
+def maybe_collect_expired():
+    """collect_expired() at most once per GC_INTERVAL, so no cron job is needed"""
+    if cache.add(GC_KEY, True, GC_INTERVAL):
+        try:
+            collect_expired()
+        except Exception as e:
+            logger.error(f'Collecting expired uploads failed: {e}')
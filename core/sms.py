@@ -1,13 +1,225 @@
 """
 SMS and WhatsApp notification functions using Twilio
+
+Messages go through a pluggable backend (SMS_BACKEND setting), similar to
+Django's EMAIL_BACKEND:
+    - core.sms.TwilioBackend: default, Twilio clients sharing one keep-alive HTTP session
+    - core.sms.LocMemBackend: records messages in core.sms.outbox, for offline testing
 """
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import random
+import threading
+import time
+
 from django.conf import settings
-from django.contrib.auth.models import User
-from .models import UserProfile
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
 import logging
 
+from .ratelimit import TokenBucket
+
 logger = logging.getLogger(__name__)
 
+# Result of one send, sid is the provider message id. retry_after (seconds)
+# is set when the message was not sent because of rate limiting.
+SendResult = namedtuple('SendResult', ['phone_number', 'ok', 'sid', 'error', 'retry_after'], defaults=(None,))
+
+# Messages recorded by LocMemBackend
+outbox = []
+
+_lock = threading.Lock()
+_backend = None
+_executor = None
+
+
+class Throttled(Exception):
+    """Raised by backends when the provider rejects a message with 429 Too Many Requests"""
+    
+    def __init__(self, retry_after, message='Too Many Requests'):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TwilioBackend:
+    """
+    Twilio REST client per sender thread, all sharing one pooled session so
+    HTTP connections are kept alive. The client remembers the last response
+    (for Retry-After), which must not come from another thread's request.
+    """
+    
+    def __init__(self):
+        if not getattr(settings, 'TWILIO_ACCOUNT_SID', None) or not getattr(settings, 'TWILIO_AUTH_TOKEN', None):
+            raise ImproperlyConfigured('Twilio credentials not configured')
+        try:
+            from requests import Session
+            from requests.adapters import HTTPAdapter
+            import twilio.rest  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured('Twilio library not installed. Install with: pip install twilio')
+        
+        self.session = Session()
+        # Enough pooled connections for every sender thread
+        pool_size = getattr(settings, 'SMS_MAX_WORKERS', 8)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.local = threading.local()
+    
+    @property
+    def client(self):
+        """This thread's Twilio client"""
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            from twilio.http.http_client import TwilioHttpClient
+            from twilio.rest import Client
+            
+            http_client = TwilioHttpClient(pool_connections=True, timeout=getattr(settings, 'TWILIO_TIMEOUT', 10))
+            http_client.session = self.session
+            client = self.local.client = Client(
+                settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client,
+            )
+        return client
+    
+    def send(self, from_, to, body):
+        from twilio.base.exceptions import TwilioRestException
+        
+        client = self.client
+        try:
+            return client.messages.create(body=body, from_=from_, to=to).sid
+        except TwilioRestException as e:
+            if e.status != 429:
+                raise
+            # The exception has no headers, this thread's client kept the response
+            response = client.http_client.last_response
+            retry_after = response.headers.get('Retry-After') if response is not None and response.headers else None
+            try:
+                retry_after = float(retry_after)
+            except (TypeError, ValueError):
+                retry_after = getattr(settings, 'SMS_DEFAULT_RETRY_AFTER', 30)
+            raise Throttled(retry_after, str(e))
+
+
+class LocMemBackend:
+    """
+    Fake transport that records messages in core.sms.outbox instead of sending them.
+    SMS_FAKE_LATENCY (seconds) and SMS_FAKE_ERROR_RATE (0-1) simulate a slow or flaky provider.
+    """
+    
+    def __init__(self):
+        self.latency = getattr(settings, 'SMS_FAKE_LATENCY', 0)
+        self.error_rate = getattr(settings, 'SMS_FAKE_ERROR_RATE', 0)
+    
+    def send(self, from_, to, body):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError('Simulated provider error')
+        with _lock:
+            outbox.append({'from': from_, 'to': to, 'body': body})
+            return f'LOCMEM{len(outbox):08d}'
+
+
+def get_backend():
+    """Return the module-level SMS backend, created on first use"""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                backend_path = getattr(settings, 'SMS_BACKEND', 'core.sms.TwilioBackend')
+                _backend = import_string(backend_path)()
+    return _backend
+
+
+def get_executor():
+    """Return the module-level thread pool used for concurrent sends"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SMS_MAX_WORKERS', 8),
+                    thread_name_prefix='sms',
+                )
+    return _executor
+
+
+def reset_backend():
+    """Drop the cached backend, e.g. after changing SMS_BACKEND or credentials"""
+    global _backend
+    with _lock:
+        _backend = None
+
+
+def get_rate_limiter(channel, sender):
+    """Token bucket shared by all processes for one channel and sender number, None if unlimited"""
+    limits = getattr(settings, 'SMS_RATE_LIMITS', {}).get(channel)
+    if not limits:
+        return None
+    rate, burst = limits
+    return TokenBucket(f'{channel}:{sender}', rate, burst)
+
+
+def _send(channel, phone_number, message):
+    """
+    Send one message over 'sms' or 'whatsapp'.
+    
+    Returns:
+        SendResult: Never raises, errors are logged and returned
+    """
+    if channel == 'whatsapp':
+        enabled_setting, label = 'ENABLE_WHATSAPP_NOTIFICATIONS', 'WhatsApp'
+        sender = getattr(settings, 'TWILIO_WHATSAPP_NUMBER', 'whatsapp:+14155238886')
+        sender_setting = 'TWILIO_WHATSAPP_NUMBER'
+    else:
+        enabled_setting, label = 'ENABLE_SMS_NOTIFICATIONS', 'SMS'
+        sender = getattr(settings, 'TWILIO_PHONE_NUMBER', '')
+        sender_setting = 'TWILIO_PHONE_NUMBER'
+    
+    if not getattr(settings, enabled_setting, False):
+        logger.info(f'{label} notifications are disabled')
+        return SendResult(phone_number, False, None, f'{label} notifications are disabled')
+    
+    if not sender:
+        logger.error(f'{sender_setting} not configured')
+        return SendResult(phone_number, False, None, f'{sender_setting} not configured')
+    
+    # Ensure phone number is in E.164 format
+    to = phone_number
+    if not to.startswith('whatsapp:') and not to.startswith('+'):
+        # Try to add country code (default to +420 for Czech Republic)
+        to = f'+420{to.lstrip("0")}'
+    if channel == 'whatsapp' and not to.startswith('whatsapp:'):
+        to = f'whatsapp:{to}'
+    
+    limiter = get_rate_limiter(channel, sender)
+    if limiter:
+        wait = limiter.acquire(getattr(settings, 'SMS_RATE_LIMIT_MAX_WAIT', 2))
+        if wait:
+            logger.info(f'{label} rate limit reached for {sender}, retry in {wait:.1f}s')
+            return SendResult(phone_number, False, None, f'{label} rate limit reached', wait)
+    
+    try:
+        sid = get_backend().send(sender, to, message)
+    except Throttled as e:
+        logger.warning(f'{label} throttled by provider, retry in {e.retry_after}s: {e}')
+        if limiter:
+            # Make every process back off, not just this thread
+            limiter.pause(e.retry_after)
+        return SendResult(phone_number, False, None, str(e), e.retry_after)
+    except ImproperlyConfigured as e:
+        logger.warning(str(e))
+        return SendResult(phone_number, False, None, str(e))
+    except Exception as e:
+        logger.error(f'Failed to send {label} to {to}: {e}')
+        return SendResult(phone_number, False, None, str(e))
+    
+    logger.info(f'{label} sent successfully to {to}: {sid}')
+    return SendResult(phone_number, True, sid, None)
+
+
+def _send_many(channel, pairs):
+    futures = [get_executor().submit(_send, channel, phone_number, message) for phone_number, message in pairs]
+    return [future.result() for future in futures]
+
 
 def send_sms(phone_number, message):
     """
@@ -20,44 +232,7 @@ def send_sms(phone_number, message):
     Returns:
         bool: True if sent successfully, False otherwise
     """
-    if not getattr(settings, 'ENABLE_SMS_NOTIFICATIONS', False):
-        logger.info('SMS notifications are disabled')
-        return False
-    
-    if not getattr(settings, 'TWILIO_ACCOUNT_SID', None) or not getattr(settings, 'TWILIO_AUTH_TOKEN', None):
-        logger.warning('Twilio credentials not configured')
-        return False
-    
-    try:
-        from twilio.rest import Client
-        
-        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        
-        # Ensure phone number is in E.164 format
-        if not phone_number.startswith('+'):
-            # Try to add country code (default to +420 for Czech Republic)
-            phone_number = f'+420{phone_number.lstrip("0")}'
-        
-        twilio_phone = getattr(settings, 'TWILIO_PHONE_NUMBER', '')
-        if not twilio_phone:
-            logger.error('TWILIO_PHONE_NUMBER not configured')
-            return False
-        
-        message_obj = client.messages.create(
-            body=message,
-            from_=twilio_phone,
-            to=phone_number
-        )
-        
-        logger.info(f'SMS sent successfully to {phone_number}: {message_obj.sid}')
-        return True
-        
-    except ImportError:
-        logger.error('Twilio library not installed. Install with: pip install twilio')
-        return False
-    except Exception as e:
-        logger.error(f'Failed to send SMS to {phone_number}: {e}')
-        return False
+    return _send('sms', phone_number, message).ok
 
 
 def send_whatsapp(phone_number, message):
@@ -71,46 +246,33 @@ def send_whatsapp(phone_number, message):
     Returns:
         bool: True if sent successfully, False otherwise
     """
-    if not getattr(settings, 'ENABLE_WHATSAPP_NOTIFICATIONS', False):
-        logger.info('WhatsApp notifications are disabled')
-        return False
+    return _send('whatsapp', phone_number, message).ok
+
+
+def send_sms_many(pairs):
+    """
+    Send many SMS messages concurrently on the shared thread pool (SMS_MAX_WORKERS)
     
-    if not getattr(settings, 'TWILIO_ACCOUNT_SID', None) or not getattr(settings, 'TWILIO_AUTH_TOKEN', None):
-        logger.warning('Twilio credentials not configured')
-        return False
+    Args:
+        pairs: Iterable of (phone_number, message)
     
-    try:
-        from twilio.rest import Client
-        
-        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        
-        # Ensure phone number is in E.164 format and add whatsapp: prefix
-        if not phone_number.startswith('whatsapp:'):
-            if not phone_number.startswith('+'):
-                # Try to add country code (default to +420 for Czech Republic)
-                phone_number = f'+420{phone_number.lstrip("0")}'
-            phone_number = f'whatsapp:{phone_number}'
-        
-        twilio_whatsapp = getattr(settings, 'TWILIO_WHATSAPP_NUMBER', 'whatsapp:+14155238886')
-        if not twilio_whatsapp:
-            logger.error('TWILIO_WHATSAPP_NUMBER not configured')
-            return False
-        
-        message_obj = client.messages.create(
-            body=message,
-            from_=twilio_whatsapp,
-            to=phone_number
-        )
-        
-        logger.info(f'WhatsApp message sent successfully to {phone_number}: {message_obj.sid}')
-        return True
-        
-    except ImportError:
-        logger.error('Twilio library not installed. Install with: pip install twilio')
-        return False
-    except Exception as e:
-        logger.error(f'Failed to send WhatsApp message to {phone_number}: {e}')
-        return False
+    Returns:
+        list: SendResult per pair, in the same order
+    """
+    return _send_many('sms', pairs)
+
+
+def send_whatsapp_many(pairs):
+    """
+    Send many WhatsApp messages concurrently on the shared thread pool (SMS_MAX_WORKERS)
+    
+    Args:
+        pairs: Iterable of (phone_number, message)
+    
+    Returns:
+        list: SendResult per pair, in the same order
+    """
+    return _send_many('whatsapp', pairs)
 
 
 def format_phone_number(phone_number):
@@ -135,5 +297,3 @@ def format_phone_number(phone_number):
         cleaned = f'+420{cleaned.lstrip("0")}'
     
     return cleaned
-
-
@@ -0,0 +1,179 @@
+"""
+Content-addressed media storage
+
+Uploaded files are named by the SHA-256 of their bytes and sharded into
+nested directories below the directory they were uploaded to:
+    photos/3f/a2/3fa2...e1.jpg
+so no directory grows past a few hundred files, and uploading the same
+bytes again stores nothing new. StoredBlob counts the fields referring to
+each file; delete() removes the file, and the thumbnails rendered next to
+it, only when the last reference goes.
+
+Originals rotated upright after upload (core.exif) keep the name of the
+bytes they were uploaded with, so uploading the same file again still
+finds them. Files stored before this keep their flat names until the
+migrate_media_storage command moves them.
+"""
+from collections import Counter
+import hashlib
+import os
+import re
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F, FileField
+import logging
+
+from .models import StoredBlob
+
+logger = logging.getLogger(__name__)
+
+HASH_ALGORITHM = 'sha256'
+SHARD_WIDTH = 2
+CONTENT_NAME_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def shard_depth():
+    return getattr(settings, 'MEDIA_SHARD_DEPTH', 2)
+
+
+def file_digest(path):
+    """Hex SHA-256 of a file, read in chunks"""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, HASH_ALGORITHM).hexdigest()
+
+
+def content_name(name, digest):
+    """'photos/Trip.JPG' (or an earlier content name) + digest -> 'photos/3f/a2/3fa2...e1.jpg'"""
+    directory = os.path.dirname(name)
+    if is_content_addressed(name) and shard_depth():
+        # Already sharded, e.g. a rewritten copy of a stored file
+        directory = '/'.join(directory.split('/')[:-shard_depth()])
+    ext = os.path.splitext(name)[1].lower()
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(shard_depth())]
+    return '/'.join(filter(None, [directory, *shards, f'{digest}{ext}']))
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_NAME_RE.match(os.path.basename(name or '')))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by content and counts references to them"""
+    
+    def _save(self, name, content):
+        # Hash while writing to a temporary file next to the final location, then link it into place
+        directory = self.path(os.path.dirname(name))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            digest = hashlib.new(HASH_ALGORITHM)
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            # mkstemp creates files readable by the owner only
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            return self.add_reference(tmp_path, content_name(name, digest.hexdigest()))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def adopt(self, path, name):
+        """
+        Store a file that is already on the media disk, e.g. a staged upload,
+        by hard-linking it. The caller removes path afterwards.
+        
+        Returns:
+            str: Storage name
+        """
+        return self.add_reference(path, content_name(name, file_digest(path)))
+    
+    def add_reference(self, path, name):
+        """Link path to name unless the same bytes are already stored, and count one more reference"""
+        full_path = self.path(name)
+        with transaction.atomic():
+            blob, _ = StoredBlob.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': os.path.getsize(path)},
+            )
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                os.link(path, full_path)
+            except FileExistsError:
+                # Same name, same bytes
+                pass
+            # Recently referenced files are left alone by the orphan collector (core.orphans)
+            os.utime(full_path)
+            StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+        return name
+    
+    def delete(self, name):
+        """Drop one reference; the file and its thumbnails go with the last one"""
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                # Stored before content addressing
+                return super().delete(name)
+            if blob.refcount > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            self.delete_files(name)
+    
+    def delete_files(self, name):
+        """Remove a content-addressed file and everything rendered from it (<digest>.<size>.<ext>)"""
+        directory = os.path.dirname(self.path(name))
+        prefix = os.path.splitext(os.path.basename(name))[0] + '.'
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith(prefix):
+                        os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+        logger.info(f'Deleted {name}, no references left')
+    
+    def get_available_name(self, name, max_length=None):
+        # The final name only depends on the content, nothing to avoid
+        return name
+
+
+def content_addressed_fields():
+    """(model, field name) of every file field stored with ContentAddressedStorage"""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def reconcile_refcounts(dry_run=False):
+    """
+    Fix StoredBlob.refcount where it differs from the number of fields
+    referring to the file, e.g. after rows were deleted without their files.
+    Blobs left without references keep their file, uploading the same bytes reuses it.
+    
+    Returns:
+        list: (name, stored, actual) of every blob that drifted
+    """
+    actual = Counter()
+    for model, field in content_addressed_fields():
+        names = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).values_list(field, flat=True)
+        actual.update(names.iterator(chunk_size=2000))
+    drifted = [
+        (name, refcount, actual[name])
+        for name, refcount in StoredBlob.objects.values_list('name', 'refcount').iterator(chunk_size=2000)
+        if refcount != actual[name]
+    ]
+    if not dry_run:
+        for name, _, count in drifted:
+            StoredBlob.objects.filter(name=name).update(refcount=count)
+    return drifted
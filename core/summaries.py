@@ -0,0 +1,267 @@
+"""
+Album summaries: photo and sub-album counts, latest upload, mosaic cover
+
+The album grid shows them from the album row alone, so it renders in one
+query. Adding a photo or sub-album moves the counters with F(); removing or
+moving one recounts its album with a single UPDATE, which also covers
+deletes cascading from events, sub-albums and users, once per album and not
+per photo. Photos created with bulk_create (core.uploads) are counted with
+photos_added().
+
+Albums without an intro photo get a 2x2 mosaic of their first four photos,
+flagged duplicates left out, as the cover. It is rendered by the thumbnail
+pool after the change commits, and only when those four photos changed.
+The refresh_album_summaries command recounts everything and renders
+missing covers.
+"""
+from functools import partial
+import os
+import uuid
+
+from django.db import close_old_connections, transaction
+from django.db.models import Count, DateTimeField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+import logging
+
+from . import thumbnails, uploads
+from .imaging import render_mosaic
+from .models import Album, Photo, SubAlbum
+from .storage import ContentAddressedStorage
+
+logger = logging.getLogger(__name__)
+
+COVER_PHOTOS = 4
+COVER_SIZE = (960, 640)
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def summary_fields():
+    """Album.objects.update() arguments that recount the summary of each album"""
+    return {
+        'photo_count': _count(Photo.objects.all(), 'album'),
+        'sub_album_count': _count(SubAlbum.objects.all(), 'parent_album'),
+        'latest_upload_at': Subquery(
+            Photo.objects.filter(album=OuterRef('pk')).order_by('-uploaded_at').values('uploaded_at')[:1]
+        ),
+    }
+
+
+def refresh(album_ids):
+    """Recount the summaries of these albums and update their covers"""
+    album_ids = {album_id for album_id in album_ids if album_id}
+    if album_ids:
+        Album.objects.filter(pk__in=album_ids).update(**summary_fields())
+        for album_id in album_ids:
+            schedule_cover(album_id)
+
+
+def photos_added(album_id, count, uploaded_at):
+    """Count new photos of an album, uploaded_at being the latest of them"""
+    uploaded_at = Value(uploaded_at, output_field=DateTimeField())
+    Album.objects.filter(pk=album_id).update(
+        photo_count=F('photo_count') + count,
+        latest_upload_at=Greatest(Coalesce(F('latest_upload_at'), uploaded_at), uploaded_at),
+    )
+    schedule_cover(album_id)
+
+
+def cover_photos(album_id):
+    """(id, image name) of the photos the album's mosaic shows, none if it has an intro photo"""
+    if Album.objects.filter(pk=album_id).exclude(intro_photo__isnull=True).exclude(intro_photo='').exists():
+        return []
+    # Flagged near-duplicates (core.duplicates) would show the same picture twice
+    photos = (
+        Photo.objects.filter(album_id=album_id, duplicate_of__isnull=True)
+        .exclude(image__isnull=True).exclude(image='')
+    )
+    return list(photos.order_by('pk').values_list('pk', 'image')[:COVER_PHOTOS])
+
+
+def pending_cover(album_id):
+    """
+    Photos a new mosaic of the album needs, if they changed since the last
+    one. An album left without photos loses its cover here.
+    
+    Returns:
+        tuple: (photo ids, image paths), or None if the cover is up to date
+    """
+    current = Album.objects.filter(pk=album_id).values_list('cover_photo_ids', flat=True).first()
+    if current is None:
+        return None
+    photos = cover_photos(album_id)
+    photo_ids = [pk for pk, _ in photos]
+    if photo_ids == current:
+        return None
+    if not photos:
+        set_cover(album_id, None, [])
+        return None
+    storage = Photo._meta.get_field('image').storage
+    return photo_ids, [storage.path(name) for _, name in photos]
+
+
+def cover_target():
+    """Temporary file to render a mosaic into"""
+    return os.path.join(uploads.staging_dir('covers'), f'{uuid.uuid4().hex}.jpg')
+
+
+def submit_cover(album_id):
+    """
+    Render the album's mosaic in the thumbnail pool if its photos changed.
+    
+    Returns:
+        Future: Or None if nothing has to be rendered
+    """
+    pending = pending_cover(album_id)
+    if pending is None:
+        return None
+    photo_ids, paths = pending
+    target = cover_target()
+    future = thumbnails.get_pool().submit(
+        render_mosaic, paths, target, COVER_SIZE, thumbnails.render_options()['preset'],
+    )
+    future.add_done_callback(partial(_cover_done, album_id, photo_ids, target))
+    return future
+
+
+def schedule_cover(album_id):
+    """submit_cover() once the current transaction commits"""
+    transaction.on_commit(partial(submit_cover, album_id))
+
+
+def _cover_done(album_id, photo_ids, path, future):
+    """Runs on the pool's result thread, so it needs its own DB connection handling"""
+    try:
+        future.result()
+        store_cover(album_id, photo_ids, path)
+    except Exception as e:
+        logger.error(f'Cover of album {album_id} failed: {e}')
+    finally:
+        uploads.remove_file(path)
+        close_old_connections()
+
+
+def store_cover(album_id, photo_ids, path):
+    """Move a rendered mosaic into storage and make it the album's cover"""
+    storage = Album._meta.get_field('cover').storage
+    name = f'albums/covers/album-{album_id}.jpg'
+    if isinstance(storage, ContentAddressedStorage):
+        name = storage.adopt(path, name)
+    else:
+        with open(path, 'rb') as f:
+            name = storage.save(name, f)
+    set_cover(album_id, name, photo_ids)
+
+
+def set_cover(album_id, name, photo_ids):
+    """Store a rendered cover (or none) and drop the reference to the previous one"""
+    storage = Album._meta.get_field('cover').storage
+    with transaction.atomic():
+        previous = Album.objects.select_for_update().filter(pk=album_id).values_list('cover', flat=True).first()
+        updated = Album.objects.filter(pk=album_id).update(cover=name or '', cover_photo_ids=photo_ids)
+    # Also when it is the same file, storing it counted another reference
+    for stale in (previous, None if updated else name):
+        if stale:
+            storage.delete(stale)
+
+
+def _saved_value(model, instance, field):
+    """Value of field in the database before this save, None for new rows"""
+    if instance._state.adding:
+        return None
+    return model.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def _saves(update_fields, name):
+    """Whether a save with these update_fields writes the field, so others skip the lookup"""
+    return update_fields is None or name in update_fields or f'{name}_id' in update_fields
+
+
+@receiver(pre_save, sender=Photo)
+def _remember_photo_album(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        instance._saved_album_id = (
+            _saved_value(Photo, instance, 'album_id') if _saves(update_fields, 'album') else instance.album_id
+        )
+
+
+@receiver(post_save, sender=Photo)
+def _photo_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        if instance.album_id:
+            photos_added(instance.album_id, 1, instance.uploaded_at)
+        return
+    previous = getattr(instance, '_saved_album_id', instance.album_id)
+    if previous != instance.album_id:
+        refresh([previous, instance.album_id])
+
+
+def _refresh_after_delete(sender, album_id, origin):
+    """
+    refresh() after a photo or sub-album was deleted. A delete() cascading
+    to many of them sends post_delete for each once all are gone, so one
+    recount per album and model is enough; none if the album goes too.
+    """
+    if album_id is None or (isinstance(origin, Album) and origin.pk == album_id):
+        return
+    if origin is not None:
+        refreshed = origin.__dict__.setdefault('_refreshed_album_ids', set())
+        if (sender, album_id) in refreshed:
+            return
+        refreshed.add((sender, album_id))
+    refresh([album_id])
+
+
+@receiver(post_delete, sender=Photo)
+def _photo_deleted(sender, instance, origin=None, **kwargs):
+    _refresh_after_delete(sender, instance.album_id, origin)
+
+
+@receiver(pre_save, sender=SubAlbum)
+def _remember_parent_album(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        instance._saved_parent_album_id = (
+            _saved_value(SubAlbum, instance, 'parent_album_id') if _saves(update_fields, 'parent_album')
+            else instance.parent_album_id
+        )
+
+
+@receiver(post_save, sender=SubAlbum)
+def _sub_album_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        Album.objects.filter(pk=instance.parent_album_id).update(sub_album_count=F('sub_album_count') + 1)
+        return
+    previous = getattr(instance, '_saved_parent_album_id', instance.parent_album_id)
+    if previous != instance.parent_album_id:
+        refresh([previous, instance.parent_album_id])
+
+
+@receiver(post_delete, sender=SubAlbum)
+def _sub_album_deleted(sender, instance, origin=None, **kwargs):
+    _refresh_after_delete(sender, instance.parent_album_id, origin)
+
+
+@receiver(pre_save, sender=Album)
+def _remember_intro_photo(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and _saves(update_fields, 'intro_photo'):
+        instance._saved_intro_photo = _saved_value(Album, instance, 'intro_photo') or ''
+
+
+@receiver(post_save, sender=Album)
+def _album_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # A removed intro photo needs a mosaic, a new one makes it unnecessary
+    if raw or created or not _saves(update_fields, 'intro_photo'):
+        return
+    # Compared after the save, which gave an uploaded file its final name
+    if getattr(instance, '_saved_intro_photo', '') != (instance.intro_photo.name or ''):
+        schedule_cover(instance.pk)
@@ -0,0 +1,31 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from core import thumbnails
+
+register = template.Library()
+
+DEFAULT_SIZES_ATTR = '(max-width: 768px) 100vw, 480px'
+
+
+@register.simple_tag
+def responsive_image(fieldfile, derivatives, alt='', style='', sizes=DEFAULT_SIZES_ATTR):
+    """
+    <picture> of an uploaded photo: AVIF/WebP sources for browsers that support them,
+    and a JPEG <img> with srcset of its thumbnails as the fallback, e.g.
+        {% responsive_image photo.image photo.derivatives alt=photo.caption %}
+    """
+    if not fieldfile:
+        return ''
+    picture = thumbnails.picture_data(fieldfile, derivatives)
+    if not picture['srcset']:
+        return format_html('<img src="{}" alt="{}" style="{}" loading="lazy">', picture['src'], alt, style)
+    
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((source['type'], source['srcset'], sizes) for source in picture['sources']),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" style="{}" loading="lazy"></picture>',
+        sources, picture['src'], picture['srcset'], sizes, alt, style,
+    )
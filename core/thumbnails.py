@@ -0,0 +1,233 @@
+"""
+Thumbnails for Photo.image and Album.intro_photo
+
+After an upload, derivatives (PHOTO_THUMBNAIL_SIZES, e.g. grid, lightbox
+and full) are rendered in a process pool and stored next to the original:
+    photos/trip.jpg -> photos/trip.grid.jpg, photos/trip.lightbox.jpg, ...
+Besides JPEG, every size is also transcoded to PHOTO_IMAGE_FORMATS (WebP,
+and AVIF when Pillow supports it) with the PHOTO_IMAGE_QUALITY preset.
+Widths and formats are saved in the model's JSON field (Photo.derivatives,
+Album.intro_derivatives) once they exist. Until then templates fall back to
+the original file. For Photo.image, a first worker task reads the EXIF
+metadata, rotates the original upright (core.exif, into a new file if it is
+content-addressed) and computes the perceptual hash; thumbnails are only
+rendered if core.duplicates keeps the photo.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import multiprocessing
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+import logging
+
+from . import duplicates, exif, uploads
+from .imaging import analyze_photo, derivative_path, render_derivatives
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {'grid': 480, 'lightbox': 1600, 'full': 2560}
+DEFAULT_FORMATS = ['avif', 'webp']
+
+# Best first, used to pick what the browser gets
+PREFERRED_FORMATS = ['avif', 'webp', 'jpeg']
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+# Image field -> JSON field holding its derivatives
+DERIVATIVE_FIELDS = {
+    'image': 'derivatives',
+    'intro_photo': 'intro_derivatives',
+}
+
+# Image fields that are analyzed before rendering (Photo columns, see core.exif and core.duplicates)
+METADATA_FIELDS = {'image'}
+
+_lock = threading.Lock()
+_pool = None
+
+
+def get_sizes():
+    return getattr(settings, 'PHOTO_THUMBNAIL_SIZES', DEFAULT_SIZES)
+
+
+def render_options():
+    """Keyword arguments of imaging.render_derivatives from settings"""
+    return {
+        'sizes': get_sizes(),
+        'formats': getattr(settings, 'PHOTO_IMAGE_FORMATS', DEFAULT_FORMATS),
+        'preset': getattr(settings, 'PHOTO_IMAGE_QUALITY', 'balanced'),
+    }
+
+
+def get_pool():
+    """Return the module-level process pool, created on first use"""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                # Spawned, not forked: the web process has threads and open DB connections
+                _pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _pool
+
+
+def thumbnail_name(name, size, format='jpeg'):
+    """Storage name of one derivative of an original"""
+    return derivative_path(name, size, format)
+
+
+def derivative_names(name, derivatives):
+    """Storage names of the thumbnails rendered from name"""
+    derivatives = derivatives or {}
+    return [
+        thumbnail_name(name, size, format)
+        for size in derivatives.get('sizes', {}) for format in derivatives.get('formats', ['jpeg'])
+    ]
+
+
+def _derivative_url(fieldfile, derivatives, size, format):
+    """URL of one derivative, versioned so it can be cached as immutable (see core.media)"""
+    url = fieldfile.storage.url(thumbnail_name(fieldfile.name, size, format))
+    version = (derivatives or {}).get('version')
+    return f'{url}?v={version}' if version else url
+
+
+def save_result(model, pk, field, name, result, **fields):
+    """
+    Store rendered derivatives and any other field values, unless the file
+    was replaced in the meantime.
+    
+    Returns:
+        bool: True if the row was updated
+    """
+    updated = model.objects.filter(pk=pk, **{field: name}).update(**{DERIVATIVE_FIELDS[field]: result}, **fields)
+    return bool(updated)
+
+
+def _done(model, pk, field, name, future):
+    """Runs on the pool's result thread, so it needs its own DB connection handling"""
+    try:
+        save_result(model, pk, field, name, future.result())
+    except Exception as e:
+        logger.error(f'Thumbnails for {name} failed: {e}')
+    finally:
+        close_old_connections()
+
+
+def _analyzed(model, pk, field, name, path, upright_path, future):
+    """Store metadata and hash, then render thumbnails unless the photo was dropped as a duplicate"""
+    try:
+        result = future.result()
+        fields = {
+            **exif.photo_fields(result['metadata']),
+            **duplicates.hash_fields(result['dhash']),
+            # A flag from a previous file no longer applies
+            'duplicate_of': None,
+        }
+        if not model.objects.filter(pk=pk, **{field: name}).update(**fields):
+            # Replaced in the meantime, the new file has its own tasks
+            return
+        if not duplicates.check_upload(pk):
+            return
+        if upright_path and result['metadata']['normalized']:
+            name = exif.store_upright(pk, name, upright_path)
+            if name is None:
+                return
+            path = model._meta.get_field(field).storage.path(name)
+        _render(model, pk, field, name, path)
+    except Exception as e:
+        logger.error(f'Analyzing {name} failed: {e}')
+    finally:
+        if upright_path:
+            uploads.remove_file(upright_path)
+        close_old_connections()
+
+
+def _render(model, pk, field, name, path):
+    future = get_pool().submit(render_derivatives, path, **render_options())
+    future.add_done_callback(partial(_done, model, pk, field, name))
+
+
+def schedule(instance, field='image'):
+    """
+    Analyze and render derivatives of instance.<field> in the background once
+    the current transaction commits. Call after saving a new or replaced file.
+    """
+    fieldfile = getattr(instance, field)
+    if not fieldfile:
+        return
+    model, pk, name, path = type(instance), instance.pk, fieldfile.name, fieldfile.path
+    
+    def submit():
+        if field in METADATA_FIELDS:
+            normalize = exif.normalize_orientation_enabled()
+            upright_path = exif.upright_target(name) if normalize else None
+            future = get_pool().submit(analyze_photo, path, normalize, upright_path)
+            future.add_done_callback(partial(_analyzed, model, pk, field, name, path, upright_path))
+        else:
+            _render(model, pk, field, name, path)
+    
+    transaction.on_commit(submit)
+
+
+def available_formats(derivatives):
+    """Formats the derivatives exist in, best first"""
+    formats = (derivatives or {}).get('formats', ['jpeg'])
+    return [format for format in PREFERRED_FORMATS if format in formats]
+
+
+def negotiate_format(accept, derivatives):
+    """
+    Best rendered format the browser accepts, from the Accept header.
+    
+    Returns:
+        str: 'avif', 'webp' or 'jpeg'
+    """
+    accept = accept or ''
+    for format in available_formats(derivatives):
+        if format == 'jpeg' or MIME_TYPES[format] in accept:
+            return format
+    return 'jpeg'
+
+
+def srcset(fieldfile, derivatives, format='jpeg'):
+    """
+    Returns:
+        str: srcset attribute value, empty if there are no derivatives (in this format) yet
+    """
+    if format not in available_formats(derivatives):
+        return ''
+    sizes = (derivatives or {}).get('sizes', {})
+    candidates = sorted((width, size) for size, width in sizes.items())
+    return ', '.join(
+        f'{_derivative_url(fieldfile, derivatives, size, format)} {width}w'
+        for width, size in candidates
+    )
+
+
+def thumbnail_url(fieldfile, derivatives, size='grid', format='jpeg'):
+    """URL of one derivative, the original if it has not been rendered yet"""
+    if size in (derivatives or {}).get('sizes', {}) and format in available_formats(derivatives):
+        return _derivative_url(fieldfile, derivatives, size, format)
+    return fieldfile.url
+
+
+def picture_data(fieldfile, derivatives, size='grid'):
+    """
+    Everything needed to render a <picture>, also used by the JSON endpoints.
+    
+    Returns:
+        dict: {'src', 'srcset', 'sources': [{'type', 'srcset'}]}, srcset empty
+            and no sources until thumbnails exist
+    """
+    return {
+        'src': thumbnail_url(fieldfile, derivatives, size),
+        'srcset': srcset(fieldfile, derivatives),
+        'sources': [
+            {'type': MIME_TYPES[format], 'srcset': srcset(fieldfile, derivatives, format)}
+            for format in available_formats(derivatives) if format != 'jpeg'
+        ],
+    }
@@ -0,0 +1,108 @@
+"""
+Trending photos: likes weighted by how recent they are
+
+A like given at time t weighs 2 ** ((t - now) / half-life), so it counts
+fully today and half after PHOTO_TRENDING_HALF_LIFE_HOURS. A photo's score
+is the sum of its likes' weights. Because every weight decays at the same
+rate, the order of photos only changes when likes arrive, and the score can
+be stored relative to a fixed epoch instead of now:
+    score = log(sum(exp(rate * (t - EPOCH)))),  rate = ln 2 / half-life
+The exponents grow without bound, so they are kept in log space and added
+with logaddexp; the stored value never needs to be decayed.
+
+A like adds its weight with one UPDATE, in the same transaction as the like
+(core.likes). Removing a like recomputes that photo's score from its likes,
+subtracting in log space would lose precision. rebuild_trending_scores
+recomputes everything, e.g. from a daily cron job and after changing the
+half-life.
+"""
+from datetime import datetime, timezone as dt_timezone
+import math
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+
+from .models import PhotoLike, TrendingScore
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def half_life_hours():
+    return getattr(settings, 'PHOTO_TRENDING_HALF_LIFE_HOURS', 72)
+
+
+def like_weight(created_at):
+    """log of the weight of a like given at created_at, relative to EPOCH"""
+    rate = math.log(2) / (half_life_hours() * 60 * 60)
+    return rate * (created_at - EPOCH).total_seconds()
+
+
+def logaddexp(a, b):
+    """log(exp(a) + exp(b)) without overflowing"""
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def logaddexp_expression(field, value):
+    """logaddexp(field, value) as an SQL expression, for an atomic UPDATE"""
+    value = Value(value, output_field=FloatField())
+    return Greatest(F(field), value) + Ln(Value(1.0) + Exp(-Abs(F(field) - value)))
+
+
+def photo_score(photo_id):
+    """
+    Score of a photo from all its likes.
+    
+    Returns:
+        float: Or None if nobody likes it
+    """
+    score = None
+    for created_at in PhotoLike.objects.filter(photo_id=photo_id).order_by().values_list('created_at', flat=True):
+        weight = like_weight(created_at)
+        score = weight if score is None else logaddexp(score, weight)
+    return score
+
+
+def add_like(photo_id, created_at):
+    """Add the weight of a new like to the photo's score. Call inside the like's transaction."""
+    weight = like_weight(created_at)
+    if TrendingScore.objects.filter(photo_id=photo_id).update(score=logaddexp_expression('score', weight)):
+        return
+    try:
+        # Savepoint, a concurrent like may have created the row
+        with transaction.atomic():
+            TrendingScore.objects.create(photo_id=photo_id, score=weight)
+    except IntegrityError:
+        TrendingScore.objects.filter(photo_id=photo_id).update(score=logaddexp_expression('score', weight))
+
+
+def refresh_photo(photo_id):
+    """Recompute one photo's score, e.g. after a like was removed"""
+    score = photo_score(photo_id)
+    if score is None:
+        TrendingScore.objects.filter(photo_id=photo_id).delete()
+    else:
+        TrendingScore.objects.update_or_create(photo_id=photo_id, defaults={'score': score})
+
+
+def rebuild(batch_size=1000):
+    """
+    Recompute the scores of all photos from their likes in one pass.
+    
+    Returns:
+        int: Photos with a score
+    """
+    scores = {}
+    likes = PhotoLike.objects.order_by().values_list('photo_id', 'created_at')
+    for photo_id, created_at in likes.iterator(chunk_size=5000):
+        weight = like_weight(created_at)
+        scores[photo_id] = logaddexp(scores[photo_id], weight) if photo_id in scores else weight
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create(
+            (TrendingScore(photo_id=photo_id, score=score) for photo_id, score in scores.items()),
+            batch_size=batch_size,
+        )
+    return len(scores)
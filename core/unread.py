@@ -0,0 +1,59 @@
+"""
+Cached per-user unread notification counter
+
+The count is computed once with a COUNT query and then kept in the cache.
+New notifications invalidate it, marking as read adjusts it in place.
+"""
+from django.core.cache import cache
+
+from .models import Notification
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def unread_count(user_id):
+    """Number of unread notifications of the user"""
+    count = cache.get(_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, read=False).count()
+        cache.set(_key(user_id), count, CACHE_TIMEOUT)
+    return count
+
+
+def invalidate(user_ids):
+    """Forget cached counts, e.g. after a fan-out created notifications for these users"""
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+def mark_read(user_id, notification_id):
+    """
+    Mark one notification as read.
+    
+    Returns:
+        bool: False if it was already read or does not belong to the user
+    """
+    updated = Notification.objects.filter(id=notification_id, user_id=user_id, read=False).update(read=True)
+    if updated:
+        try:
+            if cache.decr(_key(user_id)) < 0:
+                cache.delete(_key(user_id))
+        except ValueError:
+            # Not cached, computed on next access
+            pass
+    return bool(updated)
+
+
+def mark_all_read(user_id):
+    """
+    Mark all notifications of the user as read with a single UPDATE.
+    
+    Returns:
+        int: Number of notifications marked
+    """
+    updated = Notification.objects.filter(user_id=user_id, read=False).update(read=True)
+    cache.set(_key(user_id), 0, CACHE_TIMEOUT)
+    return updated
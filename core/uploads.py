@@ -0,0 +1,283 @@
+"""
+Bulk photo uploads
+
+Many photos (or ZIP archives of them) are sent in one multipart request.
+StreamingPhotoUploadHandler writes every file chunk by chunk into a staging
+directory on the media disk, so neither the request nor Django's temporary
+files hold whole photos in memory. Accepted files are then moved (renamed,
+not copied) into photos/, the Photo rows are created with bulk_create and
+thumbnails are rendered in the background by core.thumbnails.
+"""
+import os
+import uuid
+import zipfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.db import transaction
+from django.utils.text import get_valid_filename
+from PIL import Image, UnidentifiedImageError
+import logging
+
+from . import duplicates, summaries, thumbnails
+from .models import Photo
+from .storage import ContentAddressedStorage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif', '.avif', '.tif', '.tiff'}
+ZIP_EXTENSIONS = {'.zip'}
+
+# Formats Pillow may report for the extensions above
+IMAGE_FORMATS = {'JPEG', 'MPO', 'PNG', 'GIF', 'WEBP', 'HEIF', 'AVIF', 'TIFF'}
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Rejection of a photo that is already in the album, with PHOTO_DUPLICATE_ACTION = 'skip'
+DUPLICATE_ERROR = 'Stejná fotka už v albu je'
+
+
+def max_file_size():
+    return getattr(settings, 'PHOTO_UPLOAD_MAX_FILE_SIZE', 50 * 1024 * 1024)
+
+
+def max_archive_size():
+    return getattr(settings, 'PHOTO_UPLOAD_MAX_ARCHIVE_SIZE', 2 * 1024 * 1024 * 1024)
+
+
+def staging_dir(kind='bulk'):
+    """Directory for files being uploaded, on the same disk as MEDIA_ROOT so they can be renamed into place"""
+    path = os.path.join(settings.MEDIA_ROOT, 'uploads', kind)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def extension(name):
+    return os.path.splitext(name)[1].lower()
+
+
+class StagedUploadedFile(UploadedFile):
+    """An uploaded file already written to the staging directory"""
+    
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class StreamingPhotoUploadHandler(FileUploadHandler):
+    """
+    Streams uploaded photos and ZIP archives straight to the staging directory.
+    
+    Files with other extensions or over the size limit are dropped while
+    uploading and listed in self.rejected as (file name, reason).
+    """
+    
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.rejected = []
+        self.file = None
+    
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        ext = extension(file_name)
+        if ext in IMAGE_EXTENSIONS:
+            self.limit = max_file_size()
+        elif ext in ZIP_EXTENSIONS:
+            self.limit = max_archive_size()
+        else:
+            self.file = None
+            self.rejected.append((file_name, 'Nepodporovaný typ souboru'))
+            raise StopFutureHandlers()
+        self.size = 0
+        self.file = open(os.path.join(staging_dir(), f'{uuid.uuid4().hex}{ext}'), 'wb')
+        raise StopFutureHandlers()
+    
+    def receive_data_chunk(self, raw_data, start):
+        if self.file is None:
+            return None
+        self.size += len(raw_data)
+        if self.size > self.limit:
+            self._discard()
+            self.rejected.append((self.file_name, 'Soubor je příliš velký'))
+            return None
+        self.file.write(raw_data)
+        return None
+    
+    def file_complete(self, file_size):
+        if self.file is None:
+            return None
+        self.file.close()
+        uploaded = StagedUploadedFile(
+            file=self.file, name=self.file_name, content_type=self.content_type,
+            size=self.size, charset=self.charset, content_type_extra=self.content_type_extra,
+        )
+        self.file = None
+        return uploaded
+    
+    def upload_interrupted(self):
+        if self.file is not None:
+            self._discard()
+    
+    def _discard(self):
+        self.file.close()
+        remove_file(self.file.name)
+        self.file = None
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def check_image(path):
+    """
+    Make sure a staged file is an image Pillow can open. Only the header is
+    read, decoding is left to the thumbnail workers.
+    
+    Raises:
+        ValueError: With a message for the user
+    """
+    try:
+        with Image.open(path) as image:
+            if image.format not in IMAGE_FORMATS:
+                raise ValueError('Nepodporovaný formát obrázku')
+    except (UnidentifiedImageError, OSError):
+        raise ValueError('Soubor není platný obrázek')
+
+
+def store_photo_file(path, original_name):
+    """
+    Move a staged file into photos/ under a free name based on the original
+    one, or under its content hash with core.storage.
+    
+    Returns:
+        str: Storage name for Photo.image
+    """
+    name = f'photos/{get_valid_filename(os.path.basename(original_name)) or "photo"}'
+    if isinstance(default_storage, ContentAddressedStorage):
+        name = default_storage.adopt(path, name)
+        remove_file(path)
+        return name
+    os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+    while True:
+        name = default_storage.get_available_name(name)
+        try:
+            # A hard link fails instead of overwriting a file stored concurrently under the same name
+            os.link(path, default_storage.path(name))
+        except FileExistsError:
+            continue
+        remove_file(path)
+        return name
+
+
+def extract_archive(path):
+    """
+    Stream the images of a ZIP archive into the staging directory one by one.
+    
+    Yields:
+        (member name, staged path or None, error message or None)
+    """
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        yield os.path.basename(path), None, 'Poškozený ZIP archiv'
+        return
+    with archive:
+        for member in archive.infolist():
+            if member.is_dir() or os.path.basename(member.filename).startswith('.'):
+                continue
+            if extension(member.filename) not in IMAGE_EXTENSIONS:
+                yield member.filename, None, 'Nepodporovaný typ souboru'
+                continue
+            if member.file_size > max_file_size():
+                yield member.filename, None, 'Soubor je příliš velký'
+                continue
+            staged = os.path.join(staging_dir(), f'{uuid.uuid4().hex}{extension(member.filename)}')
+            try:
+                with archive.open(member) as source, open(staged, 'wb') as target:
+                    # The declared size can lie, so count what is actually written
+                    copied = 0
+                    while chunk := source.read(COPY_CHUNK_SIZE):
+                        copied += len(chunk)
+                        if copied > max_file_size():
+                            raise ValueError('Soubor je příliš velký')
+                        target.write(chunk)
+            except (ValueError, zipfile.BadZipFile, OSError) as e:
+                remove_file(staged)
+                yield member.filename, None, str(e) if isinstance(e, ValueError) else 'Poškozený soubor v archivu'
+                continue
+            yield member.filename, staged, None
+
+
+def _staged_images(files):
+    """(name, staged path or None, error or None) for every uploaded image, ZIPs unpacked"""
+    for uploaded in files:
+        path = uploaded.temporary_file_path()
+        if extension(uploaded.name) in ZIP_EXTENSIONS:
+            try:
+                for name, staged, error in extract_archive(path):
+                    yield f'{uploaded.name}/{name}', staged, error
+            finally:
+                remove_file(path)
+        else:
+            yield uploaded.name, path, None
+
+
+def import_photos(files, user, album=None, sub_album=None, rejected=()):
+    """
+    Create photos from staged uploads.
+    
+    Args:
+        files: StagedUploadedFile list from StreamingPhotoUploadHandler
+        rejected: (name, reason) pairs the handler already dropped
+    
+    Returns:
+        list: {'name', 'status': 'created' or 'rejected', 'error', 'photo_id'} per file,
+            files rejected by the handler first, then the rest in upload order
+    """
+    results = [{'name': name, 'status': 'rejected', 'error': error, 'photo_id': None} for name, error in rejected]
+    photos = []
+    stored = []
+    hashes = []
+    try:
+        for name, staged, error in _staged_images(files):
+            if staged:
+                try:
+                    check_image(staged)
+                    if duplicates.check_file(staged, album.pk if album else None, hashes):
+                        raise ValueError(DUPLICATE_ERROR)
+                except ValueError as e:
+                    remove_file(staged)
+                    error = str(e)
+            if error:
+                results.append({'name': name, 'status': 'rejected', 'error': error, 'photo_id': None})
+                continue
+            stored.append(store_photo_file(staged, name))
+            photos.append(Photo(user=user, album=album, sub_album=sub_album, image=stored[-1]))
+            results.append({'name': name, 'status': 'created', 'error': None, 'photo_id': None})
+        
+        with transaction.atomic():
+            Photo.objects.bulk_create(photos, batch_size=100)
+            # bulk_create sends no signals
+            if photos and album:
+                summaries.photos_added(album.pk, len(photos), max(photo.uploaded_at for photo in photos))
+            for photo in photos:
+                thumbnails.schedule(photo)
+    except Exception:
+        for name in stored:
+            default_storage.delete(name)
+        raise
+    finally:
+        # Anything still staged belonged to a failed request
+        for uploaded in files:
+            remove_file(uploaded.temporary_file_path())
+    
+    created = iter(photos)
+    for result in results:
+        if result['status'] == 'created':
+            result['photo_id'] = next(created).pk
+    logger.info(f'Bulk upload by {user}: {len(photos)} photos created, {len(results) - len(photos)} rejected')
+    return results
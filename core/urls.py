@@ -16,17 +16,28 @@ urlpatterns = [
     
     # Photos and Albums
     path('photos/', views.photos_list, name='photos_list'),
+    path('photos/feed/', views.photo_feed, name='photo_feed'),
     path('photos/create/', views.photo_create, name='photo_create'),
     path('photos/create/album/<int:album_id>/', views.photo_create, name='photo_create_album'),
     path('photos/create/sub-album/<int:sub_album_id>/', views.photo_create, name='photo_create_sub_album'),
+    path('photos/upload/album/<int:album_id>/', views.photo_bulk_upload, name='photo_bulk_upload_album'),
+    path('photos/upload/sub-album/<int:sub_album_id>/', views.photo_bulk_upload, name='photo_bulk_upload_sub_album'),
+    path('photos/resumable/album/<int:album_id>/', views.resumable_upload_create, name='resumable_upload_create_album'),
+    path('photos/resumable/sub-album/<int:sub_album_id>/', views.resumable_upload_create,
+         name='resumable_upload_create_sub_album'),
+    path('photos/resumable/<uuid:upload_id>/', views.resumable_upload, name='resumable_upload'),
     path('photos/<int:photo_id>/edit/', views.photo_edit, name='photo_edit'),
     path('photos/<int:photo_id>/like/', views.photo_like, name='photo_like'),
+    path('photos/<int:photo_id>/image/<slug:size>/', views.photo_image, name='photo_image'),
     path('albums/create/', views.album_create, name='album_create'),
     path('albums/create/event/<int:event_id>/', views.album_create, name='album_create_event'),
     path('albums/<int:album_id>/', views.album_detail, name='album_detail'),
     path('albums/<int:album_id>/edit/', views.album_edit, name='album_edit'),
+    path('albums/<int:album_id>/cover/<slug:size>/', views.album_cover, name='album_cover'),
+    path('albums/<int:album_id>/download/', views.album_download, name='album_download'),
     path('albums/<int:album_id>/sub-album/create/', views.sub_album_create, name='sub_album_create'),
     path('sub-albums/<int:sub_album_id>/', views.sub_album_detail, name='sub_album_detail'),
+    path('sub-albums/<int:sub_album_id>/download/', views.album_download, name='sub_album_download'),
     
     # Maps
     path('maps/', views.maps_list, name='maps_list'),
@@ -68,5 +79,9 @@ urlpatterns = [
     
     # Notifications
     path('notifications/', views.notifications, name='notifications'),
+    path('notifications/metrics/', views.notification_metrics, name='notification_metrics'),
+    path('notifications/unread-count/', views.notification_unread_count, name='notification_unread_count'),
+    path('notifications/mark-all-read/', views.notification_mark_all_read, name='notification_mark_all_read'),
+    path('notifications/<int:notification_id>/read/', views.notification_mark_read, name='notification_mark_read'),
 ]
 
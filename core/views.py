@@ -1,11 +1,16 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django import forms
+from django.db import transaction
+from django.db.models import Count
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from datetime import date
 from .models import (
-    Event, Photo, PhotoLike, Album, SubAlbum, MapLocation, WeatherAlert, CalendarEntry, RecurringEvent,
+    Event, Photo, Album, SubAlbum, MapLocation, WeatherAlert, CalendarEntry, RecurringEvent,
     ChatMessage, Tip, Debt, UndercoverWordPair, UndercoverGame, Notification,
     EventVote, EventChecklistItem, EventItinerary
 )
@@ -14,7 +19,8 @@ from .forms import (
     ChatMessageForm, TipForm, DebtForm, UndercoverWordPairForm,
     EventChecklistItemForm, EventItineraryForm
 )
-from .emails import send_event_notification
+from .emails import queue_event_notification
+from . import thumbnails
 
 
 def index(request):
@@ -92,11 +98,13 @@ def event_create(request):
             # If map_location is selected, auto-populate location field with map_location name
             if event.map_location and not event.location:
                 event.location = event.map_location.name
-            event.save()
-            form.save_m2m()  # Save many-to-many relationships
-            
-            if notification_scope != 'notify_none':
-                send_event_notification(event, scope=notification_scope, notification_reason='created')
+            # Event and its outbox rows are committed together, delivery happens in send_notifications
+            with transaction.atomic():
+                event.save()
+                form.save_m2m()  # Save many-to-many relationships
+                
+                if notification_scope != 'notify_none':
+                    queue_event_notification(event, scope=notification_scope, notification_reason='created')
             
             messages.success(request, 'Událost byla úspěšně vytvořena!')
             return redirect('core:event_detail', event_id=event.id)
@@ -123,10 +131,11 @@ def event_edit(request, event_id):
             # If map_location is selected, auto-populate location field with map_location name
             if event.map_location and not event.location:
                 event.location = event.map_location.name
-            event.save()
-            form.save_m2m()  # Save many-to-many relationships
-            if notification_scope != 'notify_none':
-                send_event_notification(event, scope=notification_scope, notification_reason='updated')
+            with transaction.atomic():
+                event.save()
+                form.save_m2m()  # Save many-to-many relationships
+                if notification_scope != 'notify_none':
+                    queue_event_notification(event, scope=notification_scope, notification_reason='updated')
             messages.success(request, 'Událost byla úspěšně upravena!')
             return redirect('core:event_detail', event_id=event.id)
     else:
@@ -208,7 +217,7 @@ def event_detail(request, event_id):
     
     # Get albums for this event
     albums = Album.objects.filter(event=event)
-    visible_albums = [album for album in albums if album.can_view(request.user)]
+    visible_albums = albums.visible_to(request.user).select_related('owner')
     
     # Check if event has photos
     has_photos = Photo.objects.filter(event=event).exists() or albums.exists()
@@ -228,61 +237,48 @@ def event_detail(request, event_id):
 
 @login_required
 def photos_list(request):
-    """Photo gallery with albums"""
-    from django.db.models import Count, Exists, OuterRef
+    """Photo gallery with albums, each photo section shows its first page"""
+    from .gallery import photo_page, feed_url
     
     # Get albums user can view
-    all_albums = Album.objects.all()
-    visible_albums = [album for album in all_albums if album.can_view(request.user)]
-    
-    # Get standalone photos (not in albums) with like info
-    standalone_photos = Photo.objects.filter(album=None).annotate(
-        like_count=Count('likes'),
-        is_liked=Exists(PhotoLike.objects.filter(photo=OuterRef('pk'), user=request.user))
-    ).order_by('-uploaded_at')
-    
-    # Get all photos for "Most liked" section (sorted by like count)
-    all_photos = Photo.objects.annotate(
-        like_count=Count('likes'),
-        is_liked=Exists(PhotoLike.objects.filter(photo=OuterRef('pk'), user=request.user))
-    ).order_by('-like_count', '-uploaded_at')
-    
-    # Get photos liked by current user
-    user_liked_photos = Photo.objects.filter(likes__user=request.user).distinct().annotate(
-        like_count=Count('likes'),
-        is_liked=Exists(PhotoLike.objects.filter(photo=OuterRef('pk'), user=request.user))
-    ).order_by('-uploaded_at')
+    visible_albums = Album.objects.visible_to(request.user).select_related('owner', 'event')
+    
+    sections = {
+        section: (photo_page(request.user, section), feed_url(section))
+        for section in ('standalone', 'popular', 'liked')
+    }
     
     return render(request, 'core/photos_list.html', {
         'albums': visible_albums,
-        'standalone_photos': standalone_photos,
-        'most_liked_photos': all_photos,
-        'my_liked_photos': user_liked_photos
+        'standalone_photos': sections['standalone'][0],
+        'standalone_feed_url': sections['standalone'][1],
+        'most_liked_photos': sections['popular'][0],
+        'most_liked_feed_url': sections['popular'][1],
+        'my_liked_photos': sections['liked'][0],
+        'my_liked_feed_url': sections['liked'][1],
     })
 
 
 @login_required
 def album_detail(request, album_id):
     """Album detail page with photos and sub-albums"""
-    from django.db.models import Count, Exists, OuterRef
+    from .gallery import photo_page, feed_url
     
-    album = get_object_or_404(Album, id=album_id)
+    album = get_object_or_404(Album.objects.with_attendance(request.user), id=album_id)
     
     # Check if user can view
     if not album.can_view(request.user):
         messages.error(request, 'Nemáte oprávnění zobrazit toto album.')
         return redirect('core:photos_list')
     
-    # Get photos in this album (not in sub-albums) with like info
-    photos = album.photos.filter(sub_album=None).annotate(
-        like_count=Count('likes'),
-        is_liked=Exists(PhotoLike.objects.filter(photo=OuterRef('pk'), user=request.user))
-    ).order_by('-uploaded_at')
-    sub_albums = album.sub_albums.all()
+    # Photos in this album (not in sub-albums), first page
+    photos = photo_page(request.user, 'album', album=album)
+    sub_albums = album.sub_albums.select_related('created_by').annotate(photo_count=Count('photos'))
     
     return render(request, 'core/album_detail.html', {
         'album': album,
         'photos': photos,
+        'feed_url': feed_url('album', album=album),
         'sub_albums': sub_albums
     })
 
@@ -290,26 +286,122 @@ def album_detail(request, album_id):
 @login_required
 def sub_album_detail(request, sub_album_id):
     """Sub-album detail page"""
-    from django.db.models import Count, Exists, OuterRef
+    from .gallery import photo_page, feed_url
     
-    sub_album = get_object_or_404(SubAlbum, id=sub_album_id)
+    sub_album = get_object_or_404(SubAlbum.objects.select_related('parent_album', 'created_by'), id=sub_album_id)
     
     # Check if user can view parent album
     if not sub_album.parent_album.can_view(request.user):
         messages.error(request, 'Nemáte oprávnění zobrazit toto sub-album.')
         return redirect('core:photos_list')
     
-    photos = sub_album.photos.all().annotate(
-        like_count=Count('likes'),
-        is_liked=Exists(PhotoLike.objects.filter(photo=OuterRef('pk'), user=request.user))
-    ).order_by('-uploaded_at')
+    photos = photo_page(request.user, 'sub_album', sub_album=sub_album)
     
     return render(request, 'core/sub_album_detail.html', {
         'sub_album': sub_album,
-        'photos': photos
+        'photos': photos,
+        'feed_url': feed_url('sub_album', sub_album=sub_album),
+    })
+
+
+@login_required
+def album_download(request, album_id=None, sub_album_id=None):
+    """Album with its sub-albums, or one sub-album, as a streamed ZIP archive"""
+    from django.http import StreamingHttpResponse
+    from django.utils.http import content_disposition_header
+    from .archives import album_entries, safe_name, stream_zip
+    
+    album, sub_album, back_url = _album_target(request, album_id, sub_album_id)
+    if not album.can_view(request.user):
+        messages.error(request, 'Nemáte oprávnění stáhnout toto album.')
+        return redirect('core:photos_list')
+    
+    filename = safe_name(album.name)
+    if sub_album:
+        filename += f' - {safe_name(sub_album.name, "sub-album")}'
+    response = StreamingHttpResponse(stream_zip(album_entries(album, sub_album)), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, f'{filename}.zip')
+    # Keep proxies from buffering the whole archive
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def media_file(request, path):
+    """Uploaded photo or derivative, only for users who may see its album"""
+    from django.http import Http404
+    from . import media
+    
+    full_path = media.media_path(path)
+    # Not found rather than forbidden, so private albums don't reveal their files
+    if not media.can_view(media.find_owners(path), request.user):
+        raise Http404
+    return media.serve(request, path, full_path)
+
+
+@login_required
+def photo_feed(request):
+    """Next page of a gallery section as JSON, for infinite scroll"""
+    from django.http import JsonResponse
+    from .gallery import SECTIONS, photo_page, photo_record
+    
+    section = request.GET.get('section')
+    if section not in SECTIONS:
+        return JsonResponse({'error': 'Unknown section'}, status=400)
+    
+    album = sub_album = None
+    try:
+        if section == 'album':
+            album = get_object_or_404(Album.objects.with_attendance(request.user), id=int(request.GET.get('album', '')))
+            parent_album = album
+        elif section == 'sub_album':
+            sub_album = get_object_or_404(SubAlbum, id=int(request.GET.get('sub_album', '')))
+            parent_album = sub_album.parent_album
+    except ValueError:
+        return JsonResponse({'error': 'Invalid album'}, status=400)
+    if (album or sub_album) and not parent_album.can_view(request.user):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    
+    page = photo_page(request.user, section, request.GET.get('cursor'), album=album, sub_album=sub_album)
+    return JsonResponse({
+        'photos': [photo_record(photo) for photo in page.items],
+        'next_cursor': page.next_cursor,
     })
 
 
+def _negotiated_image(request, fieldfile, derivatives, size):
+    """Redirect to the best derivative format the browser accepts, the original as a fallback"""
+    from django.http import Http404
+    from django.utils.cache import patch_vary_headers
+    
+    if not fieldfile:
+        raise Http404
+    format = thumbnails.negotiate_format(request.headers.get('Accept'), derivatives)
+    response = redirect(thumbnails.thumbnail_url(fieldfile, derivatives, size, format))
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@login_required
+def photo_image(request, photo_id, size='grid'):
+    """Photo thumbnail in the best format for the browser (Accept header)"""
+    photo = get_object_or_404(Photo.objects.select_related('album'), id=photo_id)
+    if photo.album and not photo.album.can_view(request.user):
+        messages.error(request, 'Nemáte oprávnění zobrazit toto foto.')
+        return redirect('core:photos_list')
+    return _negotiated_image(request, photo.image, photo.derivatives, size)
+
+
+@login_required
+def album_cover(request, album_id, size='grid'):
+    """Album intro photo in the best format for the browser (Accept header)"""
+    album = get_object_or_404(Album.objects.with_attendance(request.user), id=album_id)
+    if not album.can_view(request.user):
+        messages.error(request, 'Nemáte oprávnění zobrazit toto album.')
+        return redirect('core:photos_list')
+    return _negotiated_image(request, album.intro_photo, album.intro_derivatives, size)
+
+
 @login_required
 def album_create(request, event_id=None):
     """Create a new album"""
@@ -326,6 +418,7 @@ def album_create(request, event_id=None):
             if event and not album.date and event.start_date:
                 album.date = event.start_date.date()
             album.save()
+            thumbnails.schedule(album, 'intro_photo')
             messages.success(request, 'Album bylo úspěšně vytvořeno!')
             return redirect('core:album_detail', album_id=album.id)
     else:
@@ -353,7 +446,12 @@ def album_edit(request, album_id):
     if request.method == 'POST':
         form = AlbumForm(request.POST, request.FILES, instance=album)
         if form.is_valid():
-            form.save()
+            album = form.save(commit=False)
+            if 'intro_photo' in form.changed_data:
+                album.intro_derivatives = {}
+            album.save()
+            if 'intro_photo' in form.changed_data:
+                thumbnails.schedule(album, 'intro_photo')
             messages.success(request, 'Album bylo upraveno!')
             return redirect('core:album_detail', album_id=album.id)
     else:
@@ -364,7 +462,7 @@ def album_edit(request, album_id):
 @login_required
 def sub_album_create(request, album_id):
     """Create a sub-album within an album"""
-    album = get_object_or_404(Album, id=album_id)
+    album = get_object_or_404(Album.objects.with_attendance(request.user), id=album_id)
     
     # Check if user can view the album
     if not album.can_view(request.user):
@@ -393,7 +491,7 @@ def photo_create(request, album_id=None, sub_album_id=None):
     redirect_url = 'core:photos_list'
     
     if album_id:
-        album = get_object_or_404(Album, id=album_id)
+        album = get_object_or_404(Album.objects.with_attendance(request.user), id=album_id)
         if not album.can_view(request.user):
             messages.error(request, 'Nemáte oprávnění přidat foto do tohoto alba.')
             return redirect('core:photos_list')
@@ -418,6 +516,7 @@ def photo_create(request, album_id=None, sub_album_id=None):
             if sub_album:
                 photo.sub_album = sub_album
             photo.save()
+            thumbnails.schedule(photo)
             messages.success(request, 'Foto bylo úspěšně přidáno!')
             if sub_album:
                 return redirect('core:sub_album_detail', sub_album_id=sub_album.id)
@@ -440,6 +539,151 @@ def photo_create(request, album_id=None, sub_album_id=None):
     })
 
 
+@login_required
+@csrf_exempt
+def photo_bulk_upload(request, album_id=None, sub_album_id=None):
+    """Upload many photos or ZIP archives at once into an album or sub-album"""
+    from .uploads import StreamingPhotoUploadHandler
+    
+    # Must be set before anything reads request.POST, so CSRF is checked in the inner view
+    handler = StreamingPhotoUploadHandler(request)
+    request.upload_handlers = [handler]
+    return _photo_bulk_upload(request, handler, album_id, sub_album_id)
+
+
+@csrf_protect
+def _photo_bulk_upload(request, handler, album_id, sub_album_id):
+    from django.http import JsonResponse
+    from .uploads import import_photos
+    
+    album, sub_album, back_url = _album_target(request, album_id, sub_album_id)
+    if not album.can_view(request.user):
+        messages.error(request, 'Nemáte oprávnění přidat fotky do tohoto alba.')
+        return redirect('core:photos_list')
+    
+    if request.method == 'POST':
+        results = import_photos(
+            request.FILES.getlist('files'), request.user,
+            album=album, sub_album=sub_album, rejected=handler.rejected,
+        )
+        created = sum(1 for result in results if result['status'] == 'created')
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'files': results, 'created': created, 'redirect': back_url})
+        if created:
+            messages.success(request, f'Nahráno fotek: {created}.')
+        if created < len(results):
+            messages.warning(request, f'Nepodařilo se nahrát souborů: {len(results) - created}.')
+        return redirect(back_url)
+    
+    return render(request, 'core/photo_bulk_upload.html', {
+        'album': album,
+        'sub_album': sub_album,
+        'back_url': back_url,
+        'resumable_url': reverse(
+            'core:resumable_upload_create_sub_album', args=[sub_album.id]
+        ) if sub_album else reverse('core:resumable_upload_create_album', args=[album.id]),
+    })
+
+
+def _album_target(request, album_id, sub_album_id):
+    """
+    Album and sub-album a photo upload or download is for, the caller checks album.can_view.
+    
+    Returns:
+        tuple: (album, sub_album or None, URL of the album or sub-album page)
+    """
+    if sub_album_id:
+        sub_album = get_object_or_404(SubAlbum.objects.select_related('parent_album'), id=sub_album_id)
+        return sub_album.parent_album, sub_album, reverse('core:sub_album_detail', args=[sub_album.id])
+    album = get_object_or_404(Album.objects.with_attendance(request.user), id=album_id)
+    return album, None, reverse('core:album_detail', args=[album.id])
+
+
+def _tus_response(status=204, content='', **headers):
+    from django.http import HttpResponse
+    from .resumable import TUS_VERSION
+    
+    response = HttpResponse(content, status=status, content_type='text/plain; charset=utf-8')
+    response['Tus-Resumable'] = TUS_VERSION
+    response['Cache-Control'] = 'no-store'
+    for name, value in headers.items():
+        response[name.replace('_', '-')] = value
+    return response
+
+
+@login_required
+def resumable_upload_create(request, album_id=None, sub_album_id=None):
+    """Start a resumable photo upload into an album or sub-album (tus creation, see core.resumable)"""
+    from django.utils.http import http_date
+    from .resumable import (
+        CHECKSUM_ALGORITHMS, TUS_EXTENSIONS, TUS_VERSION, UploadError, create_upload, expires_at, parse_metadata,
+    )
+    from .uploads import max_file_size
+    
+    if request.method == 'OPTIONS':
+        return _tus_response(
+            Tus_Version=TUS_VERSION,
+            Tus_Extension=TUS_EXTENSIONS,
+            Tus_Max_Size=str(max_file_size()),
+            Tus_Checksum_Algorithm=','.join(CHECKSUM_ALGORITHMS),
+        )
+    if request.method != 'POST':
+        return _tus_response(405, Allow='POST, OPTIONS')
+    
+    album, sub_album, _ = _album_target(request, album_id, sub_album_id)
+    if not album.can_view(request.user):
+        return _tus_response(403, 'Nemáte oprávnění přidat fotky do tohoto alba.')
+    try:
+        length = int(request.headers.get('Upload-Length', ''))
+        upload = create_upload(request.user, album, sub_album, length, parse_metadata(request.headers.get('Upload-Metadata')))
+    except ValueError:
+        return _tus_response(400, 'Invalid Upload-Length')
+    except UploadError as e:
+        return _tus_response(e.status, str(e))
+    return _tus_response(
+        201,
+        Location=reverse('core:resumable_upload', args=[upload.pk]),
+        Upload_Expires=http_date(expires_at(upload).timestamp()),
+    )
+
+
+@login_required
+def resumable_upload(request, upload_id):
+    """Offset query (HEAD), next chunk (PATCH) or cancel (DELETE) of a resumable upload"""
+    from django.utils.http import http_date
+    from .models import ResumableUpload
+    from .resumable import UploadError, append_chunk, delete_upload, expires_at
+    
+    upload = get_object_or_404(ResumableUpload, pk=upload_id, user=request.user)
+    
+    if request.method == 'DELETE':
+        delete_upload(upload)
+        return _tus_response()
+    if request.method == 'PATCH':
+        if request.content_type != 'application/offset+octet-stream':
+            return _tus_response(415, 'Content-Type must be application/offset+octet-stream')
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            content_length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return _tus_response(400, 'Invalid Upload-Offset or Content-Length')
+        try:
+            append_chunk(upload, offset, request, content_length, request.headers.get('Upload-Checksum'))
+        except UploadError as e:
+            return _tus_response(e.status, str(e), Upload_Offset=str(upload.offset))
+    elif request.method not in ('HEAD', 'GET'):
+        return _tus_response(405, Allow='HEAD, PATCH, DELETE')
+    
+    headers = {
+        'Upload_Offset': str(upload.offset),
+        'Upload_Length': str(upload.length),
+        'Upload_Expires': http_date(expires_at(upload).timestamp()),
+    }
+    if upload.photo_id:
+        headers['Upload_Photo_Id'] = str(upload.photo_id)
+    return _tus_response(204 if request.method == 'PATCH' else 200, **headers)
+
+
 @login_required
 def photo_edit(request, photo_id):
     """Edit a photo"""
@@ -447,7 +691,13 @@ def photo_edit(request, photo_id):
     if request.method == 'POST':
         form = PhotoForm(request.POST, request.FILES, instance=photo)
         if form.is_valid():
-            form.save()
+            photo = form.save(commit=False)
+            if 'image' in form.changed_data:
+                photo.derivatives = {}
+                photo.exif_extracted = False
+            photo.save()
+            if 'image' in form.changed_data:
+                thumbnails.schedule(photo)
             messages.success(request, 'Foto bylo upraveno!')
             return redirect('core:photos_list')
     else:
@@ -721,32 +971,75 @@ def undercover_wordpair_create(request):
 
 @login_required
 def notifications(request):
-    """User notifications"""
-    user_notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'core/notifications.html', {'notifications': user_notifications})
+    """User notifications, newest first, paginated by cursor"""
+    from .pagination import keyset_page
+    
+    page = keyset_page(
+        Notification.objects.filter(user=request.user),
+        ['-created_at', '-id'],
+        cursor=request.GET.get('cursor'),
+        page_size=30,
+    )
+    return render(request, 'core/notifications.html', {
+        'notifications': page.items,
+        'next_cursor': page.next_cursor,
+    })
+
+
+@login_required
+def notification_unread_count(request):
+    """Unread notification count for the navigation badge, as JSON"""
+    from django.http import JsonResponse
+    from .unread import unread_count
+    
+    return JsonResponse({'unread': unread_count(request.user.id)})
+
+
+@login_required
+def notification_mark_read(request, notification_id):
+    """Mark one notification as read"""
+    from .unread import mark_read
+    
+    if request.method == 'POST':
+        mark_read(request.user.id, notification_id)
+    return redirect('core:notifications')
+
+
+@login_required
+def notification_mark_all_read(request):
+    """Mark all notifications of the user as read"""
+    from .unread import mark_all_read
+    
+    if request.method == 'POST':
+        updated = mark_all_read(request.user.id)
+        if updated:
+            messages.success(request, f'Označeno jako přečtené: {updated}')
+    return redirect('core:notifications')
+
+
+@staff_member_required
+def notification_metrics(request):
+    """Delivery counters and throughput per channel, as JSON"""
+    from django.http import JsonResponse
+    from .metrics import get_metrics
+    
+    try:
+        window = max(1, min(int(request.GET.get('minutes', 5)), 24 * 60))
+    except ValueError:
+        window = 5
+    return JsonResponse(get_metrics(window_minutes=window))
 
 
 @login_required
 def photo_like(request, photo_id):
     """Like or unlike a photo"""
     from django.http import JsonResponse
+    from .likes import toggle_like
     
-    photo = get_object_or_404(Photo, id=photo_id)
+    photo = get_object_or_404(Photo.objects.only('id'), id=photo_id)
     
     if request.method == 'POST':
-        like, created = PhotoLike.objects.get_or_create(
-            photo=photo,
-            user=request.user
-        )
-        
-        if not created:
-            # Unlike - delete the like
-            like.delete()
-            liked = False
-        else:
-            liked = True
-        
-        like_count = photo.get_like_count()
+        liked, like_count = toggle_like(photo.id, request.user)
         
         return JsonResponse({
             'liked': liked,
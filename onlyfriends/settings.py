@@ -62,6 +62,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.unread_notifications',
             ],
         },
     },
@@ -81,6 +82,17 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory is per process. Rate limits and counters are only shared between
+# processes with a shared backend, e.g. DatabaseCache (run `manage.py createcachetable`).
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'onlyfriends'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -123,6 +135,49 @@ STATIC_ROOT = os.environ.get('STATIC_ROOT')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are named by content hash and deduplicated (core.storage)
+STORAGES = {
+    'default': {'BACKEND': 'core.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Levels of two-character subdirectories content-addressed files are sharded into
+MEDIA_SHARD_DEPTH = 2
+# Unreferenced media files (core.orphans) are quarantined once older than MEDIA_GC_MIN_AGE_HOURS,
+# and deleted MEDIA_GC_GRACE_DAYS later
+MEDIA_GC_MIN_AGE_HOURS = 24
+MEDIA_GC_GRACE_DAYS = 7
+# Media is served by core.media after a permission check; browsers cache it for this long before revalidating
+MEDIA_CACHE_SECONDS = 60 * 60
+# Let the web server send media files: None, 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache)
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+# Internal nginx location aliased to MEDIA_ROOT, for 'x-accel-redirect'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Thumbnails rendered after upload, longest edge in pixels (core.thumbnails)
+PHOTO_THUMBNAIL_SIZES = {'grid': 480, 'lightbox': 1600, 'full': 2560}
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+# Thumbnails are also transcoded to these (AVIF only if Pillow supports it), JPEG is always kept
+PHOTO_IMAGE_FORMATS = ['avif', 'webp']
+# Encoder quality preset: 'high', 'balanced' or 'small' (core.imaging.QUALITY_PRESETS)
+PHOTO_IMAGE_QUALITY = os.environ.get('PHOTO_IMAGE_QUALITY', 'balanced')
+# Rotate originals upright once after upload instead of relying on their EXIF orientation (core.exif)
+PHOTO_NORMALIZE_ORIENTATION = True
+# Photos whose perceptual hashes differ in at most this many of 64 bits are duplicates (core.duplicates)
+PHOTO_DUPLICATE_DISTANCE = 6
+# Duplicates uploaded into an album: 'flag' keeps them marked with duplicate_of, 'skip' deletes them
+PHOTO_DUPLICATE_ACTION = os.environ.get('PHOTO_DUPLICATE_ACTION', 'flag')
+# A like counts half in the trending section after this long (core.trending), rebuild_trending_scores after changing it
+PHOTO_TRENDING_HALF_LIFE_HOURS = 72
+# Photos per page of the gallery sections, further pages load while scrolling
+PHOTO_PAGE_SIZE = 24
+# Bulk uploads (core.uploads): limit per photo and per ZIP archive, in bytes
+PHOTO_UPLOAD_MAX_FILE_SIZE = 50 * 1024 * 1024
+PHOTO_UPLOAD_MAX_ARCHIVE_SIZE = 2 * 1024 * 1024 * 1024
+# Django's default of 100 files per request is too low for a trip's photos
+DATA_UPLOAD_MAX_NUMBER_FILES = 1000
+# Resumable uploads (core.resumable) untouched for this long are deleted with their partial file
+RESUMABLE_UPLOAD_EXPIRY_HOURS = 24
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -174,4 +229,34 @@ ENABLE_WHATSAPP_NOTIFICATIONS = os.environ.get('ENABLE_WHATSAPP_NOTIFICATIONS',
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', '')
 TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER', '')
-TWILIO_WHATSAPP_NUMBER = os.environ.get('TWILIO_WHATSAPP_NUMBER', 'whatsapp:+14155238886')
\ No newline at end of file
+TWILIO_WHATSAPP_NUMBER = os.environ.get('TWILIO_WHATSAPP_NUMBER', 'whatsapp:+14155238886')
+
+# 'core.sms.LocMemBackend' records messages locally instead of calling Twilio
+SMS_BACKEND = os.environ.get('SMS_BACKEND', 'core.sms.TwilioBackend')
+# Concurrent Twilio requests (thread pool and HTTP connection pool size)
+SMS_MAX_WORKERS = 8
+# Token bucket per channel and sender number: (messages per second, burst).
+# Buckets live in the cache, point CACHES at a shared backend when running several workers.
+SMS_RATE_LIMITS = {
+    'sms': (1, 5),
+    'whatsapp': (20, 20),
+}
+# How long a sender thread waits for a token before the delivery is rescheduled
+SMS_RATE_LIMIT_MAX_WAIT = 2
+# Used when Twilio answers 429 without a Retry-After header
+SMS_DEFAULT_RETRY_AFTER = 30
+
+####################### Notification outbox
+# Events only queue notifications, run the worker to deliver them:
+#   python manage.py send_notifications --workers 4
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', 5))
+NOTIFICATION_RETRY_BASE_SECONDS = 60
+NOTIFICATION_RETRY_MAX_SECONDS = 3600
+NOTIFICATION_LEASE_SECONDS = 300
+# Deliveries claimed per worker batch, emails in a batch share SMTP connections
+NOTIFICATION_BATCH_SIZE = 50
+NOTIFICATION_EMAIL_MAX_PER_CONNECTION = 100
+# Event edits wait this long, further edits in the meantime are merged into the same delivery
+NOTIFICATION_COALESCE_MINUTES = 10
+# Read notifications older than this are removed by prune_notifications (run daily from cron)
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
@@ -0,0 +1,144 @@
+// Bulk photo upload: all selected files go in one request, progress is
+// shown per file from the upload progress of the request, results come
+// back per file from core:photo_bulk_upload_* as JSON. With "upload in
+// parts" checked, files go one by one through ResumableUpload instead.
+(function() {
+    const statusLabels = {
+        waiting: 'čeká',
+        created: '✅ nahráno',
+        rejected: '❌',
+    };
+    
+    function fileRow(name, size) {
+        const row = document.createElement('li');
+        row.className = 'upload-item';
+        const label = document.createElement('span');
+        label.className = 'upload-name';
+        label.textContent = name;
+        const progress = document.createElement('progress');
+        progress.max = size || 1;
+        progress.value = 0;
+        const status = document.createElement('small');
+        status.className = 'upload-status';
+        status.textContent = statusLabels.waiting;
+        row.append(label, progress, status);
+        return {row, progress, status};
+    }
+    
+    function setResult(item, result) {
+        item.progress.value = item.progress.max;
+        item.status.textContent = result.status === 'created'
+            ? statusLabels.created
+            : `${statusLabels.rejected} ${result.error}`;
+        item.row.classList.add(result.status === 'created' ? 'upload-ok' : 'upload-failed');
+    }
+    
+    async function uploadResumable(form, files, items, summary) {
+        let created = 0;
+        for (const file of files) {
+            const item = items[file.name];
+            if (file.name.toLowerCase().endsWith('.zip')) {
+                setResult(item, {status: 'rejected', error: 'ZIP archivy nelze nahrávat po částech'});
+                continue;
+            }
+            const upload = new ResumableUpload(file, form.dataset.resumableUrl, {
+                onProgress: sent => { item.progress.value = sent; },
+            });
+            try {
+                await upload.start();
+                created += 1;
+                setResult(item, {status: 'created'});
+            } catch (error) {
+                setResult(item, {status: 'rejected', error: error.message});
+            }
+        }
+        summary.textContent = `Nahráno fotek: ${created} z ${files.length}.`;
+    }
+    
+    document.addEventListener('DOMContentLoaded', () => {
+        const form = document.getElementById('bulkUploadForm');
+        if (!form) {
+            return;
+        }
+        const input = document.getElementById('bulkUploadFiles');
+        const list = document.getElementById('bulkUploadList');
+        const summary = document.getElementById('bulkUploadSummary');
+        const submit = document.getElementById('bulkUploadSubmit');
+        
+        form.addEventListener('submit', event => {
+            event.preventDefault();
+            const files = Array.from(input.files);
+            if (!files.length) {
+                return;
+            }
+            
+            list.innerHTML = '';
+            summary.textContent = '';
+            const items = {};
+            // Where each file starts and ends in the request body, roughly (multipart headers are ignored)
+            let offset = 0;
+            const ranges = files.map(file => {
+                const item = fileRow(file.name, file.size);
+                items[file.name] = item;
+                list.appendChild(item.row);
+                const range = {item, start: offset, end: offset + file.size};
+                offset += file.size;
+                return range;
+            });
+            
+            if (document.getElementById('bulkUploadResumable').checked) {
+                submit.disabled = true;
+                uploadResumable(form, files, items, summary).finally(() => { submit.disabled = false; });
+                return;
+            }
+            
+            const data = new FormData(form);
+            const xhr = new XMLHttpRequest();
+            xhr.open('POST', form.action || window.location.href);
+            xhr.setRequestHeader('X-Requested-With', 'XMLHttpRequest');
+            xhr.upload.addEventListener('progress', progressEvent => {
+                if (!progressEvent.lengthComputable) {
+                    return;
+                }
+                const sent = progressEvent.loaded / progressEvent.total * offset;
+                ranges.forEach(({item, start, end}) => {
+                    item.progress.value = Math.max(0, Math.min(sent, end) - start);
+                });
+            });
+            xhr.addEventListener('load', () => {
+                submit.disabled = false;
+                if (xhr.status !== 200) {
+                    summary.textContent = `Nahrávání selhalo (${xhr.status}).`;
+                    return;
+                }
+                const response = JSON.parse(xhr.responseText);
+                response.files.forEach(result => {
+                    let item = items[result.name];
+                    if (!item) {
+                        // A photo from a ZIP archive
+                        item = fileRow(result.name, 1);
+                        list.appendChild(item.row);
+                    }
+                    setResult(item, result);
+                });
+                const zipItems = ranges.filter(({item}) => item.status.textContent === statusLabels.waiting);
+                zipItems.forEach(({item}) => {
+                    item.progress.value = item.progress.max;
+                    item.status.textContent = '📦 rozbaleno';
+                });
+                summary.innerHTML = '';
+                summary.append(`Nahráno fotek: ${response.created} z ${response.files.length}. `);
+                const back = document.createElement('a');
+                back.href = response.redirect;
+                back.textContent = 'Zobrazit album';
+                summary.appendChild(back);
+            });
+            xhr.addEventListener('error', () => {
+                submit.disabled = false;
+                summary.textContent = 'Nahrávání selhalo, zkontrolujte připojení a zkuste to znovu.';
+            });
+            submit.disabled = true;
+            xhr.send(data);
+        });
+    });
+})();
@@ -0,0 +1,190 @@
+// Photo gallery: like buttons and infinite scroll.
+// Grids with data-feed-url load further pages from core:photo_feed as the
+// user scrolls; cards are built like templates/core/photo_card.html.
+(function() {
+    const IMAGE_SIZES = '(max-width: 768px) 100vw, 480px';
+    
+    function getCookie(name) {
+        let cookieValue = null;
+        if (document.cookie && document.cookie !== '') {
+            const cookies = document.cookie.split(';');
+            for (let i = 0; i < cookies.length; i++) {
+                const cookie = cookies[i].trim();
+                if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                    cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                    break;
+                }
+            }
+        }
+        return cookieValue;
+    }
+    
+    function toggleLike(likeBtn) {
+        const photoId = likeBtn.dataset.photoId;
+        
+        // Disable button during request
+        likeBtn.disabled = true;
+        
+        fetch(likeBtn.dataset.likeUrl, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+                'Content-Type': 'application/json',
+            },
+            credentials: 'same-origin'
+        })
+        .then(response => response.json())
+        .then(data => {
+            // The same photo can be shown in several sections
+            document.querySelectorAll(`.like-btn[data-photo-id="${photoId}"]`).forEach(button => {
+                button.querySelector('.like-icon').textContent = data.liked ? '❤️' : '🤍';
+                button.classList.toggle('liked', data.liked);
+            });
+            document.querySelectorAll(`.like-count[data-photo-id="${photoId}"] span`).forEach(el => {
+                el.textContent = data.like_count;
+            });
+            likeBtn.disabled = false;
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            likeBtn.disabled = false;
+        });
+    }
+    
+    function element(tag, attrs, children) {
+        const el = document.createElement(tag);
+        Object.entries(attrs || {}).forEach(([name, value]) => {
+            if (name === 'text') {
+                el.textContent = value;
+            } else {
+                el.setAttribute(name, value);
+            }
+        });
+        (children || []).forEach(child => child && el.appendChild(child));
+        return el;
+    }
+    
+    function formatDate(iso) {
+        const date = new Date(iso);
+        const pad = n => String(n).padStart(2, '0');
+        return `${pad(date.getDate())}.${pad(date.getMonth() + 1)}.${date.getFullYear()}`;
+    }
+    
+    function buildPicture(image, alt) {
+        const img = element('img', {
+            src: image.src,
+            alt: alt,
+            style: 'width: 100%; border-radius: 5px; margin-bottom: 10px;',
+            loading: 'lazy',
+        });
+        if (!image.srcset) {
+            return img;
+        }
+        img.setAttribute('srcset', image.srcset);
+        img.setAttribute('sizes', IMAGE_SIZES);
+        const sources = image.sources.map(source => element('source', {
+            type: source.type, srcset: source.srcset, sizes: IMAGE_SIZES,
+        }));
+        return element('picture', {}, sources.concat([img]));
+    }
+    
+    function buildPhotoCard(photo, showEdit) {
+        let media = null;
+        if (photo.image) {
+            media = element('div', {style: 'position: relative;'}, [
+                buildPicture(photo.image, photo.caption),
+                element('button', {
+                    type: 'button',
+                    class: 'like-btn' + (photo.is_liked ? ' liked' : ''),
+                    'data-photo-id': photo.id,
+                    'data-like-url': photo.like_url,
+                }, [element('span', {class: 'like-icon', text: photo.is_liked ? '❤️' : '🤍'})]),
+            ]);
+        } else if (photo.album_link) {
+            media = element('p', {}, [
+                element('a', {href: photo.album_link, target: '_blank', class: 'btn', text: '🔗 Otevřít externí album'}),
+            ]);
+        }
+        
+        let event = null;
+        if (photo.event) {
+            event = element('p', {}, [element('strong', {text: 'Akce:'})]);
+            event.appendChild(document.createTextNode(' ' + photo.event));
+        }
+        
+        const meta = element('div', {class: 'card-meta'}, [
+            element('small', {text: `📤 ${photo.user} • ${formatDate(photo.uploaded_at)}`}),
+            element('div', {style: 'margin-top: 5px;'}, [
+                element('small', {class: 'like-count', 'data-photo-id': photo.id, text: '❤️ '}, [
+                    element('span', {text: photo.like_count}),
+                ]),
+            ]),
+            showEdit ? element('div', {style: 'margin-top: 10px;'}, [
+                element('a', {
+                    href: photo.edit_url,
+                    class: 'btn btn-secondary',
+                    style: 'font-size: 0.9rem; padding: 5px 10px;',
+                    text: '✏️ Upravit',
+                }),
+            ]) : null,
+        ]);
+        
+        return element('div', {class: 'card photo-card', 'data-photo-id': photo.id}, [
+            media,
+            photo.duplicate_of ? element('p', {}, [
+                element('span', {class: 'badge badge-warning', title: 'Vypadá stejně jako dříve nahraná fotka', text: '🔁 Duplicitní'}),
+            ]) : null,
+            photo.caption ? element('p', {text: photo.caption}) : null,
+            event,
+            meta,
+        ]);
+    }
+    
+    function initInfiniteScroll(grid) {
+        if (!grid.dataset.nextCursor) {
+            return;
+        }
+        const sentinel = element('div', {class: 'feed-sentinel'});
+        grid.after(sentinel);
+        let loading = false;
+        
+        const observer = new IntersectionObserver(entries => {
+            if (loading || !entries.some(entry => entry.isIntersecting)) {
+                return;
+            }
+            loading = true;
+            const url = `${grid.dataset.feedUrl}&cursor=${encodeURIComponent(grid.dataset.nextCursor)}`;
+            fetch(url, {credentials: 'same-origin'})
+                .then(response => response.json())
+                .then(data => {
+                    data.photos.forEach(photo => grid.appendChild(buildPhotoCard(photo, grid.dataset.showEdit === 'true')));
+                    grid.dataset.nextCursor = data.next_cursor || '';
+                    loading = false;
+                    if (!data.next_cursor) {
+                        observer.disconnect();
+                        sentinel.remove();
+                    } else {
+                        // Observe again, so a sentinel that is still visible loads the next page too
+                        observer.unobserve(sentinel);
+                        observer.observe(sentinel);
+                    }
+                })
+                .catch(error => {
+                    console.error('Error:', error);
+                    loading = false;
+                });
+        }, {rootMargin: '600px'});
+        observer.observe(sentinel);
+    }
+    
+    document.addEventListener('click', event => {
+        const likeBtn = event.target.closest('.like-btn');
+        if (likeBtn && !likeBtn.disabled) {
+            toggleLike(likeBtn);
+        }
+    });
+    
+    document.addEventListener('DOMContentLoaded', () => {
+        document.querySelectorAll('.card-grid[data-feed-url]').forEach(initInfiniteScroll);
+    });
+})();
@@ -0,0 +1,135 @@
+// Resumable chunked uploads (tus protocol subset, see core/resumable.py).
+// Every chunk is sent with a SHA-256 checksum; after a dropped connection the
+// offset is asked for with HEAD and the upload continues from there. The
+// upload URL is kept in localStorage, so even a reloaded page resumes.
+(function() {
+    const TUS_VERSION = '1.0.0';
+    const MAX_RETRY_DELAY = 30000;
+    
+    function getCookie(name) {
+        const match = document.cookie.split(';').map(c => c.trim()).find(c => c.startsWith(name + '='));
+        return match ? decodeURIComponent(match.substring(name.length + 1)) : null;
+    }
+    
+    function encodeMetadata(metadata) {
+        return Object.entries(metadata)
+            .map(([key, value]) => `${key} ${btoa(unescape(encodeURIComponent(value)))}`)
+            .join(',');
+    }
+    
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+    
+    async function checksum(blob) {
+        if (!window.crypto || !crypto.subtle) {
+            // Only available on HTTPS pages, the server accepts chunks without checksum too
+            return null;
+        }
+        const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return 'sha256 ' + btoa(String.fromCharCode(...new Uint8Array(digest)));
+    }
+    
+    class UploadFailed extends Error {}
+    
+    class ResumableUpload {
+        constructor(file, endpoint, options) {
+            this.file = file;
+            this.endpoint = endpoint;
+            this.chunkSize = (options && options.chunkSize) || 2 * 1024 * 1024;
+            this.onProgress = (options && options.onProgress) || (() => {});
+            this.storageKey = `resumable:${endpoint}:${file.name}:${file.size}:${file.lastModified}`;
+        }
+        
+        request(method, url, headers, body) {
+            return fetch(url, {
+                method: method,
+                headers: Object.assign({'Tus-Resumable': TUS_VERSION, 'X-CSRFToken': getCookie('csrftoken')}, headers),
+                body: body,
+                credentials: 'same-origin',
+            });
+        }
+        
+        async create() {
+            const response = await this.request('POST', this.endpoint, {
+                'Upload-Length': String(this.file.size),
+                'Upload-Metadata': encodeMetadata({filename: this.file.name}),
+            });
+            if (response.status !== 201) {
+                throw new UploadFailed(await response.text());
+            }
+            this.url = response.headers.get('Location');
+            localStorage.setItem(this.storageKey, this.url);
+            return 0;
+        }
+        
+        async currentOffset() {
+            const response = await this.request('HEAD', this.url);
+            if (response.status === 404) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error(`HEAD ${response.status}`);
+            }
+            this.photoId = response.headers.get('Upload-Photo-Id');
+            return parseInt(response.headers.get('Upload-Offset'), 10);
+        }
+        
+        async sendChunk(offset) {
+            const chunk = this.file.slice(offset, offset + this.chunkSize);
+            const headers = {
+                'Content-Type': 'application/offset+octet-stream',
+                'Upload-Offset': String(offset),
+            };
+            const sum = await checksum(chunk);
+            if (sum) {
+                headers['Upload-Checksum'] = sum;
+            }
+            const response = await this.request('PATCH', this.url, headers, chunk);
+            if (response.status === 204) {
+                this.photoId = response.headers.get('Upload-Photo-Id');
+                return parseInt(response.headers.get('Upload-Offset'), 10);
+            }
+            if ([409, 423, 460].includes(response.status) || response.status >= 500) {
+                // Out of sync, busy or damaged on the way: ask for the offset and try again
+                throw new Error(`PATCH ${response.status}`);
+            }
+            throw new UploadFailed(await response.text());
+        }
+        
+        // Resolves with the id of the created photo
+        async start() {
+            this.url = localStorage.getItem(this.storageKey);
+            let offset = this.url ? await this.currentOffset() : null;
+            if (offset === null) {
+                offset = await this.create();
+            }
+            let delay = 1000;
+            while (offset < this.file.size) {
+                try {
+                    offset = await this.sendChunk(offset);
+                    delay = 1000;
+                    this.onProgress(offset, this.file.size);
+                } catch (error) {
+                    if (error instanceof UploadFailed) {
+                        localStorage.removeItem(this.storageKey);
+                        throw error;
+                    }
+                    await sleep(delay);
+                    delay = Math.min(delay * 2, MAX_RETRY_DELAY);
+                    try {
+                        const current = await this.currentOffset();
+                        offset = current === null ? await this.create() : current;
+                    } catch (headError) {
+                        // Still offline, keep waiting
+                    }
+                }
+            }
+            localStorage.removeItem(this.storageKey);
+            return this.photoId;
+        }
+    }
+    
+    window.ResumableUpload = ResumableUpload;
+    window.ResumableUploadFailed = UploadFailed;
+})();